@@ -8,49 +8,47 @@ $$
 LANGUAGE plpgsql;
 
 
+-- Number of rows with each status, spread over up to 16 shards per status so that
+-- concurrent writers don't queue behind one hot row. Readers SUM(n) over the shards.
+CREATE TABLE status_counter_shards (
+    statuses_table TEXT NOT NULL,
+    status_id INT NOT NULL,
+    shard SMALLINT NOT NULL,
+    n BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (statuses_table, status_id, shard)
+);
+
 CREATE OR REPLACE FUNCTION update_status_n()
 RETURNS TRIGGER AS $$
+DECLARE
+    -- A connection always writes to its own shard
+    counter_shard SMALLINT := pg_backend_pid() % 16;
 BEGIN
     -- Handle INSERT operation
     IF (TG_OP = 'INSERT') THEN
-        EXECUTE format(
-            'UPDATE %I AS us
-             SET details = ROW((us.details).key, (us.details).info, (us.details).n + 1)::status_info
-             WHERE id = $1',
-             TG_ARGV[0]
-        ) USING NEW.status;
+        INSERT INTO status_counter_shards AS c (statuses_table, status_id, shard, n)
+        VALUES (TG_ARGV[0], NEW.status, counter_shard, 1)
+        ON CONFLICT (statuses_table, status_id, shard) DO UPDATE SET n = c.n + EXCLUDED.n;
         RETURN NEW;
     END IF;
 
     -- Handle UPDATE operation
     IF (TG_OP = 'UPDATE') THEN
-        -- Decrement the old status if it has changed
+        -- Move one from the old status to the new one, rows locked in status_id order
         IF (OLD.status IS DISTINCT FROM NEW.status) THEN
-            EXECUTE format(
-                'UPDATE %I AS us_old
-                 SET details = ROW((us_old.details).key, (us_old.details).info, (us_old.details).n - 1)::status_info
-                 WHERE id = $1',
-                 TG_ARGV[0]
-            ) USING OLD.status;
-            
-            -- Increment the new status
-            EXECUTE format(
-                'UPDATE %I AS us_new
-                 SET details = ROW((us_new.details).key, (us_new.details).info, (us_new.details).n + 1)::status_info
-                 WHERE id = $1',
-                 TG_ARGV[0]
-            ) USING NEW.status;
+            INSERT INTO status_counter_shards AS c (statuses_table, status_id, shard, n)
+            SELECT TG_ARGV[0], d.status_id, counter_shard, d.delta
+            FROM (VALUES (OLD.status, -1), (NEW.status, 1)) AS d(status_id, delta)
+            ORDER BY d.status_id
+            ON CONFLICT (statuses_table, status_id, shard) DO UPDATE SET n = c.n + EXCLUDED.n;
         END IF;
         RETURN NEW;
     END IF;
     
     IF (TG_OP = 'DELETE') THEN
-        EXECUTE format(
-            'UPDATE %I AS us
-             SET details = ROW((us.details).key, (us.details).info, (us.details).n - 1)::status_info
-             WHERE id = $1',
-             TG_ARGV[0]
-        ) USING OLD.status;
+        INSERT INTO status_counter_shards AS c (statuses_table, status_id, shard, n)
+        VALUES (TG_ARGV[0], OLD.status, counter_shard, -1)
+        ON CONFLICT (statuses_table, status_id, shard) DO UPDATE SET n = c.n + EXCLUDED.n;
         RETURN OLD;
     END IF;
     RETURN NULL;
@@ -60,7 +58,25 @@ $$ LANGUAGE plpgsql;
 
 
 
+-- Tells the API workers which cached entities a write touched, see `ChangeListener`.
+-- The payload is "<entity>:<id>", the id taken from the column TG_ARGV[1] of the row;
+-- postgres folds the repeats of one transaction into a single notification.
+-- The entity tables announce updates and deletes only: a new row can't be cached yet.
+CREATE OR REPLACE FUNCTION notify_entity_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF (TG_OP <> 'INSERT') THEN
+        PERFORM pg_notify('entity_changes', TG_ARGV[0] || ':' || (to_jsonb(OLD) ->> TG_ARGV[1]));
+    END IF;
+    IF (TG_OP <> 'DELETE') THEN
+        PERFORM pg_notify('entity_changes', TG_ARGV[0] || ':' || (to_jsonb(NEW) ->> TG_ARGV[1]));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
 
+-- `n` is no longer maintained, the counts live in status_counter_shards
 CREATE TYPE status_info AS (
     key TEXT,
     info TEXT,
@@ -36,6 +36,19 @@ BEFORE INSERT OR UPDATE ON "research"
 FOR EACH ROW    
 EXECUTE FUNCTION update_status_n('research_statuses');
 
+-- Every new sample bumps `n_samples` (and so `updated_at`): those updates aren't announced,
+-- so other processes may serve a cached `n_samples` up to `INFO_CACHE_TTL` old
+CREATE TRIGGER research_change_notify
+AFTER UPDATE ON "research"
+FOR EACH ROW
+WHEN ((to_jsonb(OLD) - 'n_samples' - 'updated_at') IS DISTINCT FROM (to_jsonb(NEW) - 'n_samples' - 'updated_at'))
+EXECUTE FUNCTION notify_entity_change('research', 'id');
+
+CREATE TRIGGER research_delete_notify
+AFTER DELETE ON "research"
+FOR EACH ROW
+EXECUTE FUNCTION notify_entity_change('research', 'id');
+
 CREATE INDEX ON "research" (name);
 CREATE INDEX ON "research" (status);
 CREATE INDEX ON "research" (created_by);
@@ -27,11 +27,17 @@ BEFORE INSERT OR UPDATE ON "kit"
 FOR EACH ROW
 EXECUTE FUNCTION refresh_last_updated();
 
+-- AFTER, so rows skipped by `ON CONFLICT (unique_hex) DO NOTHING` aren't counted
 CREATE TRIGGER kit_status_trigger
-BEFORE INSERT OR UPDATE ON "kit"
+AFTER INSERT OR UPDATE ON "kit"
 FOR EACH ROW
 EXECUTE FUNCTION update_status_n('kit_statuses');
 
+CREATE TRIGGER kit_change_notify
+AFTER UPDATE OR DELETE ON "kit"
+FOR EACH ROW
+EXECUTE FUNCTION notify_entity_change('kit', 'id');
+
 CREATE INDEX ON "kit" (owner_id);
 CREATE INDEX ON "kit" (unique_hex);
 ANALYZE "kit";
@@ -6,6 +6,12 @@ CREATE TABLE "qr" (
     is_used BOOLEAN NOT NULL DEFAULT false
 );
 
+-- QRs are a part of the kit info, `is_used` isn't: new samples setting it aren't announced
+CREATE TRIGGER qr_change_notify
+AFTER INSERT OR UPDATE OF unique_hex, kit_id OR DELETE ON "qr"
+FOR EACH ROW
+EXECUTE FUNCTION notify_entity_change('kit', 'kit_id');
+
 CREATE INDEX ON "qr" (unique_hex);
 CREATE INDEX ON "qr" (kit_id);
 ANALYZE "qr";
\ No newline at end of file
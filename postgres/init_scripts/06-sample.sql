@@ -26,7 +26,10 @@ CREATE TABLE "sample" (
     gps POINT NOT NULL,
     weather JSON,
     comment TEXT,
-    photo BYTEA -- https://www.postgresql.org/docs/7.4/jdbc-binary-data.html
+    toponym TEXT, -- resolved in the background, see `ToponymEnricher`
+    photo_ref VARCHAR(64), -- sha256 of the photo in the photo store
+    photo_size BIGINT,
+    photo_content_type TEXT
 );
 CREATE TRIGGER autoupdate_sample
 BEFORE INSERT OR UPDATE ON "user"
@@ -38,6 +41,24 @@ BEFORE INSERT OR UPDATE ON "sample"
 FOR EACH ROW
 EXECUTE FUNCTION update_status_n('sample_statuses');
 
-CREATE INDEX ON "sample" (research_id);
+CREATE TRIGGER sample_change_notify
+AFTER UPDATE OR DELETE ON "sample"
+FOR EACH ROW
+EXECUTE FUNCTION notify_entity_change('sample', 'id');
+
+CREATE INDEX ON "sample" (research_id, id);
+CREATE INDEX ON "sample" (owner_id, id);
+CREATE INDEX ON "sample" (created_at);
 CREATE INDEX ON "sample" (qr_id);
+-- What the enrichment sweeps look for, see `SamplesManager.get_unenriched`
+CREATE INDEX ON "sample" (created_at) WHERE weather IS NULL;
+CREATE INDEX ON "sample" (created_at) WHERE toponym IS NULL;
 ANALYZE "sample";
+
+
+-- Reverse geocoding results per geohash cell, shared by all the samples in the cell
+CREATE TABLE "toponym_cache" (
+    geohash VARCHAR(12) PRIMARY KEY,
+    toponym TEXT NOT NULL,
+    resolved_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -11,4 +11,15 @@ CREATE TABLE "user_research_pending" (
     research_id INTEGER NOT NULL,
     PRIMARY KEY (user_id, research_id),
     FOREIGN KEY (user_id) REFERENCES "user"(id),
-    FOREIGN KEY (research_id) REFERENCES "research"(id));
\ No newline at end of file
+    FOREIGN KEY (research_id) REFERENCES "research"(id));
+
+
+CREATE TRIGGER user_research_change_notify
+AFTER INSERT OR UPDATE OR DELETE ON "user_research"
+FOR EACH ROW
+EXECUTE FUNCTION notify_entity_change('research', 'research_id');
+
+CREATE TRIGGER user_research_pending_change_notify
+AFTER INSERT OR UPDATE OR DELETE ON "user_research_pending"
+FOR EACH ROW
+EXECUTE FUNCTION notify_entity_change('research', 'research_id');
@@ -0,0 +1,80 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache bounded both in size and in age.
+
+    An entry expires `ttl` seconds after it was set; when the cache is full
+    the least recently used entry is evicted.
+
+    Every key has a `version` that changes when the key is invalidated: a value read
+    from the db before that may be stale, and `set(..., version=...)` drops it.
+    Versions of the last `maxsize` invalidated keys are kept, older ones fall back
+    to a common floor that only grows, so a forgotten version can't come back.
+    """
+    def __init__(self, maxsize=10_000, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._sequence = itertools.count(1)
+        self._versions = OrderedDict()  # key -> version, of the recently invalidated keys
+        self._version_floor = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self._stats["misses"] += 1
+            return default
+
+    def version(self, key) -> int:
+        """
+        To be read before the value of `key` is, and passed to `set`.
+        """
+        with self._lock:
+            return self._versions.get(key, self._version_floor)
+
+    def set(self, key, value, ttl=None, version=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if version is not None and version != self._versions.get(key, self._version_floor):
+                return
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions[key] = next(self._sequence)
+            self._versions.move_to_end(key)
+            while len(self._versions) > self.maxsize:
+                self._version_floor = max(self._version_floor, self._versions.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+            self._version_floor = next(self._sequence)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._data), maxsize=self.maxsize, ttl=self.ttl)
@@ -1,41 +1,209 @@
 from abc import ABC, abstractmethod
-from multimethod import multimethod
 from DBM.DBConnection import DBConnection
+from DBM.StatusRegistry import StatusRegistry
 from Logger import Logger
+from Cache import TTLCache
 
 from utils import validate_return_from_db
 from exceptions import NoQrCodeException
+from config import INFO_CACHE_SIZE, INFO_CACHE_TTL
+
+
+def identifier_dispatch(by_id, by_name):
+    """
+    `has(identifier, log=False)` made of a method for int ids and one for str names/hexes,
+    the two kinds of identifiers `validate_identifier` leaves in the path parameters.
+    The method is picked by a lookup of the exact type, so the call costs about as much as a direct one.
+    Works for `async def` methods too: the chosen coroutine is returned to be awaited.
+    """
+    by_type = {int: by_id, str: by_name}
+
+    def has(self, identifier, log=False):
+        method = by_type.get(type(identifier))
+        if method is None:
+            if isinstance(identifier, int):
+                method = by_id
+            elif isinstance(identifier, str):
+                method = by_name
+            else:
+                raise TypeError(f"Identifier must be int or str, not {type(identifier).__name__}")
+        return method(self, identifier, log=log)
+
+    has.__doc__ = f"`{by_id.__name__}` for int identifiers, `{by_name.__name__}` for str ones."
+    return has
+
 
 class AbstractDBManager(ABC):
-    def __init__(self, logdata, logfile="logs.log"):
+    def __init__(self, logdata, logfile="logs.log", pool=None, statuses: StatusRegistry = None, info_cache: TTLCache = None):
         self.logdata = logdata
-        self.db = DBConnection(logdata)
+        self.db = DBConnection(logdata, pool=pool)
         self.logfile = logfile
         self.logger = Logger(logfile)
+        self.statuses = statuses if statuses is not None else StatusRegistry()
+        self.info_cache = info_cache if info_cache is not None else TTLCache(INFO_CACHE_SIZE, INFO_CACHE_TTL)
+
+    def _statuses(self) -> StatusRegistry:
+        if not self.statuses.loaded:
+            with self.db as (conn, cursor):
+                cursor.execute(StatusRegistry.LOAD_QUERY)
+                self.statuses.load(cursor.fetchall())
+        return self.statuses
+
+    def _status_filter_id(self, table_prefix: str, status: str | None) -> int | None:
+        """
+        Id to filter `table_prefix` rows by `status` key; 0 (matches nothing) for an unknown key.
+        """
+        return None if status is None else self._statuses().id_of(table_prefix, status) or 0
+    
+    def _cached_info(self, entity: str, entity_id) -> dict | None:
+        """
+        Cached `get_info` of `entity` #`entity_id` (e.g. `"kit"`, 5), a copy the caller may change.
+        Entries are keyed by id, other identifiers (names, hexes) always miss.
+        """
+        if not isinstance(entity_id, int):
+            return None
+        info = self.info_cache.get((entity, entity_id), None)
+        return dict(info) if info is not None else None
+
+    def _info_version(self, entity: str, entity_id: int) -> int:
+        """
+        To be read before the info of `entity` #`entity_id` is, and passed to `_cache_info`.
+        """
+        return self.info_cache.version((entity, entity_id))
+
+    def _cache_info(self, entity: str, entity_id: int, info: dict, version: int) -> dict:
+        """
+        `version` is the `_info_version` from before the `info` was read.
+        """
+        self.info_cache.set((entity, entity_id), info, version=version)
+        return dict(info)
+
+    def _invalidate_info(self, entity: str, *entity_ids):
+        for entity_id in entity_ids:
+            self.info_cache.invalidate((entity, entity_id))
+
+    # Set by the managers: the `_cached_info` entity and, per identifier kind,
+    # the query of `(identifier, id)` rows of the existing ones among `ANY(%s)`
+    _ENTITY = None
+    _HAS_MANY_QUERIES = {}
+    # Whether `_infos_of` keeps the infos `_fetch_infos` reads in `info_cache`
+    _CACHED_INFOS = True
+
+    @staticmethod
+    def _group_identifiers(identifiers) -> dict[type, list]:
+        """
+        Distinct `identifiers` by kind: `{int: [ids], str: [names or hexes]}`.
+        """
+        groups = {}
+        for identifier in identifiers:
+            if isinstance(identifier, int):
+                kind = int
+            elif isinstance(identifier, str):
+                kind = str
+            else:
+                raise TypeError(f"Identifier must be int or str, not {type(identifier).__name__}")
+            groups.setdefault(kind, {})[identifier] = None
+        return {kind: list(values) for kind, values in groups.items()}
+
+    def _missing_of(self, groups: dict, found: dict, log=False) -> set:
+        missing = {identifier for values in groups.values() for identifier in values if identifier not in found}
+        missing and log and self.logger.log(f"Error: Can't find {len(missing)} of {self._ENTITY} identifiers: {sorted(map(str, missing))}")
+        return missing
+
+    def has_many(self, identifiers, log=False) -> tuple[dict, set]:
+        """
+        `has` of a mix of ids and names/hexes, with one `= ANY` query per kind of identifier.
+        Returns `{identifier: id}` of the existing ones and the set of the missing ones.
+        """
+        groups = self._group_identifiers(identifiers)
+        found = {}
+        if groups:
+            with self.db as (conn, cursor):
+                for kind, values in groups.items():
+                    cursor.execute(self._HAS_MANY_QUERIES[kind], (values,))
+                    found.update((row[0], row[1]) for row in cursor.fetchall())
+        return found, self._missing_of(groups, found, log)
+
+    def get_info_many(self, identifiers, log=False) -> tuple[dict, set]:
+        """
+        `get_info` of a mix of ids and names/hexes: `{identifier: info}` and the set of the missing ones.
+        Names/hexes are resolved by `has_many`, the infos missing from `info_cache` are read with one query.
+        """
+        groups = self._group_identifiers(identifiers)
+        ids = {id: id for id in groups.get(int, ())}
+        if str in groups:
+            ids.update(self.has_many(groups[str])[0])
+        infos = self._infos_of(set(ids.values()))
+        found = {identifier: dict(infos[id]) for identifier, id in ids.items() if id in infos}
+        return found, self._missing_of(groups, found, log)
+
+    def _infos_of(self, ids) -> dict:
+        if not self._CACHED_INFOS:
+            return self._fetch_infos(list(ids)) if ids else {}
+        infos, uncached = {}, []
+        for id in ids:
+            info = self._cached_info(self._ENTITY, id)
+            if info is None:
+                uncached.append(id)
+            else:
+                infos[id] = info
+        if uncached:
+            self._statuses()
+            versions = {id: self._info_version(self._ENTITY, id) for id in uncached}
+            for id, info in self._fetch_infos(uncached).items():
+                infos[id] = self._cache_info(self._ENTITY, id, info, versions[id])
+        return infos
+
+    @abstractmethod
+    def _fetch_infos(self, ids: list) -> dict:
+        """
+        `{id: info}` of the existing ones of `ids`, read with one query.
+        """
+        pass
     
+    def _counter_query(self, table_name: str, status_key: str = "all") -> tuple[str, tuple]:
+        """
+        Sums the sharded counters of `table_name` (e.g. `sample_statuses`), of one status or of all of them.
+        """
+        query = f"""
+            SELECT SUM(COALESCE(c.n, 0))::bigint
+            FROM "{table_name}" s
+            LEFT JOIN status_counter_shards c ON c.statuses_table = %s AND c.status_id = s.id
+            {"" if status_key == "all" else "WHERE (s.details).key = %s"}
+        """
+        return query, (table_name,) if status_key == "all" else (table_name, status_key)
+
     def _counter(self, table_name: str, status_key: str = "all"):
         with self.db as (conn, cursor):
-            query = f"""
-                SELECT SUM((details).n)
-                FROM "{table_name}"
-                {"" if status_key == "all" else "WHERE (details).key = %s"}
-            """
-            cursor.execute(query, (status_key,) if status_key != "all" else ())
+            cursor.execute(*self._counter_query(table_name, status_key))
             return cursor.fetchone()[0]
 
     def _is_status_of(self, table_prefix: str, status: str) -> tuple[int, str] | tuple:
         """
         Check if a given status exists for a table with given `table_prefix`.
         """
-        table_name = f"{table_prefix}_statuses"
-        query = f"""
-            SELECT id, (details).info
-            FROM {table_name}
-            WHERE (details).key = %s;"""
+        return self._statuses().get(table_prefix, status)
 
-        with self.db as (conn, cursor):
-            cursor.execute(query, (status,))
-            return cursor.fetchone() or ()
+    def _keyset_clause(self, id_column: str, after=None, limit=None, conditions=()):
+        """
+        WHERE / ORDER BY / LIMIT tail for keyset pagination on `id_column`.
+        `conditions` are `(sql, value)` pairs, the ones with `None` value are skipped.
+        """
+        clauses, params = [], []
+        for sql, value in conditions:
+            if value is not None:
+                clauses.append(sql)
+                params.append(value)
+        if after is not None:
+            clauses.append(f"{id_column} > %s")
+            params.append(after)
+
+        query = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        query += f"ORDER BY {id_column}"
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+        return query, tuple(params)
 
     def _SELECT(self, what:str, table:str, where:str, val):
         with self.db as (conn, cursor):
@@ -48,68 +216,35 @@ class AbstractDBManager(ABC):
         return result[0] if result else None
 
     def _status_getter(self, table:str, id: int):
-        with self.db as (conn, cursor):
-            cursor.execute(f"""
-                SELECT (details).key
-                FROM {table}_statuses
-                WHERE id = (
-                    SELECT status
-                    FROM "{table}"
-                    WHERE id = {id}
-                );
-            """)
-            status_key = cursor.fetchone()
-        return status_key[0] if status_key else ""
+        status_id = self._SELECT("status", table, "id", id)
+        return self._statuses().key_of(table, status_id) if status_id is not None else ""
 
     def _change_status(self, table, identifier, new_status, log=False):
         id = self.has(identifier)
         if not id:
             return self.logger.log(f"Error: Couldn't change status of {table} #{id}: Does not exist.", "") if log else ""
 
-        new_status_id = self.has_status(new_status)
+        new_status_id = self._statuses().id_of(table, new_status)
         if not new_status_id:
             return self.logger.log(f"Error: Couldn't change status of {table} #{id}: Status '{new_status}' is incorrect.", "") if log else ""
 
-        current_status_id = self.has_status(self.status_of(identifier))[0]
-
-        if new_status_id == current_status_id:
-            return new_status
-
         with self.db as (conn, cursor):
             cursor.execute(
                 f"""
                 UPDATE "{table}"
-                SET status = (
-                    SELECT id
-                    FROM "{table}_statuses"
-                    WHERE (details).key = %s
-                )
-                WHERE id = %s
+                SET status = %s
+                WHERE id = %s AND status <> %s
                 """,
-                (new_status, id),
+                (new_status_id, id, new_status_id),
             )
+            changed = cursor.rowcount
             conn.commit()
+        self._invalidate_info(table, id)
 
-        log and self.logger.log(f"Info : Status of {table} #{id} has changed to '{new_status}'")
+        changed and log and self.logger.log(f"Info : Status of {table} #{id} has changed to '{new_status}'",
+                                            entity=table, id=id, action="change_status")
         return new_status
 
-    def _all_getter(self, identifier_name, table_name):
-        alls = {}
-
-        with self.db as (conn, cursor):
-            cursor.execute(f"""
-            SELECT {identifier_name}
-            FROM "{table_name}"
-            """)
-            all_identifiers = cursor.fetchall()
-
-        for row in all_identifiers:
-            obj_id = row[0]
-            obj_info = self.get_info(obj_id)
-            alls[obj_id] = obj_info
-
-        return alls
-    
     @abstractmethod
     def count(self, *args, **kwargs):
         pass
@@ -145,7 +280,6 @@ class AbstractDBManager(ABC):
     def clear_logs(self):
         self.logger.clear_logs()
 
-    @multimethod
     def get_qr_info(self, qr_hex: str) -> dict:
         with self.db as (conn, cursor):
             cursor.execute("""
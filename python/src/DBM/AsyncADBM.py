@@ -0,0 +1,113 @@
+from abc import ABC, abstractmethod
+from DBM.ADBM import AbstractDBManager
+from DBM.AsyncDBConnection import AsyncDBConnection
+from DBM.StatusRegistry import StatusRegistry
+from Logger import Logger
+from Cache import TTLCache
+
+from utils import validate_return_from_db
+from exceptions import NoQrCodeException
+from config import INFO_CACHE_SIZE, INFO_CACHE_TTL
+
+class AsyncAbstractDBManager(ABC):
+    """
+    Async counterpart of `AbstractDBManager`: same SQL and same results,
+    queries are awaited on an `AsyncDBConnection` shared by all the async managers.
+    """
+    def __init__(self, db: AsyncDBConnection, logfile="logs.log", statuses: StatusRegistry = None, info_cache: TTLCache = None):
+        self.db = db
+        self.logfile = logfile
+        self.logger = Logger(logfile)
+        self.statuses = statuses if statuses is not None else StatusRegistry()
+        self.info_cache = info_cache if info_cache is not None else TTLCache(INFO_CACHE_SIZE, INFO_CACHE_TTL)
+
+    async def _statuses(self) -> StatusRegistry:
+        if not self.statuses.loaded:
+            self.statuses.load(await self.db.fetch(StatusRegistry.LOAD_QUERY))
+        return self.statuses
+
+    async def _status_filter_id(self, table_prefix: str, status: str | None) -> int | None:
+        return None if status is None else (await self._statuses()).id_of(table_prefix, status) or 0
+
+    # Pure SQL building and the info cache, shared with the sync managers
+    _keyset_clause = AbstractDBManager._keyset_clause
+    _counter_query = AbstractDBManager._counter_query
+    _cached_info = AbstractDBManager._cached_info
+    _info_version = AbstractDBManager._info_version
+    _cache_info = AbstractDBManager._cache_info
+    _invalidate_info = AbstractDBManager._invalidate_info
+
+    async def _counter(self, table_name: str, status_key: str = "all"):
+        query, params = self._counter_query(table_name, status_key)
+        return await self.db.fetchval(query, *params)
+
+    async def _is_status_of(self, table_prefix: str, status: str) -> tuple[int, str] | tuple:
+        return (await self._statuses()).get(table_prefix, status)
+
+    async def _SELECT(self, what: str, table: str, where: str, val):
+        return await self.db.fetchval(f"""
+            SELECT {what}
+            FROM "{table}"
+            WHERE {where} = %s
+        """, val)
+
+    async def _status_getter(self, table: str, id: int):
+        status_id = await self._SELECT("status", table, "id", id)
+        return (await self._statuses()).key_of(table, status_id) if status_id is not None else ""
+
+    async def _change_status(self, table, identifier, new_status, log=False):
+        id = await self.has(identifier)
+        if not id:
+            return self.logger.log(f"Error: Couldn't change status of {table} #{id}: Does not exist.", "") if log else ""
+
+        new_status_id = (await self._statuses()).id_of(table, new_status)
+        if not new_status_id:
+            return self.logger.log(f"Error: Couldn't change status of {table} #{id}: Status '{new_status}' is incorrect.", "") if log else ""
+
+        changed = await self.db.execute(f"""
+            UPDATE "{table}"
+            SET status = %s
+            WHERE id = %s AND status <> %s
+        """, new_status_id, id, new_status_id)
+        self._invalidate_info(table, id)
+
+        changed != "UPDATE 0" and log and self.logger.log(f"Info : Status of {table} #{id} has changed to '{new_status}'",
+                                                          entity=table, id=id, action="change_status")
+        return new_status
+
+    @abstractmethod
+    async def has(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def has_status(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def status_of(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def get_info(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    async def get_all(self, *args, **kwargs):
+        pass
+
+    async def get_qr_info(self, qr_hex: str) -> dict:
+        row = await self.db.fetchrow("""
+            SELECT id, is_used, kit_id
+            FROM "qr"
+            WHERE unique_hex = %s
+            """, qr_hex)
+        result = {
+                'id': int(row[0]),
+                'is_used': bool(row[1]),
+                'kit_id': int(row[2])
+            } if row else {}
+        return validate_return_from_db({"qr": result},
+                                       "qr_hex",
+                                       qr_hex,
+                                       self.logger,
+                                       NoQrCodeException)
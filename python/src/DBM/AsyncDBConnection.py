@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import asyncpg
+
+from DBM.QueryStats import query_stats
+
+_PERCENT = re.compile(r"%(.?)", re.DOTALL)
+
+
+@lru_cache(maxsize=1024)
+def to_asyncpg_query(query: str) -> str:
+    """
+    psycopg2 `%s` placeholders -> asyncpg `$1, $2, ...`, so the async managers
+    are written with the very same SQL as the sync ones.
+    `%` is read the way psycopg2 reads it, string literals included: `%%` is a literal `%`,
+    any other `%` raises `ValueError`. Like psycopg2, callers leave queries without parameters alone.
+    """
+    counter = itertools.count(1)
+
+    def replace(match):
+        if match[1] == "s":
+            return f"${next(counter)}"
+        if match[1] == "%":
+            return "%"
+        raise ValueError(f"Unsupported placeholder '%{match[1]}' in query, use %s or %%: {query!r}")
+
+    return _PERCENT.sub(replace, query)
+
+
+class AsyncSession:
+    """
+    Queries on one borrowed asyncpg connection.
+    """
+    def __init__(self, connection: asyncpg.Connection):
+        self.connection = connection
+
+    async def _timed(self, method, query, *args):
+        started = time.perf_counter()
+        try:
+            return await method(to_asyncpg_query(query) if args else query, *args)
+        finally:
+            query_stats.record_query("asyncpg", query, time.perf_counter() - started)
+
+    async def execute(self, query, *args):
+        return await self._timed(self.connection.execute, query, *args)
+
+    async def executemany(self, query, args):
+        return await self._timed(self.connection.executemany, query, args)
+
+    async def fetch(self, query, *args) -> list:
+        return await self._timed(self.connection.fetch, query, *args)
+
+    async def fetchrow(self, query, *args):
+        return await self._timed(self.connection.fetchrow, query, *args)
+
+    async def fetchval(self, query, *args):
+        return await self._timed(self.connection.fetchval, query, *args)
+
+    def cursor(self, query, *args, prefetch=None):
+        """
+        Server-side cursor, usable inside of a transaction only.
+        """
+        return self.connection.cursor(to_asyncpg_query(query) if args else query, *args, prefetch=prefetch)
+
+
+class AsyncDBConnection:
+    """
+    asyncpg pool of one process, the async counterpart of `ConnectionPool` + `DBConnection`.
+    The pool is created on the first query, from inside the running event loop.
+    """
+    def __init__(self, logdata, min_size=1, max_size=10, timeout=30.0, max_idle=600.0):
+        self.logdata = logdata
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def pool(self) -> asyncpg.Pool:
+        if self._pool is None:
+            async with self._lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        database=self.logdata["db_name"],
+                        host=self.logdata["db_host"],
+                        user=self.logdata["db_user"],
+                        password=self.logdata["db_pass"],
+                        port=self.logdata["db_port"],
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        max_inactive_connection_lifetime=self.max_idle,
+                    )
+        return self._pool
+
+    @asynccontextmanager
+    async def session(self, transaction=False):
+        pool = await self.pool()
+        async with pool.acquire(timeout=self.timeout) as connection:
+            query_stats.record_connection("asyncpg")
+            if not transaction:
+                yield AsyncSession(connection)
+                return
+            async with connection.transaction():
+                yield AsyncSession(connection)
+
+    async def execute(self, query, *args):
+        async with self.session() as session:
+            return await session.execute(query, *args)
+
+    async def fetch(self, query, *args) -> list:
+        async with self.session() as session:
+            return await session.fetch(query, *args)
+
+    async def fetchrow(self, query, *args):
+        async with self.session() as session:
+            return await session.fetchrow(query, *args)
+
+    async def fetchval(self, query, *args):
+        async with self.session() as session:
+            return await session.fetchval(query, *args)
+
+    def stats(self) -> dict:
+        if self._pool is None:
+            return {"min_size": self.min_size, "max_size": self.max_size, "size": 0, "idle": 0, "in_use": 0}
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        return {"min_size": self.min_size, "max_size": self.max_size, "size": size, "idle": idle, "in_use": size - idle}
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
@@ -0,0 +1,139 @@
+from DBM.AsyncADBM import AsyncAbstractDBManager
+from DBM.ADBM import identifier_dispatch
+from DBM.KitsManager import KitsManager
+import datetime
+import time
+from exceptions import NoKitException
+from utils import validate_return_from_db
+
+
+class AsyncKitsManager(AsyncAbstractDBManager):
+    KIT_HEX_BYTES = KitsManager.KIT_HEX_BYTES
+    QR_HEX_BYTES = KitsManager.QR_HEX_BYTES
+    MAX_INSERT_ATTEMPTS = KitsManager.MAX_INSERT_ATTEMPTS
+    _generate_qr_bytes = KitsManager._generate_qr_bytes
+    _rows_to_retry = KitsManager._rows_to_retry
+    _group_created = staticmethod(KitsManager._group_created)
+    _INFO_QUERY = KitsManager._INFO_QUERY
+    _info_from_row = KitsManager._info_from_row
+    _get_all_query = KitsManager._get_all_query
+
+    async def count(self, status: str = "all"):
+        return await self._counter("kit_statuses", status)
+
+    async def has_status(self, status: str):
+        return await self._is_status_of("kit", status)
+
+    async def has_id(self, kit_id: int, log=False):
+        id = await self._SELECT("id", "kit", "id", kit_id)
+        return validate_return_from_db({"kit": id},
+                                       "kit_id",
+                                       kit_id,
+                                       self.logger if log else None,
+                                       NoKitException)
+
+    async def has_hex(self, unique_hex: str, log=False):
+        id = await self._SELECT("id", "kit", "unique_hex", unique_hex)
+        return validate_return_from_db({"kit": id},
+                                       "unique_hex",
+                                       unique_hex,
+                                       self.logger if log else None,
+                                       NoKitException)
+
+    has = identifier_dispatch(has_id, has_hex)
+
+    async def status_of(self, identifier, log=False):
+        kit_id = await self.has(identifier)
+        return await self._status_getter("kit", kit_id)
+
+    async def get_qrs(self, identifier, log=False):
+        kit_id = await self.has(identifier)
+        rows = await self.db.fetch("""SELECT id, unique_hex FROM "qr" WHERE kit_id = %s""", kit_id)
+        return {qr_id: qr_hex for qr_id, qr_hex in rows}
+
+    async def get_info(self, identifier, log=False):
+        kit_info = self._cached_info("kit", identifier)
+        if kit_info is not None:
+            return kit_info
+        kit_id = await self.has(identifier)
+        await self._statuses()
+        version = self._info_version("kit", kit_id)
+        kit_data = await self.db.fetchrow(self._INFO_QUERY + "WHERE k.id = %s", kit_id)
+        return self._cache_info("kit", kit_id, self._info_from_row(kit_data), version) if kit_data else {}
+
+    async def get_all(self, after: int = None, limit: int = None, status: str = None, owner_id: int = None,
+                      created_from: datetime.datetime = None, created_to: datetime.datetime = None):
+        query, params = self._get_all_query(after, limit, await self._status_filter_id("kit", status), owner_id, created_from, created_to)
+        await self._statuses()
+        rows = await self.db.fetch(query, *params)
+        return {row[0]: self._info_from_row(row) for row in rows}
+
+    async def _insert_unique(self, session, query: str, rows: list[tuple], hex_length: int) -> list[tuple]:
+        inserted = []
+        for _ in range(self.MAX_INSERT_ATTEMPTS):
+            # One array per column, unnested into the rows server-side
+            returned = [tuple(row) for row in await session.fetch(query, *map(list, zip(*rows)))]
+            inserted += returned
+            rows = self._rows_to_retry(rows, returned, hex_length)
+            if not rows:
+                return inserted
+        raise RuntimeError(f"Couldn't find free unique hexes for {len(rows)} rows in {self.MAX_INSERT_ATTEMPTS} attempts")
+
+    async def new(self, n_qrs: int, creator_id: int, log=False):
+        return (await self.new_many(1, n_qrs, creator_id, log=log))[0]['id']
+
+    async def new_many(self, n_kits: int, n_qrs: int, creator_id: int, log=False) -> list[dict]:
+        started_at = time.perf_counter()
+        kit_rows = [(kit_hex, n_qrs, creator_id) for kit_hex in self._generate_qr_bytes(n_kits, self.KIT_HEX_BYTES)]
+        async with self.db.session(transaction=True) as session:
+            kits = await self._insert_unique(session, """
+                INSERT INTO "kit" (unique_hex, n_qrs, creator_id)
+                SELECT * FROM unnest(%s::varchar[], %s::int[], %s::int[])
+                ON CONFLICT (unique_hex) DO NOTHING
+                RETURNING id, unique_hex, n_qrs, creator_id
+            """, kit_rows, self.KIT_HEX_BYTES)
+            kit_ids = [kit[0] for kit in kits for _ in range(n_qrs)]
+            qr_rows = list(zip(self._generate_qr_bytes(len(kit_ids), self.QR_HEX_BYTES), kit_ids))
+            qrs = await self._insert_unique(session, """
+                INSERT INTO "qr" (unique_hex, kit_id)
+                SELECT * FROM unnest(%s::varchar[], %s::int[])
+                ON CONFLICT (unique_hex) DO NOTHING
+                RETURNING id, unique_hex, kit_id
+            """, qr_rows, self.QR_HEX_BYTES) if qr_rows else []
+        log and self.logger.log(f"Info : {n_kits} kits with {n_qrs} QRs each have been created by user #{creator_id}",
+                                entity="kit", action="create", duration=time.perf_counter() - started_at)
+        return self._group_created(kits, qrs)
+
+    async def change_status(self, identifier, new_status, log=False):
+        return await self._change_status("kit", identifier, new_status, log=log)
+
+    async def send_kit(self, kit_id: int, new_owner_id: int, log=False):
+        sent = (await self._statuses()).id_of("kit", "sent")
+        await self.db.execute("""UPDATE "kit" SET owner_id = %s, status = %s WHERE id = %s""", new_owner_id, sent, kit_id)
+        self._invalidate_info("kit", kit_id)
+        log and self.logger.log(f"Info : Owner of Kit #{kit_id} changed to user #{new_owner_id}", kit_id, entity="kit", id=kit_id, action="send")
+        return kit_id
+
+    async def activate(self, kit_id: int, log=False):
+        activated = (await self._statuses()).id_of("kit", "activated")
+        await self.db.execute("""UPDATE "kit" SET status = %s WHERE id = %s""", activated, kit_id)
+        self._invalidate_info("kit", kit_id)
+        log and self.logger.log(f"Info : Kit #{kit_id} activated", kit_id, entity="kit", id=kit_id, action="activate")
+        return kit_id
+
+    async def get_kits_by_user_identifier(self, user_identifier):
+        kits = await self.db.fetch("""
+            SELECT id
+            FROM "kit"
+            WHERE owner_id = %s
+        """, user_identifier)
+        return [{'kit_id': row[0]} for row in kits]
+
+    async def get_created_kits_by_user_identifier(self, user_identifier):
+        kits = await self.db.fetch("""
+            SELECT k.id, k.n_qrs, k.unique_hex, k.created_at, k.owner_id, u.name as owner_name
+            FROM "kit" k
+            LEFT JOIN "user" u ON k.owner_id = u.id
+            WHERE k.creator_id = %s
+        """, user_identifier)
+        return [{'id': kit[0], 'n_qrs': kit[1], 'unique_hex': kit[2], 'created_at': kit[3], 'owner_id': kit[4], 'owner_name': kit[5]} for kit in kits]
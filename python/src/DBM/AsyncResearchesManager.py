@@ -0,0 +1,151 @@
+from DBM.AsyncADBM import AsyncAbstractDBManager
+from DBM.ADBM import identifier_dispatch
+from DBM.ResearchesManager import ResearchesManager
+import datetime
+from exceptions import NoResearchException
+from utils import validate_return_from_db
+
+class AsyncResearchesManager(AsyncAbstractDBManager):
+    _INFO_QUERY = ResearchesManager._INFO_QUERY
+    _info_from_row = ResearchesManager._info_from_row
+    _get_all_query = ResearchesManager._get_all_query
+
+    async def count(self, status: str = "all"):
+        return await self._counter("research_statuses", status)
+
+    async def has_status(self, status: str):
+        return await self._is_status_of("research", status)
+
+    async def has_name(self, research_name: str, log=False):
+        id = await self._SELECT("id", "research", "name", research_name)
+        return validate_return_from_db({"research": id},
+                                       "research_name",
+                                       research_name,
+                                       self.logger if log else None,
+                                       NoResearchException)
+
+    async def has_id(self, research_id: int, log=False):
+        id = await self._SELECT("id", "research", "id", research_id)
+        return validate_return_from_db({"research": id},
+                                       "research_id",
+                                       research_id,
+                                       self.logger if log else None,
+                                       NoResearchException)
+
+    has = identifier_dispatch(has_id, has_name)
+
+    async def status_of(self, identifier, log=False):
+        research_id = await self.has(identifier)
+        return await self._status_getter("research", research_id)
+
+    async def get_info(self, identifier, log=False):
+        research_info = self._cached_info("research", identifier)
+        if research_info is not None:
+            return research_info
+        research_id = await self.has(identifier)
+        await self._statuses()
+        version = self._info_version("research", research_id)
+        research_data = await self.db.fetchrow(self._INFO_QUERY + "WHERE r.id = %s", research_id)
+        return self._cache_info("research", research_id, self._info_from_row(research_data), version) if research_data else {}
+
+    async def get_all(self, after: int = None, limit: int = None, status: str = None, created_by: int = None,
+                      created_from: datetime.datetime = None, created_to: datetime.datetime = None):
+        query, params = self._get_all_query(after, limit, await self._status_filter_id("research", status), created_by, created_from, created_to)
+        await self._statuses()
+        rows = await self.db.fetch(query, *params)
+        return {row[0]: self._info_from_row(row) for row in rows}
+
+    async def new(self, research_name: str, user_id: int, day_start: datetime.date, research_comment: str = None, log=False, approval_required=True):
+        research_id = await self.db.fetchval("""
+            INSERT INTO "research"
+            (name, comment, created_by, day_start, approval_required)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING id
+        """, research_name, research_comment, user_id, day_start, approval_required)
+        log and self.logger.log(f"Info : Created research #{research_id} '{research_name}' starting on {day_start} by user with id '{user_id}'. Approval required: {approval_required}", research_id)
+        return research_id
+
+    async def change_status(self, identifier, new_status, log=False):
+        return await self._change_status("research", identifier, new_status, log)
+
+    async def get_participants_ids(self, research_id, log=False):
+        participants = await self.db.fetch("""
+            SELECT user_id
+            FROM "user_research"
+            WHERE research_id = %s
+        """, research_id)
+        return [row[0] for row in participants]
+
+    async def get_candidates_ids(self, research_id, log=False):
+        candidates = await self.db.fetch("""
+            SELECT user_id
+            FROM "user_research_pending"
+            WHERE research_id = %s
+        """, research_id)
+        return [row[0] for row in candidates]
+
+    async def get_pending_requests(self, research_id, log=False):
+        pending = await self.db.fetch("""
+            SELECT urp.user_id, u.name as username
+            FROM "user_research_pending" urp
+            LEFT JOIN "user" u ON urp.user_id = u.id
+            WHERE research_id = %s
+        """, research_id)
+        return [{'user_id': user_id, 'username': username} for user_id, username in pending]
+
+    async def get_accepted_participants(self, research_id, log=False):
+        accepted = await self.db.fetch("""
+            SELECT ur.user_id, u.name as username
+            FROM "user_research" ur
+            LEFT JOIN "user" u ON ur.user_id = u.id
+            WHERE research_id = %s
+        """, research_id)
+        return [{'user_id': user_id, 'username': username} for user_id, username in accepted]
+
+    async def send_request(self, research_id, user_id, log=False):
+        await self.db.execute("""
+            INSERT INTO "user_research_pending"
+            (research_id, user_id)
+            VALUES (%s, %s)
+        """, research_id, user_id)
+
+    async def approve_request(self, research_id, user_id, log=False):
+        async with self.db.session(transaction=True) as session:
+            await session.execute("""
+                DELETE FROM "user_research_pending"
+                WHERE research_id = %s AND user_id = %s
+            """, research_id, user_id)
+            await session.execute("""
+                INSERT INTO "user_research"
+                (research_id, user_id)
+                VALUES (%s, %s)
+            """, research_id, user_id)
+
+    async def decline_request(self, research_id, user_id, log=False):
+        await self.db.execute("""
+            DELETE FROM "user_research_pending"
+            WHERE research_id = %s AND user_id = %s
+        """, research_id, user_id)
+
+    async def delete_accepted_participant(self, research_id, user_id, log=False):
+        await self.db.execute("""
+            DELETE FROM "user_research"
+            WHERE research_id = %s AND user_id = %s
+        """, research_id, user_id)
+
+    async def get_researches_by_user_identifier(self, user_identifier):
+        researches = await self.db.fetch("""
+            SELECT research_id
+            FROM "user_research"
+            WHERE user_id = %s
+        """, user_identifier)
+        return [{'research_id': row[0]} for row in researches]
+
+    async def get_created_researches_by_user_identifier(self, user_identifier):
+        researches = await self.db.fetch("""
+            SELECT r.id, r.name, (rs.details).key as status
+            FROM "research" r
+            LEFT JOIN "research_statuses" rs ON r.status = rs.id
+            WHERE created_by = %s
+        """, user_identifier)
+        return [{'id': research[0], 'name': research[1], 'status': research[2]} for research in researches]
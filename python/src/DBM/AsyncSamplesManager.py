@@ -0,0 +1,355 @@
+from DBM.AsyncADBM import AsyncAbstractDBManager
+from DBM.ADBM import identifier_dispatch
+from DBM.SamplesManager import SamplesManager
+
+from schemas.samples import GpsModel, CreateSampleRequest
+
+from exceptions import NoSampleException
+import datetime
+import time
+from utils import validate_return_from_db
+
+class AsyncSamplesManager(AsyncAbstractDBManager):
+    # asyncpg decodes POINT into a tuple, psycopg2 leaves it as the "(x,y)" string the routers parse
+    INFO_FIELDS = {**SamplesManager.INFO_FIELDS, 'gps': ("s.gps::text", None)}
+    EXPORT_COLUMNS = SamplesManager.EXPORT_COLUMNS
+    _info_query = SamplesManager._info_query
+    _info_from_row = SamplesManager._info_from_row
+    _get_all_query = SamplesManager._get_all_query
+    _project_info = staticmethod(SamplesManager._project_info)
+
+    async def count(self, status: str = "all"):
+        return await self._counter("sample_statuses", status)
+
+    async def has_status(self, status: str):
+        return await self._is_status_of("sample", status)
+
+    async def has_id(self, sample_id: int, log=False):
+        id = await self._SELECT("id", "sample", "id", sample_id)
+        return validate_return_from_db({"sample": id},
+                                       "sample_id",
+                                       sample_id,
+                                       self.logger if log else None,
+                                       NoSampleException)
+
+    async def has_qr_hex(self, qr_unique_hex: str, log=False):
+        qr_info = await self.get_qr_info(qr_unique_hex)
+        sample_id = await self._SELECT("id", "sample", "qr_id", qr_info["id"])
+        return validate_return_from_db({"sample": sample_id},
+                                       "qr_id",
+                                       qr_info["id"],
+                                       self.logger if log else None,
+                                       NoSampleException)
+
+    has = identifier_dispatch(has_id, has_qr_hex)
+
+    async def status_of(self, sample_id: int, log=False):
+        await self.has_id(sample_id, log=log)
+        return await self._status_getter("sample", sample_id)
+
+    async def get_info(self, sample_id: int, log=False, fields=None):
+        sample_info = self._cached_info("sample", sample_id)
+        if sample_info is not None:
+            return self._project_info(sample_info, fields)
+        query, all_fields = self._info_query(None)
+        await self._statuses()
+        version = self._info_version("sample", sample_id)
+        sample_data = await self.db.fetchrow(query + "WHERE s.id = %s", sample_id)
+        sample_data = validate_return_from_db({"sample": sample_data},
+                                              "sample_id",
+                                              sample_id,
+                                              self.logger if log else None,
+                                              NoSampleException)
+        sample_info = self._cache_info("sample", sample_id, self._info_from_row(sample_data, all_fields), version)
+        return self._project_info(sample_info, fields)
+
+    async def get_all(self, after: int = None, limit: int = None, status: str = None, research_id: int = None,
+                      owner_id: int = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+                      fields=None):
+        query, params, fields = self._get_all_query(after, limit, await self._status_filter_id("sample", status), research_id,
+                                                    owner_id, created_from, created_to, fields)
+        await self._statuses()
+        rows = await self.db.fetch(query, *params)
+        return {info['id']: info for info in (self._info_from_row(row, fields) for row in rows)}
+
+    async def export_research_samples(self, research_id: int, batch_size: int = 2000):
+        """
+        Async generator of the samples of a research, see `SamplesManager.export_research_samples`.
+        """
+        async with self.db.session(transaction=True) as session:
+            cursor = session.cursor("""
+                SELECT s.id, s.research_id, s.qr_id, (ss.details).key, s.owner_id, s.collected_at, s.created_at, s.updated_at,
+                       s.sent_to_lab_at, s.delivered_to_lab_at, s.gps[0], s.gps[1], s.comment, s.weather::text
+                FROM "sample" s
+                JOIN "sample_statuses" ss ON ss.id = s.status
+                WHERE s.research_id = %s
+                ORDER BY s.id
+            """, research_id, prefetch=batch_size)
+            async for row in cursor:
+                yield {
+                    column: value.astimezone().isoformat() if isinstance(value, datetime.datetime) else value
+                    for column, value in zip(self.EXPORT_COLUMNS, row)
+                }
+
+    async def new(self,
+        qr_id: int,
+        research_id: int,
+        owner_id: int,
+        collected_at: datetime.datetime,
+        gps: GpsModel,
+        weather: str | None = None,
+        user_comment: str | None = None,
+        photo_hex_string: str | None = None,
+        log: bool = False
+    ):
+        async with self.db.session(transaction=True) as session:
+            sample_id = await session.fetchval("""
+                INSERT INTO "sample"
+                (research_id, owner_id, qr_id, collected_at, gps, weather, comment)
+                VALUES (%s, %s, %s, %s, POINT(%s, %s), %s, %s)
+                RETURNING id
+            """, research_id, owner_id, qr_id, collected_at, float(gps.latitude), float(gps.longitude), weather, user_comment)
+            log and self.logger.log(f"""Info : For research #{research_id} user #{owner_id} collected a sample #{sample_id} at ({gps.latitude},{gps.longitude}).""")
+
+            await session.execute("""
+                UPDATE "qr"
+                SET is_used = true
+                WHERE id = %s
+            """, qr_id)
+            log and self.logger.log(f"Info : QR #{qr_id} is now 'is_used'")
+
+            new_personal_score = await session.fetchval("""
+                UPDATE "user"
+                SET n_samples_collected = n_samples_collected + 1
+                WHERE id = %s
+                RETURNING n_samples_collected
+            """, owner_id)
+            log and self.logger.log(f"Info : Personal counter of user with id '{owner_id}' is now {new_personal_score}")
+
+            n_samples_in_research = await session.fetchval("""
+                UPDATE "research"
+                SET n_samples = n_samples + 1
+                WHERE id = %s
+                RETURNING n_samples
+            """, research_id)
+            log and self.logger.log(f"Info : Counter of collected samples for research with id '{research_id}' is now {n_samples_in_research}")
+        self._invalidate_info("research", research_id)
+
+        return sample_id
+
+    # Checks of a sample submission, in the order they are reported, and the insert itself.
+    # The QR row is locked, so a concurrent submission of the same QR waits and then sees it used.
+    # $1 qr_hex, $2 research_id, $3 owner_id, $4 collected_at, $5 latitude, $6 longitude, $7 weather, $8 comment
+    _INGEST_QUERY = """
+        WITH r AS (
+            SELECT r.id, (rs.details).key AS status, r.approval_required,
+                   EXISTS (SELECT 1 FROM "user_research" ur WHERE ur.research_id = r.id AND ur.user_id = $3) AS participates
+            FROM "research" r
+            JOIN "research_statuses" rs ON rs.id = r.status
+            WHERE r.id = $2
+        ), q AS (
+            SELECT id, is_used, kit_id
+            FROM "qr"
+            WHERE unique_hex = $1
+            FOR UPDATE
+        ), k AS (
+            SELECT k.id, k.owner_id, (ks.details).key AS status
+            FROM "kit" k
+            JOIN "kit_statuses" ks ON ks.id = k.status
+            WHERE k.id = (SELECT kit_id FROM q)
+        ), verdict AS (
+            SELECT CASE
+                WHEN NOT EXISTS (SELECT 1 FROM r) THEN 'no_research'
+                WHEN (SELECT approval_required AND NOT participates FROM r) THEN 'not_participant'
+                WHEN (SELECT status FROM r) <> 'ongoing' THEN 'research_not_ongoing'
+                WHEN NOT EXISTS (SELECT 1 FROM q) THEN 'no_qr'
+                WHEN (SELECT is_used FROM q) THEN 'qr_used'
+                WHEN (SELECT kit_id FROM q) IS NULL THEN 'qr_without_kit'
+                WHEN NOT EXISTS (SELECT 1 FROM k) THEN 'no_kit'
+                WHEN (SELECT owner_id FROM k) IS NULL THEN 'kit_without_owner'
+                WHEN (SELECT owner_id FROM k) <> $3 THEN 'not_kit_owner'
+                WHEN (SELECT status FROM k) <> 'activated' THEN 'kit_not_activated'
+                ELSE 'ok'
+            END AS verdict
+        ), new_sample AS (
+            INSERT INTO "sample"
+            (research_id, owner_id, qr_id, collected_at, gps, weather, comment)
+            SELECT $2, $3, q.id, $4, POINT($5, $6), $7, $8
+            FROM q, verdict
+            WHERE verdict.verdict = 'ok'
+            RETURNING id
+        ), used_qr AS (
+            UPDATE "qr"
+            SET is_used = true
+            WHERE id = (SELECT id FROM q) AND EXISTS (SELECT 1 FROM new_sample)
+        ), user_counter AS (
+            UPDATE "user"
+            SET n_samples_collected = n_samples_collected + 1
+            WHERE id = $3 AND EXISTS (SELECT 1 FROM new_sample)
+        ), research_counter AS (
+            UPDATE "research"
+            SET n_samples = n_samples + 1
+            WHERE id = $2 AND EXISTS (SELECT 1 FROM new_sample)
+        )
+        SELECT verdict, (SELECT id FROM new_sample), (SELECT id FROM q), (SELECT kit_id FROM q)
+        FROM verdict
+    """
+
+    async def ingest(self,
+        qr_hex: str,
+        research_id: int,
+        owner_id: int,
+        collected_at: datetime.datetime,
+        gps: GpsModel,
+        weather: str | None = None,
+        user_comment: str | None = None,
+        log: bool = False
+    ) -> dict:
+        """
+        Validates and inserts a sample in one round trip.
+        Returns `{'verdict', 'sample_id', 'qr_id', 'kit_id'}`; `sample_id` is None unless `verdict` is `'ok'`.
+        """
+        async with self.db.session(transaction=True) as session:
+            row = await session.fetchrow(self._INGEST_QUERY, qr_hex, research_id, owner_id, collected_at,
+                                         float(gps.latitude), float(gps.longitude), weather, user_comment)
+        verdict, sample_id, qr_id, kit_id = row
+        if sample_id is not None:
+            self._invalidate_info("research", research_id)
+        if log:
+            if sample_id is None:
+                self.logger.log(f"Error: Sample with QR '{qr_hex}' for research #{research_id} by user #{owner_id} rejected: {verdict}")
+            else:
+                self.logger.log(f"Info : For research #{research_id} user #{owner_id} collected a sample #{sample_id} with QR #{qr_id}.")
+        return {'verdict': verdict, 'sample_id': sample_id, 'qr_id': qr_id, 'kit_id': kit_id}
+
+    # The same checks as `_INGEST_QUERY` done set-wise for a batch of one owner: every QR is locked
+    # once, samples are inserted with one multi-row INSERT and every counter is updated once.
+    # A QR repeated within the batch counts as used for all but its first occurrence.
+    # $1 owner_id, then arrays of the items: $2 qr_hex, $3 research_id, $4 collected_at, $5 latitude, $6 longitude, $7 comment
+    _INGEST_MANY_QUERY = """
+        WITH input AS (
+            SELECT *
+            FROM unnest($2::text[], $3::int[], $4::timestamptz[], $5::float8[], $6::float8[], $7::text[])
+                 WITH ORDINALITY AS t(qr_hex, research_id, collected_at, latitude, longitude, comment, n)
+        ), r AS (
+            SELECT r.id, (rs.details).key AS status, r.approval_required,
+                   EXISTS (SELECT 1 FROM "user_research" ur WHERE ur.research_id = r.id AND ur.user_id = $1) AS participates
+            FROM "research" r
+            JOIN "research_statuses" rs ON rs.id = r.status
+            WHERE r.id = ANY($3::int[])
+            -- Locked in id order, so batches bumping the same researches' `n_samples` can't deadlock
+            ORDER BY r.id
+            FOR UPDATE OF r
+        ), q AS (
+            SELECT id, unique_hex, is_used, kit_id
+            FROM "qr"
+            WHERE unique_hex = ANY($2::text[])
+            ORDER BY id
+            FOR UPDATE
+        ), k AS (
+            SELECT k.id, k.owner_id, (ks.details).key AS status
+            FROM "kit" k
+            JOIN "kit_statuses" ks ON ks.id = k.status
+            WHERE k.id IN (SELECT kit_id FROM q)
+        ), checked AS (
+            SELECT i.n, i.research_id, i.collected_at, i.latitude, i.longitude, i.comment, q.id AS qr_id, q.kit_id,
+                CASE
+                    WHEN r.id IS NULL THEN 'no_research'
+                    WHEN r.approval_required AND NOT r.participates THEN 'not_participant'
+                    WHEN r.status <> 'ongoing' THEN 'research_not_ongoing'
+                    WHEN q.id IS NULL THEN 'no_qr'
+                    WHEN q.is_used OR row_number() OVER (PARTITION BY i.qr_hex ORDER BY i.n) > 1 THEN 'qr_used'
+                    WHEN q.kit_id IS NULL THEN 'qr_without_kit'
+                    WHEN k.id IS NULL THEN 'no_kit'
+                    WHEN k.owner_id IS NULL THEN 'kit_without_owner'
+                    WHEN k.owner_id <> $1 THEN 'not_kit_owner'
+                    WHEN k.status <> 'activated' THEN 'kit_not_activated'
+                    ELSE 'ok'
+                END AS verdict
+            FROM input i
+            LEFT JOIN r ON r.id = i.research_id
+            LEFT JOIN q ON q.unique_hex = i.qr_hex
+            LEFT JOIN k ON k.id = q.kit_id
+        ), new_samples AS (
+            INSERT INTO "sample"
+            (research_id, owner_id, qr_id, collected_at, gps, comment)
+            SELECT research_id, $1, qr_id, collected_at, POINT(latitude, longitude), comment
+            FROM checked
+            WHERE verdict = 'ok'
+            ORDER BY n
+            RETURNING id, qr_id, research_id
+        ), used_qrs AS (
+            UPDATE "qr"
+            SET is_used = true
+            FROM new_samples
+            WHERE "qr".id = new_samples.qr_id
+        ), user_counter AS (
+            UPDATE "user"
+            SET n_samples_collected = n_samples_collected + (SELECT count(*) FROM new_samples)
+            WHERE id = $1 AND EXISTS (SELECT 1 FROM new_samples)
+        ), research_counters AS (
+            UPDATE "research"
+            SET n_samples = n_samples + c.n_new
+            FROM (SELECT research_id, count(*) AS n_new FROM new_samples GROUP BY research_id) c
+            WHERE "research".id = c.research_id
+        )
+        SELECT c.verdict, s.id, c.qr_id, c.kit_id
+        FROM checked c
+        LEFT JOIN new_samples s ON s.qr_id = c.qr_id AND c.verdict = 'ok'
+        ORDER BY c.n
+    """
+
+    async def ingest_many(self, owner_id: int, samples: list[CreateSampleRequest], log: bool = False) -> list[dict]:
+        """
+        Validates and inserts a batch of samples of one owner in one round trip.
+        Returns a result like the one of `ingest` for every item, in the order of `samples`.
+        """
+        if not samples:
+            return []
+        started_at = time.perf_counter()
+        columns = zip(*((sample.qr_hex, sample.research_id, sample.collected_at,
+                         float(sample.gps.latitude), float(sample.gps.longitude), sample.user_comment)
+                        for sample in samples))
+        async with self.db.session(transaction=True) as session:
+            rows = await session.fetch(self._INGEST_MANY_QUERY, owner_id, *map(list, columns))
+        results = [{'verdict': verdict, 'sample_id': sample_id, 'qr_id': qr_id, 'kit_id': kit_id}
+                   for verdict, sample_id, qr_id, kit_id in rows]
+        n_inserted = sum(result['sample_id'] is not None for result in results)
+        self._invalidate_info("research", *{sample.research_id for sample, result in zip(samples, results) if result['sample_id'] is not None})
+        log and self.logger.log(f"Info : User #{owner_id} submitted {len(samples)} samples, {n_inserted} of them were collected.",
+                                entity="sample", action="ingest_many", duration=time.perf_counter() - started_at)
+        return results
+
+    async def change_status(self, identifier, new_status: str, log=False):
+        sample_id = await self.has(identifier, log=log)
+        return await self._change_status("sample", sample_id, new_status, log=log)
+
+    async def set_photo(self, identifier, photo_ref: str, photo_size: int, content_type: str | None = None, log=False):
+        sample_id = await self.has(identifier, log=log)
+        await self.db.execute("""
+            UPDATE "sample"
+            SET photo_ref = %s, photo_size = %s, photo_content_type = %s
+            WHERE id = %s
+        """, photo_ref, photo_size, content_type, sample_id)
+        self._invalidate_info("sample", sample_id)
+        log and self.logger.log(f"Info : Sample #{sample_id} got photo {photo_ref} ({photo_size} bytes).", sample_id)
+        return sample_id
+
+    async def get_photo_meta(self, identifier, log=False) -> dict:
+        sample_id = await self.has(identifier, log=log)
+        row = await self.db.fetchrow("""
+            SELECT photo_ref, photo_size, photo_content_type
+            FROM "sample"
+            WHERE id = %s
+        """, sample_id)
+        if not row or not row[0]:
+            return {}
+        return {'photo_ref': row[0], 'photo_size': row[1], 'photo_content_type': row[2]}
+
+    async def get_samples_by_user_identifier(self, user_identifier):
+        samples = await self.db.fetch("""
+            SELECT id
+            FROM "sample"
+            WHERE owner_id = %s
+        """, user_identifier)
+        return [{'sample_id': row[0]} for row in samples]
@@ -0,0 +1,137 @@
+import httpx
+from DBM.AsyncADBM import AsyncAbstractDBManager
+from DBM.ADBM import identifier_dispatch
+from DBM.AsyncDBConnection import AsyncDBConnection
+from DBM.UsersManager import UsersManager
+from exceptions import NoUserException
+from utils import validate_return_from_db
+from Cache import TTLCache, MISSING
+from config import AUTH_BACKEND_TIMEOUT, USER_LOOKUP_FAILURE_TTL
+
+class AsyncUsersManager(AsyncAbstractDBManager):
+    """
+    Shares the auth_backend caches with the sync `users` manager,
+    so invalidations coming from the MQ apply to both.
+    """
+    def __init__(self, db: AsyncDBConnection, users: UsersManager, logfile="logs.log"):
+        super().__init__(db, logfile=logfile)
+        self.auth_backend_url = users.auth_backend_url
+        self.roles = users.roles
+        self.created_at = users.created_at
+        self.existing = users.existing
+        self.existing_names = users.existing_names
+        self._http = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(base_url=self.auth_backend_url, timeout=AUTH_BACKEND_TIMEOUT)
+        return self._http
+
+    async def _auth_get(self, path, **params):
+        response = await self._client().get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def has_status(self, status: str):
+        pass
+
+    async def has_name(self, user_name: str, log=False):
+        id = await self._SELECT("id", "user", "name", user_name)
+        return validate_return_from_db({"user": id},
+                                       "user_name",
+                                       user_name,
+                                       self.logger if log else None,
+                                       NoUserException)
+
+    async def has_id(self, user_id: int, log=False):
+        id = await self._SELECT("id", "user", "id", user_id)
+        return validate_return_from_db({"user": id},
+                                       "user_id",
+                                       user_id,
+                                       self.logger if log else None,
+                                       NoUserException)
+
+    has = identifier_dispatch(has_id, has_name)
+
+    invalidate_cached = UsersManager.invalidate_cached
+    remember = UsersManager.remember
+
+    async def has_cached(self, user_name: str, log=False):
+        user_id = self.existing.get(user_name)
+        if user_id is MISSING:
+            user_id = await self.has_name(user_name, log=log)
+            self.remember(user_id, user_name)
+        return user_id
+
+    async def _fetch_user_field(self, cache: TTLCache, user_id, path: str, key: str):
+        value = cache.get(user_id)
+        if value is MISSING:
+            try:
+                value = (await self._auth_get(path)).get(key)
+                cache.set(user_id, value)
+            except (httpx.HTTPError, ValueError) as e:
+                self.logger.log(f"Error: auth_backend lookup {path} failed: {e!r}")
+                value = None
+                cache.set(user_id, value, ttl=USER_LOOKUP_FAILURE_TTL)
+        return value
+
+    async def _fetch_role(self, user_id):
+        return await self._fetch_user_field(self.roles, user_id, f"/users/{user_id}/role", 'name')
+
+    async def _fetch_created_at(self, user_id):
+        return await self._fetch_user_field(self.created_at, user_id, f"/users/{user_id}/created_at", 'created_at')
+
+    async def _prefetch(self, user_ids):
+        missing = [user_id for user_id in user_ids
+                   if self.roles.get(user_id) is MISSING or self.created_at.get(user_id) is MISSING]
+        if not missing:
+            return
+        try:
+            users = await self._auth_get("/users/bulk", ids=missing)
+        except (httpx.HTTPError, ValueError) as e:
+            self.logger.log(f"Error: Bulk lookup of {len(missing)} users in auth_backend failed: {e!r}")
+            return
+        for user in users:
+            self.roles.set(user['id'], (user.get('role') or {}).get('name'))
+            self.created_at.set(user['id'], user.get('created_at'))
+
+    async def status_of(self, identifier, log=False):
+        user_id = await self.has(identifier, log=log)
+        return await self._fetch_role(user_id)
+
+    _INFO_QUERY = UsersManager._INFO_QUERY
+
+    async def _info_from_row(self, row) -> dict:
+        return {
+            'id': row[0],
+            'name': row[1],
+            'status': await self._fetch_role(row[0]),
+            'created_at': await self._fetch_created_at(row[0]),
+            'updated_at': row[2].astimezone().isoformat(),
+            'n_samples_collected': row[3],
+        }
+
+    async def get_info(self, identifier):
+        user_id = await self.has(identifier)
+        user_data = await self.db.fetchrow(self._INFO_QUERY + "WHERE id = %s", user_id)
+        return await self._info_from_row(user_data) if user_data else {}
+
+    async def get_all(self, after: int = None, limit: int = None):
+        tail, params = self._keyset_clause("id", after, limit)
+        rows = await self.db.fetch(self._INFO_QUERY + tail, *params)
+        await self._prefetch([row[0] for row in rows])
+        return {row[1]: await self._info_from_row(row) for row in rows}
+
+    async def get_user_participated_researches(self, identifier, log=False):
+        user_id = await self.has(identifier)
+        researches = await self.db.fetch("""
+            SELECT research_id
+            FROM "user_research"
+            WHERE user_id = %s
+        """, user_id)
+        return [row[0] for row in researches]
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
@@ -0,0 +1,91 @@
+import asyncio
+
+import asyncpg
+
+from Cache import TTLCache
+from Logger import Logger
+
+CHANNEL = "entity_changes"
+
+
+class ChangeListener:
+    """
+    Keeps a dedicated connection LISTENing to the `entity_changes` notifications
+    (see `notify_entity_change` in the init scripts) and drops the announced
+    `(entity, id)` keys from `cache`, so writes of any process reach the caches of all of them.
+
+    Notifications sent while the connection is down are lost, so the whole cache
+    is cleared every time the listening (re)starts.
+    """
+    def __init__(self, logdata, cache: TTLCache, logger: Logger,
+                 reconnect_delay=1.0, max_reconnect_delay=30.0, health_check_every=30.0):
+        self.logdata = logdata
+        self.cache = cache
+        self.logger = logger
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.health_check_every = health_check_every
+        self._task = None
+        self._stats = {"notifications": 0, "malformed": 0, "connects": 0}
+
+    def _on_notification(self, connection, pid, channel, payload):
+        entity, _, entity_id = payload.partition(":")
+        try:
+            self.cache.invalidate((entity, int(entity_id)))
+        except ValueError:
+            self._stats["malformed"] += 1
+            self.logger.log(f"Error: Malformed {CHANNEL} notification '{payload}'")
+            return
+        self._stats["notifications"] += 1
+
+    async def _listen(self):
+        lost = asyncio.Event()
+        connection = await asyncpg.connect(
+            database=self.logdata["db_name"],
+            host=self.logdata["db_host"],
+            user=self.logdata["db_user"],
+            password=self.logdata["db_pass"],
+            port=self.logdata["db_port"],
+        )
+        try:
+            connection.add_termination_listener(lambda _: lost.set())
+            await connection.add_listener(CHANNEL, self._on_notification)
+            # Whatever changed before we were listening is unknown
+            self.cache.clear()
+            self._stats["connects"] += 1
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), self.health_check_every)
+                except asyncio.TimeoutError:
+                    await connection.fetchval("SELECT 1", timeout=self.health_check_every)
+        finally:
+            if not connection.is_closed():
+                connection.terminate()
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                await self._listen()
+                delay = self.reconnect_delay
+                self.logger.log(f"Error: Lost the {CHANNEL} listener connection, reconnecting")
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                self.logger.log(f"Error: {CHANNEL} listener failed: {e!r}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=f"{CHANNEL}-listener")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return dict(self._stats)
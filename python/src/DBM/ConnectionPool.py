@@ -0,0 +1,188 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections shared by all the managers.
+
+    Connections are opened lazily, so creating a pool never touches the db.
+    Every checked out connection is health-checked, and every returned
+    connection is rolled back to a clean idle state before reuse.
+    """
+    def __init__(self, logdata, min_size=1, max_size=10, timeout=30.0, health_check_after=30.0, max_idle=600.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self.logdata = logdata
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.max_idle = max_idle
+
+        self._idle = []  # [(connection, returned_at)], most recently returned last
+        self._in_use = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_wait_total_s": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "resets": 0,
+        }
+
+    def _connect(self):
+        connection = psycopg2.connect(
+            database=self.logdata["db_name"],
+            host=self.logdata["db_host"],
+            user=self.logdata["db_user"],
+            password=self.logdata["db_pass"],
+            port=self.logdata["db_port"]
+        )
+        self._count("connections_opened")
+        return connection
+
+    def _count(self, key, value=1):
+        with self._cond:
+            self._stats[key] += value
+
+    def _discard(self, connection):
+        self._count("connections_closed")
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    self._in_use.add(connection)
+                    break
+                if len(self._in_use) < self.max_size:
+                    connection, returned_at = None, None
+                    # Reserving a slot so the connect itself can run unlocked
+                    self._in_use.add(reserved := object())
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._count("timeouts")
+                    raise PoolTimeoutError(f"No free db connection within {self.timeout} s (max_size={self.max_size})")
+                self._cond.wait(remaining)
+
+        if connection is None:
+            try:
+                connection = self._connect()
+            finally:
+                with self._cond:
+                    self._in_use.discard(reserved)
+                    if connection is not None:
+                        self._in_use.add(connection)
+                    else:
+                        self._cond.notify()
+        elif not self._is_healthy(connection, returned_at):
+            self._count("health_check_failures")
+            with self._cond:
+                self._in_use.discard(connection)
+            self._discard(connection)
+            return self.getconn()
+
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["checkout_wait_total_s"] += time.monotonic() - started
+        return connection
+
+    def putconn(self, connection):
+        healthy = not connection.closed
+        if healthy and connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Uncommitted work must never leak into the next borrower
+            self._count("resets")
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                healthy = False
+        if healthy and connection.autocommit:
+            connection.autocommit = False
+
+        with self._cond:
+            self._in_use.discard(connection)
+            if healthy and not self._closed:
+                self._idle.append((connection, time.monotonic()))
+                self._prune_idle()
+            else:
+                healthy = False
+            self._cond.notify()
+        if not healthy:
+            self._discard(connection)
+
+    def _prune_idle(self):
+        # Called with the lock held: drop long idle connections above min_size
+        now = time.monotonic()
+        while len(self._idle) + len(self._in_use) > self.min_size and self._idle and now - self._idle[0][1] > self.max_idle:
+            connection, _ = self._idle.pop(0)
+            self._discard(connection)
+
+    def warm(self):
+        """
+        Open connections up to `min_size` ahead of the first requests.
+        """
+        connections = [self.getconn() for _ in range(self.min_size)]
+        for connection in connections:
+            self.putconn(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": len(self._idle) + len(self._in_use),
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+            })
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for connection, _ in idle:
+            self._discard(connection)
@@ -1,25 +1,75 @@
-import psycopg2
+import threading
+import time
+
+import psycopg2.extensions
+
+from DBM.ConnectionPool import ConnectionPool
+from DBM.QueryStats import query_stats
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """
+    Times every statement into `query_stats`.
+    """
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            query_stats.record_query("psycopg2", query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            query_stats.record_query("psycopg2", query, time.perf_counter() - started)
+
+
+# Connections the threads are holding, per pool: `_held.stacks[pool]` is the current thread's stack
+_held = threading.local()
+
 
 # Implementing context manager protocol (with ... as ...:)
+# Connections are borrowed from a `ConnectionPool` and given back on exit.
+# The borrowed pairs are kept on a per-thread stack shared by all the DBConnections
+# of the pool: a block entered inside another one of the same thread gets a new cursor
+# on the connection that thread already holds, instead of holding it while waiting for
+# a second one (which a small pool may never free). The nested block runs in the outer
+# transaction, so its commit commits the outer work too.
 class DBConnection:
-    def __init__(self, logdata):
+    def __init__(self, logdata, pool: ConnectionPool = None):
         self.logdata = logdata
-        self.connection = None
-        self.cursor = None
+        self.pool = pool if pool is not None else ConnectionPool(logdata)
+
+    def _stack(self):
+        stacks = getattr(_held, "stacks", None)
+        if stacks is None:
+            stacks = _held.stacks = {}
+        return stacks.setdefault(self.pool, [])
 
     def __enter__(self):
-        self.connection = psycopg2.connect(
-            database=self.logdata["db_name"],
-            host=self.logdata["db_host"],
-            user=self.logdata["db_user"],
-            password=self.logdata["db_pass"],
-            port=self.logdata["db_port"]
-        )
-        self.cursor = self.connection.cursor()
-        return self.connection, self.cursor
+        stack = self._stack()
+        if stack:
+            connection = stack[-1][0]
+        else:
+            connection = self.pool.getconn()
+            query_stats.record_connection("psycopg2")
+        try:
+            cursor = connection.cursor(cursor_factory=InstrumentedCursor)
+        except Exception:
+            if not stack:
+                self.pool.putconn(connection)
+            raise
+        stack.append((connection, cursor))
+        return connection, cursor
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+        stack = self._stack()
+        connection, cursor = stack.pop()
+        try:
+            if not cursor.closed:
+                cursor.close()
+        finally:
+            if not stack:
+                self.pool.putconn(connection)
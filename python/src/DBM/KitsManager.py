@@ -1,25 +1,63 @@
-from DBM.ADBM import AbstractDBManager
+from DBM.ADBM import AbstractDBManager, identifier_dispatch
 from DBM.UsersManager import UsersManager
 import os
+import datetime
+import time
+from collections import Counter
+from psycopg2.extras import execute_values
 from exceptions import NoKitException
-from multimethod import multimethod
 from utils import validate_return_from_db
 
 
 class KitsManager(AbstractDBManager):
-    def _generate_qr_bytes(self, n: int, l: int = 10):
-        return [os.urandom(l).hex() for _ in range(n)]
+    KIT_HEX_BYTES = 8
+    QR_HEX_BYTES = 10
+    # A random 8-10 byte hex is taken again with a negligible probability, a few retries are plenty
+    MAX_INSERT_ATTEMPTS = 5
+    _ENTITY = "kit"
+    _HAS_MANY_QUERIES = {
+        int: 'SELECT id, id FROM "kit" WHERE id = ANY(%s)',
+        str: 'SELECT unique_hex, id FROM "kit" WHERE unique_hex = ANY(%s)',
+    }
+
+    def _generate_qr_bytes(self, n: int, l: int = QR_HEX_BYTES):
+        # One urandom call for all the codes
+        buffer = os.urandom(n * l).hex()
+        return [buffer[i:i + 2 * l] for i in range(0, 2 * n * l, 2 * l)]
+
+    def _rows_to_retry(self, rows: list[tuple], returned, hex_length: int) -> list[tuple]:
+        """
+        `rows` start with a unique_hex, `returned` are `(id, *row)` of the inserted ones.
+        The rows that were skipped on a unique_hex conflict are given fresh hexes.
+        """
+        missing = list((Counter(rows) - Counter(tuple(row[1:]) for row in returned)).elements())
+        fresh_hexes = self._generate_qr_bytes(len(missing), hex_length)
+        return [(fresh_hex, *row[1:]) for row, fresh_hex in zip(missing, fresh_hexes)]
+
+    def _insert_unique(self, cursor, query: str, rows: list[tuple], hex_length: int) -> list[tuple]:
+        inserted = []
+        for _ in range(self.MAX_INSERT_ATTEMPTS):
+            returned = execute_values(cursor, query, rows, page_size=1000, fetch=True)
+            inserted += returned
+            rows = self._rows_to_retry(rows, returned, hex_length)
+            if not rows:
+                return inserted
+        raise RuntimeError(f"Couldn't find free unique hexes for {len(rows)} rows in {self.MAX_INSERT_ATTEMPTS} attempts")
+
+    @staticmethod
+    def _group_created(kits, qrs) -> list[dict]:
+        created = {kit_id: {'id': kit_id, 'unique_hex': kit_hex, 'qrs': []} for kit_id, kit_hex, *_ in sorted(kits)}
+        for qr_id, qr_hex, kit_id in sorted(qrs):
+            created[kit_id]['qrs'].append({'id': qr_id, 'unique_hex': qr_hex})
+        return list(created.values())
 
-    @multimethod
     def count(self, status: str = "all"):
         return self._counter("kit_statuses", status)
 
-    @multimethod
     def has_status(self, status: str):
         return self._is_status_of("kit", status)
 
-    @multimethod
-    def has(self, kit_id: int, log=False):
+    def has_id(self, kit_id: int, log=False):
         id = self._SELECT("id", "kit", "id", kit_id)
         return validate_return_from_db({"kit": id},
                                        "kit_id",
@@ -27,8 +65,7 @@ class KitsManager(AbstractDBManager):
                                        self.logger if log else None,
                                        NoKitException)
 
-    @multimethod
-    def has(self, unique_hex: str, log=False):
+    def has_hex(self, unique_hex: str, log=False):
         id = self._SELECT("id", "kit", "unique_hex", unique_hex)
         return validate_return_from_db({"kit": id},
                                        "unique_hex",
@@ -36,6 +73,8 @@ class KitsManager(AbstractDBManager):
                                        self.logger if log else None,
                                        NoKitException)
 
+    has = identifier_dispatch(has_id, has_hex)
+
     def status_of(self, identifier, log=False):
         kit_id = self.has(identifier)
         if not id:
@@ -58,69 +97,107 @@ class KitsManager(AbstractDBManager):
 
         return qr_info
 
+    _INFO_QUERY = """
+        SELECT k.id, k.unique_hex, k.created_at, k.updated_at, k.status,
+               k.creator_id, k.owner_id, u.name, q.ids, q.hexes
+        FROM "kit" k
+        LEFT JOIN "user" u ON u.id = k.owner_id
+        LEFT JOIN LATERAL (
+            SELECT array_agg(id ORDER BY id) AS ids, array_agg(unique_hex ORDER BY id) AS hexes
+            FROM "qr"
+            WHERE kit_id = k.id
+        ) q ON true
+    """
+
+    def _info_from_row(self, row) -> dict:
+        return {
+            'id': row[0],
+            'unique_hex': row[1],
+            'created_at': row[2].astimezone().isoformat(),
+            'updated_at': row[3].astimezone().isoformat(),
+            'status': self.statuses.key_of("kit", row[4]),
+            'creator_id': row[5],
+            'owner_id': row[6],
+            'owner': {'id': row[6], 'name': row[7]} if row[7] is not None else None,
+            'qrs': dict(zip(row[8], row[9])) if row[8] else {},
+        }
+
     def get_info(self, identifier, log=False):
+        kit_info_dict = self._cached_info("kit", identifier)
+        if kit_info_dict is not None:
+            return kit_info_dict
         kit_info_dict = {}
         kit_id = self.has(identifier)
         if not kit_id:
             return self.logger.log(f"Error: Kit #{kit_id} does not exist.", kit_info_dict) if log else kit_info_dict
 
+        self._statuses()
+        version = self._info_version("kit", kit_id)
         with self.db as (conn, cursor):
-            cursor.execute("""
-                SELECT unique_hex, created_at, updated_at, status, owner_id, creator_id
-                FROM "kit"
-                WHERE id = %s
-            """, (kit_id,))
+            cursor.execute(self._INFO_QUERY + "WHERE k.id = %s", (kit_id,))
             kit_data = cursor.fetchone()
 
-            if kit_data:
-                kit_info_dict['id'] = kit_id
-                kit_info_dict['unique_hex'] = kit_data[0]
-                kit_info_dict['created_at'] = kit_data[1].astimezone().isoformat()
-                kit_info_dict['updated_at'] = kit_data[2].astimezone().isoformat()
-                kit_info_dict['status'] = self.status_of(kit_id)
-                kit_info_dict['creator_id'] = kit_data[5]
-                kit_info_dict['owner_id'] = kit_data[4]
-                if kit_data[4]:  # Check if user_id is not None
-                    cursor.execute("""
-                        SELECT id, name
-                        FROM "user"
-                        WHERE id = %s
-                    """, (kit_data[4],))
-                    owner_data = cursor.fetchone()
-                    owner_dict = {
-                        'id': owner_data[0],
-                        'name': owner_data[1]
-                    } if owner_data else None
-                    kit_info_dict['owner'] = owner_dict
-                else:
-                    kit_info_dict['owner'] = None
-                kit_info_dict['qrs'] = self.get_qrs(kit_id)
+        if kit_data:
+            kit_info_dict = self._cache_info("kit", kit_id, self._info_from_row(kit_data), version)
         return kit_info_dict
 
+    def _fetch_infos(self, ids: list) -> dict:
+        with self.db as (conn, cursor):
+            cursor.execute(self._INFO_QUERY + "WHERE k.id = ANY(%s)", (ids,))
+            rows = cursor.fetchall()
+        return {row[0]: self._info_from_row(row) for row in rows}
+
     
-    def get_all(self):
-        return self._all_getter("id", "kit")
+    def _get_all_query(self, after, limit, status_id, owner_id, created_from, created_to) -> tuple[str, tuple]:
+        """
+        `get_all` query of both the sync and the async manager.
+        """
+        tail, params = self._keyset_clause("k.id", after, limit, (
+            ("k.status = %s", status_id),
+            ("k.owner_id = %s", owner_id),
+            ("k.created_at >= %s", created_from),
+            ("k.created_at < %s", created_to),
+        ))
+        return self._INFO_QUERY + tail, params
+
+    def get_all(self, after: int = None, limit: int = None, status: str = None, owner_id: int = None,
+                created_from: datetime.datetime = None, created_to: datetime.datetime = None):
+        query, params = self._get_all_query(after, limit, self._status_filter_id("kit", status), owner_id, created_from, created_to)
+        self._statuses()
+        with self.db as (conn, cursor):
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        return {row[0]: self._info_from_row(row) for row in rows}
 
-    @multimethod
     def new(self, n_qrs: int, creator_id: int, log=False):
-        kit_unique_hex = os.urandom(8).hex()
-        qr_unique_hexes = self._generate_qr_bytes(n_qrs)
+        return self.new_many(1, n_qrs, creator_id, log=log)[0]['id']
 
+    def new_many(self, n_kits: int, n_qrs: int, creator_id: int, log=False) -> list[dict]:
+        """
+        Creates `n_kits` kits with `n_qrs` QRs each, in one transaction and a couple of statements.
+        Returns `[{'id', 'unique_hex', 'qrs': [{'id', 'unique_hex'}]}]`.
+        """
+        started_at = time.perf_counter()
+        kit_rows = [(kit_hex, n_qrs, creator_id) for kit_hex in self._generate_qr_bytes(n_kits, self.KIT_HEX_BYTES)]
         with self.db as (conn, cursor):
-            cursor.execute("""
+            kits = self._insert_unique(cursor, """
                 INSERT INTO "kit" (unique_hex, n_qrs, creator_id)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """, (kit_unique_hex, n_qrs, creator_id))
-            kit_id = cursor.fetchone()[0]
-            for qr_unique_code in qr_unique_hexes:
-                cursor.execute("""
-                    INSERT INTO "qr" (unique_hex, kit_id)
-                    VALUES (%s, %s)
-                """, (qr_unique_code, kit_id))
+                VALUES %s
+                ON CONFLICT (unique_hex) DO NOTHING
+                RETURNING id, unique_hex, n_qrs, creator_id
+            """, kit_rows, self.KIT_HEX_BYTES)
+            kit_ids = [kit[0] for kit in kits for _ in range(n_qrs)]
+            qr_rows = list(zip(self._generate_qr_bytes(len(kit_ids), self.QR_HEX_BYTES), kit_ids))
+            qrs = self._insert_unique(cursor, """
+                INSERT INTO "qr" (unique_hex, kit_id)
+                VALUES %s
+                ON CONFLICT (unique_hex) DO NOTHING
+                RETURNING id, unique_hex, kit_id
+            """, qr_rows, self.QR_HEX_BYTES)
             conn.commit()
-        log and self.logger.log(f"Info : Kit #{kit_id} with {n_qrs} QRs has been created", kit_id)
-        return kit_id
+        log and self.logger.log(f"Info : {n_kits} kits with {n_qrs} QRs each have been created by user #{creator_id}",
+                                entity="kit", action="create", duration=time.perf_counter() - started_at)
+        return self._group_created(kits, qrs)
 
     
     def change_status(self, identifier, new_status, log=False):
@@ -128,20 +205,21 @@ class KitsManager(AbstractDBManager):
 
 
     def send_kit(self, kit_id: int, new_owner_id: int, log=False):
+        sent = self._statuses().id_of("kit", "sent")
         with self.db as (conn, cursor):
-            cursor.execute("""UPDATE "kit" SET owner_id = %s WHERE id = %s""", (new_owner_id, kit_id))
-            conn.commit()
-        with self.db as (conn, cursor):
-            cursor.execute("""UPDATE "kit" SET status = 2 WHERE id = %s""", (kit_id,))
+            cursor.execute("""UPDATE "kit" SET owner_id = %s, status = %s WHERE id = %s""", (new_owner_id, sent, kit_id))
             conn.commit()
-        log and self.logger.log(f"Info : Owner of Kit #{kit_id} changed to user #{new_owner_id}", kit_id)
+        self._invalidate_info("kit", kit_id)
+        log and self.logger.log(f"Info : Owner of Kit #{kit_id} changed to user #{new_owner_id}", kit_id, entity="kit", id=kit_id, action="send")
         return kit_id
 
     def activate(self, kit_id: int, log=False):
+        activated = self._statuses().id_of("kit", "activated")
         with self.db as (conn, cursor):
-            cursor.execute("""UPDATE "kit" SET status = 3 WHERE id = %s""", (kit_id,))
+            cursor.execute("""UPDATE "kit" SET status = %s WHERE id = %s""", (activated, kit_id))
             conn.commit()
-        log and self.logger.log(f"Info : Kit #{kit_id} activated", kit_id)
+        self._invalidate_info("kit", kit_id)
+        log and self.logger.log(f"Info : Kit #{kit_id} activated", kit_id, entity="kit", id=kit_id, action="activate")
         return kit_id
     
 
@@ -0,0 +1,109 @@
+import contextvars
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+# Longer statements (e.g. `execute_values` pages) are unique per call and aren't worth caching
+FINGERPRINT_CACHE_MAX_LENGTH = 2048
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PARAMS = re.compile(r"%s|%\(\w+\)s|\$\d+")
+_NUMBERS = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_REPEATS = re.compile(r"(\((?:[^()]|\([^()]*\))*\))(?:\s*,\s*\1)+")
+
+
+def _normalize(query: str) -> str:
+    query = _COMMENTS.sub(" ", query)
+    query = _STRINGS.sub("?", query)
+    query = _PARAMS.sub("?", query)
+    query = _NUMBERS.sub("?", query)
+    query = _SPACES.sub(" ", query)
+    query = _LISTS.sub("(...)", query)
+    return _REPEATS.sub(r"\1, ...", query).strip()
+
+_cached_normalize = lru_cache(maxsize=4096)(_normalize)
+
+
+def fingerprint(query) -> str:
+    """
+    Statement with literals and placeholders replaced by `?`, value lists and rows collapsed,
+    so all the executions of one statement share it whatever their parameters.
+    """
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    query = str(query)
+    return _cached_normalize(query) if len(query) <= FINGERPRINT_CACHE_MAX_LENGTH else _normalize(query)
+
+
+@lru_cache(maxsize=4096)
+def statement_id(fingerprint: str) -> str:
+    """
+    Short stable id of a fingerprint, to refer to it from headers and metric labels.
+    """
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:8]
+
+
+class RequestStats:
+    """
+    Db work done on behalf of one request; collected while it's the `current_request` one.
+    """
+    __slots__ = ("queries", "connections", "sql_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.connections = 0
+        self.sql_seconds = 0.0
+        self.statements = {}  # statement_id -> number of executions
+
+    def header_value(self) -> str:
+        return ", ".join(f"{sid}*{n}" for sid, n in sorted(self.statements.items(), key=lambda item: -item[1]))
+
+
+current_request = contextvars.ContextVar("db_request_stats", default=None)
+
+
+class QueryStats:
+    """
+    Process-wide totals of the executed statements (per fingerprint) and of the borrowed
+    connections (per driver), plus the per-request numbers of the current `RequestStats`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = {}  # (driver, fingerprint) -> [calls, seconds]
+        self.connections = {}  # driver -> acquisitions
+
+    def record_query(self, driver: str, query, seconds: float):
+        key = (driver, fingerprint(query))
+        with self._lock:
+            totals = self.statements.get(key)
+            if totals is None:
+                totals = self.statements[key] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+        request = current_request.get()
+        if request is not None:
+            sid = statement_id(key[1])
+            request.queries += 1
+            request.sql_seconds += seconds
+            request.statements[sid] = request.statements.get(sid, 0) + 1
+
+    def record_connection(self, driver: str):
+        with self._lock:
+            self.connections[driver] = self.connections.get(driver, 0) + 1
+        request = current_request.get()
+        if request is not None:
+            request.connections += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "statements": {key: tuple(totals) for key, totals in self.statements.items()},
+                "connections": dict(self.connections),
+            }
+
+
+query_stats = QueryStats()
@@ -1,20 +1,23 @@
-from DBM.ADBM import AbstractDBManager
+from DBM.ADBM import AbstractDBManager, identifier_dispatch
 from DBM.UsersManager import UsersManager
 import datetime
 from exceptions import NoResearchException
-from multimethod import multimethod
 from utils import validate_return_from_db
 
 class ResearchesManager(AbstractDBManager):
+    _ENTITY = "research"
+    _HAS_MANY_QUERIES = {
+        int: 'SELECT id, id FROM "research" WHERE id = ANY(%s)',
+        str: 'SELECT name, id FROM "research" WHERE name = ANY(%s)',
+    }
+
     def count(self, status:str="all"):
         return self._counter("research_statuses", status)
 
-    @multimethod
     def has_status(self, status: str):
         return self._is_status_of("research", status)
 
-    @multimethod
-    def has(self, research_name: str, log=False):
+    def has_name(self, research_name: str, log=False):
         id = self._SELECT("id", "research", "name", research_name)
         return validate_return_from_db({"research": id},
                                        "research_name",
@@ -22,8 +25,7 @@ class ResearchesManager(AbstractDBManager):
                                        self.logger if log else None,
                                        NoResearchException)
     
-    @multimethod
-    def has(self, research_id: int, log=False):
+    def has_id(self, research_id: int, log=False):
         id = self._SELECT("id", "research", "id", research_id)
         return validate_return_from_db({"research": id},
                                        "research_id",
@@ -31,7 +33,8 @@ class ResearchesManager(AbstractDBManager):
                                        self.logger if log else None,
                                        NoResearchException)
 
-    
+    has = identifier_dispatch(has_id, has_name)
+
     def status_of(self, identifier, log=False):
         id = self.has(identifier)
         if not id:
@@ -39,38 +42,73 @@ class ResearchesManager(AbstractDBManager):
         return self._status_getter("research", id)
 
     
+    _INFO_QUERY = """
+        SELECT r.id, r.name, r.status, r.created_at, r.updated_at, r.created_by,
+               r.day_start, r.day_end, r.n_samples, r.comment, r.approval_required
+        FROM "research" r
+    """
+
+    def _info_from_row(self, row) -> dict:
+        return {
+            'name': row[1],
+            'id': row[0],
+            'status': self.statuses.key_of("research", row[2]),
+            'created_at': row[3].astimezone().isoformat(),
+            'updated_at': row[4].astimezone().isoformat(),
+            'created_by': row[5],
+            'day_start': row[6].strftime("%Y-%m-%d"),
+            'day_end': row[7].strftime("%Y-%m-%d") if row[7] else None,
+            'n_samples': row[8],
+            'comment': row[9],
+            'approval_required': row[10],
+        }
+
     def get_info(self, identifier, log=False):
+        research_info_dict = self._cached_info("research", identifier)
+        if research_info_dict is not None:
+            return research_info_dict
         research_info_dict = {}
         research_id = self.has(identifier)
         if not research_id:
             return self.logger.log(f"Error: Research '{identifier}' does not exist.", research_info_dict) if log else research_info_dict
 
+        self._statuses()
+        version = self._info_version("research", research_id)
         with self.db as (conn, cursor):
-            cursor.execute("""
-                SELECT name, created_at, updated_at, created_by, day_start, day_end, n_samples, comment, approval_required
-                FROM "research"
-                WHERE id = %s
-            """, (research_id,))
+            cursor.execute(self._INFO_QUERY + "WHERE r.id = %s", (research_id,))
             research_data = cursor.fetchone()
 
         if research_data:
-            research_info_dict['name'] = research_data[0]
-            research_info_dict['id'] = research_id
-            research_info_dict['status'] = self.status_of(identifier)
-            research_info_dict['created_at'] = research_data[1].astimezone().isoformat()
-            research_info_dict['updated_at'] = research_data[2].astimezone().isoformat()
-            research_info_dict['created_by'] = research_data[3]
-            research_info_dict['day_start'] = research_data[4].strftime("%Y-%m-%d")
-            research_info_dict['day_end'] = research_data[5].strftime("%Y-%m-%d") if research_data[5] else None
-            research_info_dict['n_samples'] = research_data[6]
-            research_info_dict['comment'] = research_data[7]
-            research_info_dict['approval_required'] = research_data[8]
-
+            research_info_dict = self._cache_info("research", research_id, self._info_from_row(research_data), version)
         return research_info_dict
 
+    def _fetch_infos(self, ids: list) -> dict:
+        with self.db as (conn, cursor):
+            cursor.execute(self._INFO_QUERY + "WHERE r.id = ANY(%s)", (ids,))
+            rows = cursor.fetchall()
+        return {row[0]: self._info_from_row(row) for row in rows}
+
+
+    def _get_all_query(self, after, limit, status_id, created_by, created_from, created_to) -> tuple[str, tuple]:
+        """
+        `get_all` query of both the sync and the async manager.
+        """
+        tail, params = self._keyset_clause("r.id", after, limit, (
+            ("r.status = %s", status_id),
+            ("r.created_by = %s", created_by),
+            ("r.created_at >= %s", created_from),
+            ("r.created_at < %s", created_to),
+        ))
+        return self._INFO_QUERY + tail, params
 
-    def get_all(self):
-        return self._all_getter("id", "research")
+    def get_all(self, after: int = None, limit: int = None, status: str = None, created_by: int = None,
+                created_from: datetime.datetime = None, created_to: datetime.datetime = None):
+        query, params = self._get_all_query(after, limit, self._status_filter_id("research", status), created_by, created_from, created_to)
+        self._statuses()
+        with self.db as (conn, cursor):
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        return {row[0]: self._info_from_row(row) for row in rows}
 
     
     def new(self, research_name: str, user_id: int, day_start: datetime.date, research_comment: str = None, log=False, approval_required=True):
@@ -103,6 +141,7 @@ class ResearchesManager(AbstractDBManager):
                 WHERE id = %s
             """, (comment, research_id))
             conn.commit()
+        self._invalidate_info("research", research_id)
         log and self.logger.log(f"Info : Updated comment for research #{research_id}", research_id)
         return research_id
 
@@ -112,18 +151,18 @@ class ResearchesManager(AbstractDBManager):
         if not research_id:
             return self.logger.log(f"Error: Research '{identifier}' does not exist.", 0) if log else 0
 
-        with self.db as (conn, cursor):
-            day_start = self._SELECT("day_start", "research", "id", research_id)
-
-            if day_end < day_start:
-                return self.logger.log(f"Error: Can't set ending day at {day_end} for research #{research_id} that starts on {day_start}.", 0) if log else 0
+        day_start = self._SELECT("day_start", "research", "id", research_id)
+        if day_end < day_start:
+            return self.logger.log(f"Error: Can't set ending day at {day_end} for research #{research_id} that starts on {day_start}.", 0) if log else 0
 
+        with self.db as (conn, cursor):
             cursor.execute("""
                 UPDATE "research"
                 SET day_end = %s
                 WHERE id = %s
             """, (day_end, research_id))
             conn.commit()
+        self._invalidate_info("research", research_id)
 
         log and self.logger.log(f"Info : Now research #{research_id} ends on {day_end}", research_id)
         return research_id
@@ -1,18 +1,33 @@
-from DBM.ADBM import AbstractDBManager
+from DBM.ADBM import AbstractDBManager, identifier_dispatch
+from DBM.StatusRegistry import StatusRegistry
+from Cache import TTLCache
 from DBM.UsersManager import UsersManager
 from DBM.KitsManager import KitsManager
 from DBM.ResearchesManager import ResearchesManager
 
 from schemas.samples import GpsModel
 
-from utils import get_closest_toponym 
-from multimethod import multimethod, Union
+from typing import Union
 import concurrent.futures
 from exceptions import NoSampleException, NoQrCodeException
 import datetime
+import uuid
+from psycopg2.extras import execute_values
 from utils import validate_return_from_db
+from PhotoStore import PhotoStore, make_photo_store
+from config import PHOTO_STORE_BACKEND, PHOTO_STORE_PATH
 
 class SamplesManager(AbstractDBManager):
+    _ENTITY = "sample"
+    # Samples are named by the hex of their QR code
+    _HAS_MANY_QUERIES = {
+        int: 'SELECT id, id FROM "sample" WHERE id = ANY(%s)',
+        str: 'SELECT q.unique_hex, s.id FROM "sample" s JOIN "qr" q ON q.id = s.qr_id WHERE q.unique_hex = ANY(%s)',
+    }
+
+    def __init__(self, logdata, logfile="logs.log", pool=None, photo_store: PhotoStore = None, statuses: StatusRegistry = None, info_cache: TTLCache = None):
+        super().__init__(logdata, logfile=logfile, pool=pool, statuses=statuses, info_cache=info_cache)
+        self.photo_store = photo_store if photo_store is not None else make_photo_store(PHOTO_STORE_BACKEND, PHOTO_STORE_PATH)
 
     def _update_sample(self, identifier, column_name: str, value: Union[str, bytes], log=False):
         sample_id = self.has(identifier, log=log)
@@ -25,18 +40,17 @@ class SamplesManager(AbstractDBManager):
                 WHERE id = %s
             """, (value, sample_id,))
             conn.commit()
+        self._invalidate_info("sample", sample_id)
         log and self.logger.log(f"Info : Sample #{sample_id} was updated at {column_name}.", sample_id)
         return sample_id
 
     def count(self, status:str="all"):
         return self._counter("sample_statuses", status)
 
-    @multimethod
     def has_status(self, status: str):
         return self._is_status_of("sample", status)
 
-    @multimethod
-    def has(self, sample_id: int, log=False):
+    def has_id(self, sample_id: int, log=False):
         id = self._SELECT("id", "sample", "id", sample_id)
         return validate_return_from_db({"sample": id},
                                        "sample_id",
@@ -44,8 +58,7 @@ class SamplesManager(AbstractDBManager):
                                        self.logger if log else None,
                                        NoSampleException)
 
-    @multimethod
-    def has(self, qr_unique_hex: str, log=False):
+    def has_qr_hex(self, qr_unique_hex: str, log=False):
         qr_info = self.get_qr_info(qr_unique_hex)
         qr_info=validate_return_from_db(
             {"qr_info": qr_info},
@@ -54,7 +67,7 @@ class SamplesManager(AbstractDBManager):
             self.logger if log else None,
             NoQrCodeException
         )
-        qr_id = qr_info["qr_id"]
+        qr_id = qr_info["id"]
         sample_id = self._SELECT("id", "sample", "qr_id", qr_id)
         return validate_return_from_db({"sample": sample_id},
                                        "qr_id",
@@ -63,47 +76,146 @@ class SamplesManager(AbstractDBManager):
                                        NoSampleException
                                        )
 
-    @multimethod
+    has = identifier_dispatch(has_id, has_qr_hex)
+
     def status_of(self, sample_id: int, log=False):
-        if not self.has(sample_id, log=log):
+        if not self.has_id(sample_id, log=log):
             return self.logger.log(f"Error: Sample #{sample_id} does not exist.", "") if log else ""
         return self._status_getter("sample", sample_id)
 
-    @multimethod
-    def get_info(self, sample_id: int, log=False):
-        sample_info_dict = {}
-        sample_id = self.has(sample_id, log=log)
-        if not sample_id:
-            return self.logger.log(f"Error: Sample #{sample_id} does not exist.", sample_info_dict) if log else sample_info_dict
+    @staticmethod
+    def _isoformat(value):
+        return value.astimezone().isoformat() if value else None
+
+    @staticmethod
+    def _flag(value):
+        return True if value else None
+
+    # Projection of sample info: field -> (SQL expression, converter of the fetched value).
+    # Presence of weather and photo is computed by the db, the payloads never leave it.
+    INFO_FIELDS = {
+        'id': ("s.id", None),
+        'research_id': ("s.research_id", None),
+        'qr_id': ("s.qr_id", None),
+        'status': ("s.status", None),
+        'owner_id': ("s.owner_id", None),
+        'collected_at': ("s.collected_at", _isoformat),
+        'created_at': ("s.created_at", _isoformat),
+        'updated_at': ("s.updated_at", _isoformat),
+        'sent_to_lab_at': ("s.sent_to_lab_at", _isoformat),
+        'delivered_to_lab_at': ("s.delivered_to_lab_at", _isoformat),
+        'gps': ("s.gps", None),
+        'weather': ("s.weather IS NOT NULL", _flag),
+        'comment': ("s.comment", None),
+        'toponym': ("s.toponym", None),
+        'photo': ("s.photo_ref IS NOT NULL", _flag),
+    }
+
+    def _info_query(self, fields) -> tuple[str, list]:
+        fields = list(self.INFO_FIELDS) if fields is None else [field for field in self.INFO_FIELDS if field in fields]
+        columns = ", ".join(self.INFO_FIELDS[field][0] for field in fields)
+        query = f"""
+            SELECT {columns}
+            FROM "sample" s
+        """
+        return query, fields
+
+    def _info_from_row(self, row, fields) -> dict:
+        info = {}
+        for field, value in zip(fields, row):
+            converter = self.INFO_FIELDS[field][1]
+            info[field] = converter(value) if converter else value
+        if 'status' in info:
+            info['status'] = self.statuses.key_of("sample", info['status'])
+        return info
 
+    @staticmethod
+    def _project_info(sample_info: dict, fields) -> dict:
+        return sample_info if fields is None else {field: value for field, value in sample_info.items() if field in fields}
+
+    def get_info(self, sample_id: int, log=False, fields=None):
+        """
+        `fields` limits the returned keys to a subset of `INFO_FIELDS`.
+        The whole info is fetched and cached, so other subsets of it are served from the cache.
+        """
+        sample_info = self._cached_info("sample", sample_id)
+        if sample_info is not None:
+            return self._project_info(sample_info, fields)
+
+        query, all_fields = self._info_query(None)
+        self._statuses()
+        version = self._info_version("sample", sample_id)
         with self.db as (conn, cursor):
-            cursor.execute("""
-                SELECT research_id, qr_id, owner_id, collected_at, created_at, updated_at, sent_to_lab_at, delivered_to_lab_at, gps, weather, comment, photo
-                FROM "sample"
-                WHERE id = %s
-            """, (sample_id,))
+            cursor.execute(query + "WHERE s.id = %s", (sample_id,))
             sample_data = cursor.fetchone()
 
-            if sample_data:
-                sample_info_dict['id'] = sample_id 
-                sample_info_dict['research_id'] = sample_data[0]
-                sample_info_dict['qr_id'] = sample_data[1]
-                sample_info_dict['status'] = self.status_of(sample_id)
-                sample_info_dict['owner_id'] = sample_data[2]
-                sample_info_dict['collected_at'] = sample_data[3].astimezone().isoformat()
-                sample_info_dict['created_at'] = sample_data[4].astimezone().isoformat()
-                sample_info_dict['updated_at'] = sample_data[5].astimezone().isoformat() 
-                sample_info_dict['sent_to_lab_at'] = sample_data[6].astimezone().isoformat() if sample_data[6] else None
-                sample_info_dict['delivered_to_lab_at'] = sample_data[7].astimezone().isoformat() if sample_data[7] else None
-                sample_info_dict['gps'] = sample_data[8] #",".join(sample_data[8][1:-1].split(", "))
-                sample_info_dict['weather'] = True if sample_data[9] else None
-                sample_info_dict['comment'] = sample_data[10]
-                sample_info_dict['photo'] = True if sample_data[11] else None
-        return sample_info_dict
+        sample_data = validate_return_from_db({"sample": sample_data},
+                                              "sample_id",
+                                              sample_id,
+                                              self.logger if log else None,
+                                              NoSampleException)
+        sample_info = self._cache_info("sample", sample_id, self._info_from_row(sample_data, all_fields), version)
+        return self._project_info(sample_info, fields)
+
+    def _fetch_infos(self, ids: list) -> dict:
+        query, all_fields = self._info_query(None)
+        with self.db as (conn, cursor):
+            cursor.execute(query + "WHERE s.id = ANY(%s)", (ids,))
+            rows = cursor.fetchall()
+        return {row[0]: self._info_from_row(row, all_fields) for row in rows}
 
     
-    def get_all(self):
-        return self._all_getter("id", "sample")
+    def _get_all_query(self, after, limit, status_id, research_id, owner_id, created_from, created_to, fields) -> tuple[str, tuple, list]:
+        """
+        `get_all` query of both the sync and the async manager, and the fields of its rows.
+        """
+        # `id` is the pagination key and the key of the result, so it is always fetched
+        query, fields = self._info_query(None if fields is None else {'id', *fields})
+        tail, params = self._keyset_clause("s.id", after, limit, (
+            ("s.status = %s", status_id),
+            ("s.research_id = %s", research_id),
+            ("s.owner_id = %s", owner_id),
+            ("s.created_at >= %s", created_from),
+            ("s.created_at < %s", created_to),
+        ))
+        return query + tail, params, fields
+
+    def get_all(self, after: int = None, limit: int = None, status: str = None, research_id: int = None,
+                owner_id: int = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+                fields=None):
+        query, params, fields = self._get_all_query(after, limit, self._status_filter_id("sample", status), research_id,
+                                                    owner_id, created_from, created_to, fields)
+        self._statuses()
+        with self.db as (conn, cursor):
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        return {info['id']: info for info in (self._info_from_row(row, fields) for row in rows)}
+
+    EXPORT_COLUMNS = ("id", "research_id", "qr_id", "status", "owner_id", "collected_at", "created_at", "updated_at",
+                      "sent_to_lab_at", "delivered_to_lab_at", "latitude", "longitude", "comment", "weather")
+
+    def export_research_samples(self, research_id: int, batch_size: int = 2000):
+        """
+        Yields samples of a research one by one as dicts with `EXPORT_COLUMNS` keys.
+        Rows are pulled in batches of `batch_size` through a server-side cursor,
+        so memory use does not depend on the number of samples.
+        """
+        with self.db.pool.connection() as conn:
+            with conn.cursor(name=f"export_research_{research_id}_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute("""
+                    SELECT s.id, s.research_id, s.qr_id, (ss.details).key, s.owner_id, s.collected_at, s.created_at, s.updated_at,
+                           s.sent_to_lab_at, s.delivered_to_lab_at, s.gps[0], s.gps[1], s.comment, s.weather::text
+                    FROM "sample" s
+                    JOIN "sample_statuses" ss ON ss.id = s.status
+                    WHERE s.research_id = %s
+                    ORDER BY s.id
+                """, (research_id,))
+                for row in cursor:
+                    yield {
+                        column: value.astimezone().isoformat() if isinstance(value, datetime.datetime) else value
+                        for column, value in zip(self.EXPORT_COLUMNS, row)
+                    }
 
     def new(self,
         qr_id: int,
@@ -117,8 +229,6 @@ class SamplesManager(AbstractDBManager):
         log: bool = False
     ):
         gps_string = f"{gps.latitude},{gps.longitude}"
-        
-        closest_toponym = ', '.join(get_closest_toponym(gps.latitude, gps.longitude).split(",")[:-4])
 
         with self.db as (conn, cursor):
             cursor.execute("""
@@ -130,7 +240,7 @@ class SamplesManager(AbstractDBManager):
             )
             sample_id = cursor.fetchone()[0]
 
-            log and self.logger.log(f"""Info : For research #{research_id} user #{owner_id} collected a sample #{sample_id} near "{closest_toponym}".""")
+            log and self.logger.log(f"""Info : For research #{research_id} user #{owner_id} collected a sample #{sample_id} at ({gps_string}).""")
 
             # Updating the QR code status
             cursor.execute("""
@@ -163,52 +273,164 @@ class SamplesManager(AbstractDBManager):
             log and self.logger.log(f"Info : Counter of collected samples for research with id '{research_id}' is now {n_samples_in_research}")
 
             conn.commit()
+        self._invalidate_info("research", research_id)
 
         return sample_id
     
-    @multimethod
     def change_status(self, identifier, new_status: str, log=False):
         sample_id = self.has(identifier, log=log)
         if not sample_id:
             return self.logger.log(f"Error: No sample #{sample_id}", 0) if log else 0
         return self._change_status("sample", sample_id, new_status, log=log)
         
-    @multimethod
     def push_weather(self, identifier, weather: str, log=False):
         sample_id = self.has(identifier, log=log)
         if not sample_id:
             return self.logger.log(f"Error: No sample #{sample_id}", 0) if log else 0
         return self._update_sample(sample_id, column_name="weather", value=weather, log=log)
 
-    @multimethod
+    def get_locations(self, sample_ids) -> list[tuple]:
+        """
+        `(id, collected_at, latitude, longitude)` of the given samples.
+        """
+        with self.db as (conn, cursor):
+            cursor.execute("""
+                SELECT id, collected_at, gps[0], gps[1]
+                FROM "sample"
+                WHERE id = ANY(%s)
+            """, (list(sample_ids),))
+            return cursor.fetchall()
+
+    def get_unenriched(self, column: str, older_than: float, newer_than: float, limit: int) -> list[int]:
+        """
+        Ids of samples still without `column` ("weather" or "toponym"), created between
+        `newer_than` and `older_than` seconds ago. Concurrent sweeps of the workers are
+        serialized by an advisory lock: the ones that don't get it find nothing.
+        """
+        if column not in ("weather", "toponym"):
+            raise ValueError(f"Samples aren't enriched with '{column}'")
+        with self.db as (conn, cursor):
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (f"sample_{column}_sweep",))
+            if not cursor.fetchone()[0]:
+                return []
+            cursor.execute(f"""
+                SELECT id
+                FROM "sample"
+                WHERE {column} IS NULL
+                  AND created_at > now() - make_interval(secs => %s)
+                  AND created_at < now() - make_interval(secs => %s)
+                ORDER BY created_at
+                LIMIT %s
+            """, (newer_than, older_than, limit))
+            sample_ids = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+        return sample_ids
+
+    def push_weather_many(self, weather_by_sample: dict[int, str], log=False):
+        """
+        Writes weather JSON of many samples with a single UPDATE.
+        """
+        with self.db as (conn, cursor):
+            execute_values(cursor, """
+                UPDATE "sample" AS s
+                SET weather = v.weather::json
+                FROM (VALUES %s) AS v(id, weather)
+                WHERE s.id = v.id
+            """, list(weather_by_sample.items()))
+            conn.commit()
+        self._invalidate_info("sample", *weather_by_sample)
+        log and self.logger.log(f"Info : Weather of {len(weather_by_sample)} samples was updated.")
+        return len(weather_by_sample)
+
+    def push_toponym_many(self, toponym_by_sample: dict[int, str], log=False):
+        with self.db as (conn, cursor):
+            execute_values(cursor, """
+                UPDATE "sample" AS s
+                SET toponym = v.toponym
+                FROM (VALUES %s) AS v(id, toponym)
+                WHERE s.id = v.id
+            """, list(toponym_by_sample.items()))
+            conn.commit()
+        self._invalidate_info("sample", *toponym_by_sample)
+        log and self.logger.log(f"Info : Toponyms of {len(toponym_by_sample)} samples were updated.")
+        return len(toponym_by_sample)
+
+    def get_cached_toponyms(self, geohashes) -> dict[str, str]:
+        with self.db as (conn, cursor):
+            cursor.execute("""
+                SELECT geohash, toponym
+                FROM "toponym_cache"
+                WHERE geohash = ANY(%s)
+            """, (list(geohashes),))
+            return dict(cursor.fetchall())
+
+    def cache_toponyms(self, toponym_by_geohash: dict[str, str]):
+        with self.db as (conn, cursor):
+            execute_values(cursor, """
+                INSERT INTO "toponym_cache" (geohash, toponym)
+                VALUES %s
+                ON CONFLICT (geohash) DO NOTHING
+            """, list(toponym_by_geohash.items()))
+            conn.commit()
+
     def push_comment(self, identifier, comment: str, log=False):
         sample_id = self.has(identifier, log=log)
         if not sample_id:
             return self.logger.log(f"Error: No sample #{sample_id}", 0) if log else 0
         return self._update_sample(sample_id, column_name="comment", value=comment, log=log)
     
-    @multimethod
-    def push_photo(self, identifier, photo_bytes: bytes, log=False):
+    def set_photo(self, identifier, photo_ref: str, photo_size: int, content_type: str | None = None, log=False):
+        """
+        Points the sample to a photo that is already in `photo_store`.
+        """
         sample_id = self.has(identifier, log=log)
         if not sample_id:
             return self.logger.log(f"Error: No sample #{sample_id}", 0) if log else 0
-        return self._update_sample(sample_id, column_name="photo", value=photo_bytes, log=log)
+        with self.db as (conn, cursor):
+            cursor.execute("""
+                UPDATE "sample"
+                SET photo_ref = %s, photo_size = %s, photo_content_type = %s
+                WHERE id = %s
+            """, (photo_ref, photo_size, content_type, sample_id))
+            conn.commit()
+        self._invalidate_info("sample", sample_id)
+        log and self.logger.log(f"Info : Sample #{sample_id} got photo {photo_ref} ({photo_size} bytes).", sample_id)
+        return sample_id
 
-    @multimethod
-    def push_photo(self, identifier, photo_hex: str, log=False):
+    def push_photo(self, identifier, photo: bytes | str, log=False):
+        """
+        `photo` is the image itself or its hex.
+        """
+        if isinstance(photo, str):
+            photo = bytes.fromhex(photo)
         sample_id = self.has(identifier, log=log)
         if not sample_id:
             return self.logger.log(f"Error: No sample #{sample_id}", 0) if log else 0
-        photo_bytes = bytes.fromhex(photo_hex)
-        return self._update_sample(sample_id, column_name="photo", value=photo_bytes, log=log)
+        photo_ref, photo_size = self.photo_store.put([photo])
+        return self.set_photo(sample_id, photo_ref, photo_size, log=log)
+
+    def get_photo_meta(self, identifier, log=False) -> dict:
+        """
+        Returns `{'photo_ref', 'photo_size', 'photo_content_type'}` of the sample's photo or `{}`.
+        """
+        sample_id = self.has(identifier, log=log)
+        with self.db as (conn, cursor):
+            cursor.execute("""
+                SELECT photo_ref, photo_size, photo_content_type
+                FROM "sample"
+                WHERE id = %s
+            """, (sample_id,))
+            row = cursor.fetchone()
+        if not row or not row[0]:
+            return {}
+        return {'photo_ref': row[0], 'photo_size': row[1], 'photo_content_type': row[2]}
 
-    @multimethod
     def get_photo(self, identifier, log=False):
         sample_id = self.has(identifier, log=log)
         if not sample_id:
             return self.logger.log(f"Error: Sample #{sample_id} does not exist.", "") if log else ""
-        photo = self._SELECT("photo", "sample", "id", sample_id)
-        return photo if photo else b''
+        photo_meta = self.get_photo_meta(sample_id)
+        return b''.join(self.photo_store.read(photo_meta['photo_ref'])) if photo_meta else b''
 
     def get_weather(self, identifier, log=False):
         sample_id = self.has(identifier, log=log)
@@ -0,0 +1,40 @@
+class StatusRegistry:
+    """
+    In-process copy of the `*_statuses` tables: a handful of rows each, never changed at runtime.
+    Loaded once and shared by all the managers, sync and async.
+    """
+    TABLE_PREFIXES = ("kit", "research", "sample")
+
+    LOAD_QUERY = " UNION ALL ".join(
+        f"SELECT '{prefix}', id, (details).key, (details).info FROM {prefix}_statuses"
+        for prefix in TABLE_PREFIXES
+    )
+
+    def __init__(self):
+        self.by_key = {}  # table_prefix -> {key: (id, info)}
+        self.by_id = {}   # table_prefix -> {id: key}
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.by_key)
+
+    def load(self, rows):
+        """
+        `rows` are `(table_prefix, id, key, info)`, as returned by `LOAD_QUERY`.
+        """
+        by_key, by_id = {prefix: {} for prefix in self.TABLE_PREFIXES}, {prefix: {} for prefix in self.TABLE_PREFIXES}
+        for prefix, status_id, key, info in rows:
+            by_key[prefix][key] = (status_id, info)
+            by_id[prefix][status_id] = key
+        self.by_id = by_id
+        self.by_key = by_key
+
+    def get(self, table_prefix: str, key: str) -> tuple[int, str] | tuple:
+        return self.by_key[table_prefix].get(key, ())
+
+    def id_of(self, table_prefix: str, key: str) -> int | None:
+        status = self.by_key[table_prefix].get(key)
+        return status[0] if status else None
+
+    def key_of(self, table_prefix: str, status_id: int) -> str:
+        return self.by_id[table_prefix].get(status_id, "")
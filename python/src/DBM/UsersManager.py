@@ -1,25 +1,42 @@
 import requests
-from DBM.ADBM import AbstractDBManager
+from DBM.ADBM import AbstractDBManager, identifier_dispatch
 import hashlib
+from psycopg2.extras import execute_values
 import os
-from multimethod import multimethod
 from exceptions import NoUserException
 from utils import validate_return_from_db
+from Cache import TTLCache, MISSING
+from config import AUTH_BACKEND_URL, AUTH_BACKEND_TIMEOUT, USER_CACHE_SIZE, USER_ROLE_CACHE_TTL, USER_CREATED_AT_CACHE_TTL, USER_EXISTS_CACHE_TTL, USER_LOOKUP_FAILURE_TTL
 
 class UsersManager(AbstractDBManager):
-    @multimethod
+    _ENTITY = "user"
+    _HAS_MANY_QUERIES = {
+        int: 'SELECT id, id FROM "user" WHERE id = ANY(%s)',
+        str: 'SELECT name, id FROM "user" WHERE name = ANY(%s)',
+    }
+
+    def __init__(self, logdata, logfile="logs.log", pool=None, auth_backend_url=AUTH_BACKEND_URL):
+        super().__init__(logdata, logfile=logfile, pool=pool)
+        self.auth_backend_url = auth_backend_url
+        self.http = requests.Session()
+        # Roles may change, so they expire fast; created_at never changes
+        self.roles = TTLCache(USER_CACHE_SIZE, USER_ROLE_CACHE_TTL)
+        self.created_at = TTLCache(USER_CACHE_SIZE, USER_CREATED_AT_CACHE_TTL)
+        # user_name -> user_id of the users known to exist in the db, and user_id -> user_name
+        # of the same entries, for `invalidate_cached` to find them
+        self.existing = TTLCache(USER_CACHE_SIZE, USER_EXISTS_CACHE_TTL)
+        self.existing_names = TTLCache(USER_CACHE_SIZE, USER_EXISTS_CACHE_TTL)
+
     def count(self, status: str = "all"):
         # TODO:
         # get count of statuses from other services
         pass
 
-    @multimethod
     def change_status(self, identifier, new_status, log=False):
         # TODO:
         # change status using other services
         pass
 
-    @multimethod
     def has_status(self, status: str):
         # TODO:
         # Check status using other services
@@ -27,8 +44,7 @@ class UsersManager(AbstractDBManager):
         # return self._is_status_of("user", status)
         pass
 
-    @multimethod
-    def has(self, user_name: str, log=False):
+    def has_name(self, user_name: str, log=False):
         id = self._SELECT("id", "user", "name", user_name)
         return validate_return_from_db({"user": id},
                                        "user_name",
@@ -36,16 +52,87 @@ class UsersManager(AbstractDBManager):
                                        self.logger if log else None,
                                        NoUserException)
     
-    @multimethod
-    def has(self, user_id: int, log=False):
+    def has_id(self, user_id: int, log=False):
         id = self._SELECT("id", "user", "id", user_id)
         return validate_return_from_db({"user": id},
                                        "user_id",
                                        user_id,
                                        self.logger if log else None,
                                        NoUserException)
+
+    has = identifier_dispatch(has_id, has_name)
     
 
+    def _auth_get(self, path, **params):
+        response = self.http.get(f"{self.auth_backend_url}{path}", params=params, timeout=AUTH_BACKEND_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _fetch_user_field(self, cache: TTLCache, user_id, path: str, key: str):
+        """
+        `key` of the auth_backend answer at `path`, cached in `cache`. If auth_backend doesn't
+        know the user (404) or fails, it's `None`, cached for `USER_LOOKUP_FAILURE_TTL` only.
+        """
+        value = cache.get(user_id)
+        if value is MISSING:
+            try:
+                value = self._auth_get(path).get(key)
+                cache.set(user_id, value)
+            except (requests.RequestException, ValueError) as e:
+                self.logger.log(f"Error: auth_backend lookup {path} failed: {e!r}")
+                value = None
+                cache.set(user_id, value, ttl=USER_LOOKUP_FAILURE_TTL)
+        return value
+
+    def _fetch_role(self, user_id):
+        return self._fetch_user_field(self.roles, user_id, f"/users/{user_id}/role", 'name')
+
+    def _fetch_created_at(self, user_id):
+        return self._fetch_user_field(self.created_at, user_id, f"/users/{user_id}/created_at", 'created_at')
+
+    def _prefetch(self, user_ids):
+        """
+        Fills the caches for all the `user_ids` with one bulk request to auth_backend.
+        If the bulk lookup fails, the users are fetched one by one on demand.
+        """
+        missing = [user_id for user_id in user_ids
+                   if self.roles.get(user_id) is MISSING or self.created_at.get(user_id) is MISSING]
+        if not missing:
+            return
+        try:
+            users = self._auth_get("/users/bulk", ids=missing)
+        except (requests.RequestException, ValueError) as e:
+            self.logger.log(f"Error: Bulk lookup of {len(missing)} users in auth_backend failed: {e!r}")
+            return
+        for user in users:
+            self.roles.set(user['id'], (user.get('role') or {}).get('name'))
+            self.created_at.set(user['id'], user.get('created_at'))
+
+    def invalidate_cached(self, user_id):
+        self.roles.invalidate(user_id)
+        self.created_at.invalidate(user_id)
+        user_name = self.existing_names.get(user_id, None)
+        if user_name is not None:
+            self.existing.invalidate(user_name)
+        self.existing_names.invalidate(user_id)
+
+    def remember(self, user_id, user_name):
+        self.existing.set(user_name, user_id)
+        self.existing_names.set(user_id, user_name)
+
+    def has_cached(self, user_name: str, log=False):
+        """
+        `has(user_name)` that only asks the db about names it hasn't seen yet.
+        """
+        user_id = self.existing.get(user_name)
+        if user_id is MISSING:
+            user_id = self.has_name(user_name, log=log)
+            self.remember(user_id, user_name)
+        return user_id
+
+    def cache_stats(self) -> dict:
+        return {"roles": self.roles.stats(), "created_at": self.created_at.stats(), "existing": self.existing.stats()}
+
     def status_of(self, identifier, log=False):
         # TODO:
         # Check status using other services
@@ -53,12 +140,7 @@ class UsersManager(AbstractDBManager):
         user_id = self.has(identifier, log=log)
         if not user_id:
             raise UserNotFoundException
-        # make request to http://auth_backend:8000/users/{user_id}/role and get name from response
-        request_url = f"http://auth_backend:8000/users/{user_id}/role"
-        response = requests.get(request_url)
-        user_status = response.json()
-        status_name = user_status.get('name')
-        return status_name
+        return self._fetch_role(user_id)
     
     def _get_created_at(self, identifier):
         # TODO:
@@ -67,38 +149,54 @@ class UsersManager(AbstractDBManager):
         user_id = self.has(identifier)
         if not user_id:
             raise UserNotFoundException
+        return self._fetch_created_at(user_id)
+
+    _INFO_QUERY = """
+        SELECT id, name, updated_at, n_samples_collected
+        FROM "user"
+    """
+
+    def _info_from_row(self, row) -> dict:
+        return {
+            'id': row[0],
+            'name': row[1],
+            'status': self._fetch_role(row[0]),
+            'created_at': self._fetch_created_at(row[0]),
+            'updated_at': row[2].astimezone().isoformat(),
+            'n_samples_collected': row[3],
+        }
 
-        # make request to http://auth_backend:8000/users/{user_id}/status and get name from response
-        request_url = f"http://auth_backend:8000/users/{user_id}/created_at"
-        response = requests.get(request_url)
-        created_at = response.json().get('created_at')
-        return created_at
     def get_info(self, identifier):
         # TODO:
         user_info_dict = {}
 
         user_id = self.has(identifier)
         with self.db as (conn, cursor):
-            cursor.execute("""
-                SELECT name, updated_at, n_samples_collected
-                FROM "user"
-                WHERE id = %s
-            """, (user_id,))
+            cursor.execute(self._INFO_QUERY + "WHERE id = %s", (user_id,))
             user_data = cursor.fetchone()
 
         if user_data:
-            user_info_dict['id'] = user_id
-            user_info_dict['name'] = user_data[0]
-            user_info_dict['status'] = self.status_of(identifier)
-            user_info_dict['created_at'] = self._get_created_at(identifier)
-            user_info_dict['updated_at'] = user_data[1].astimezone().isoformat()
-            user_info_dict['n_samples_collected'] = user_data[2]
+            user_info_dict = self._info_from_row(user_data)
         return user_info_dict
 
-    def get_all(self):
-        return self._all_getter("name", "user")
+    # Users' infos aren't cached, their roles come from auth_backend in one bulk request
+    _CACHED_INFOS = False
+
+    def _fetch_infos(self, ids: list) -> dict:
+        with self.db as (conn, cursor):
+            cursor.execute(self._INFO_QUERY + "WHERE id = ANY(%s)", (ids,))
+            rows = cursor.fetchall()
+        self._prefetch([row[0] for row in rows])
+        return {row[0]: self._info_from_row(row) for row in rows}
+
+    def get_all(self, after: int = None, limit: int = None):
+        tail, params = self._keyset_clause("id", after, limit)
+        with self.db as (conn, cursor):
+            cursor.execute(self._INFO_QUERY + tail, params)
+            rows = cursor.fetchall()
+        self._prefetch([row[0] for row in rows])
+        return {row[1]: self._info_from_row(row) for row in rows}
 
-    @multimethod
     def new(self, id, user_name: str, log=False):
     # TODO: fetching created users from auth_service
         with self.db as (conn, cursor):
@@ -111,6 +209,23 @@ class UsersManager(AbstractDBManager):
             conn.commit()
             log and self.logger.log(f"Info : User #{id} '{user_name}' has been added to the system", id)
         return id
+
+    def new_many(self, users: list[tuple[int, str]], log=False) -> list[int]:
+        """
+        Inserts `(id, user_name)` pairs with one statement, skipping the users that already exist.
+        Returns the ids of the inserted ones.
+        """
+        with self.db as (conn, cursor):
+            inserted = execute_values(cursor, """
+                INSERT INTO "user" (id, name)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                RETURNING id
+            """, users, page_size=len(users) or 1, fetch=True)
+            conn.commit()
+        inserted = [row[0] for row in inserted]
+        log and self.logger.log(f"Info : {len(inserted)} of {len(users)} users have been added to the system")
+        return inserted
     
     def get_user_participated_researches(self, identifier, log=False):
         user_id = self.has(identifier)
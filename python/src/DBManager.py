@@ -2,8 +2,20 @@ from DBM.UsersManager import UsersManager
 from DBM.KitsManager import KitsManager
 from DBM.ResearchesManager import ResearchesManager
 from DBM.SamplesManager import SamplesManager
+from DBM.ConnectionPool import ConnectionPool
+from DBM.StatusRegistry import StatusRegistry
+from DBM.AsyncDBConnection import AsyncDBConnection
+from DBM.AsyncUsersManager import AsyncUsersManager
+from DBM.AsyncKitsManager import AsyncKitsManager
+from DBM.AsyncResearchesManager import AsyncResearchesManager
+from DBM.AsyncSamplesManager import AsyncSamplesManager
+from DBM.ChangeListener import ChangeListener
 from Logger import Logger
+from Cache import TTLCache
 from Weather import Weather
+from PhotoStore import make_photo_store
+from Enrichment import WeatherEnricher, ToponymEnricher
+from Geocoding import make_geocoder
 
 import random
 import string
@@ -12,6 +24,14 @@ from threading import Thread
 
 from pathlib import Path
 
+from config import DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_CHECK_AFTER
+from config import ASYNC_DB_POOL_MIN_SIZE, ASYNC_DB_POOL_MAX_SIZE
+from config import INFO_CACHE_SIZE, INFO_CACHE_TTL
+from config import PHOTO_STORE_BACKEND, PHOTO_STORE_PATH
+from config import WEATHER_WORKERS, WEATHER_BATCH_SIZE, WEATHER_BATCH_WAIT, WEATHER_GRID_DEGREES, WEATHER_WINDOW_DAYS
+from config import GEOCODER_BACKEND, TOPONYM_GEOHASH_PRECISION
+from config import ENRICHMENT_MAX_RETRIES, ENRICHMENT_RETRY_DELAY, ENRICHMENT_SWEEP_INTERVAL, ENRICHMENT_SWEEP_GRACE, ENRICHMENT_SWEEP_MAX_AGE, ENRICHMENT_SWEEP_LIMIT
+
 def in_docker():
     cgroup = Path('/proc/self/cgroup')
     return Path('/.dockerenv').is_file() or cgroup.is_file() and 'docker' in cgroup.read_text()
@@ -30,18 +50,74 @@ LOGDATA = {
 
 
 class DBManager:
-    def __init__(self, logdata, logfile="logs.log"):
+    def __init__(self, logdata, logfile="logs.log", pool_min_size=DB_POOL_MIN_SIZE, pool_max_size=DB_POOL_MAX_SIZE):
         self.logger = Logger(logfile)
-        self.users = UsersManager(logdata, logfile=logfile)
-        self.kits = KitsManager(logdata, logfile=logfile)
-        self.researches = ResearchesManager(logdata, logfile=logfile)
-        self.samples = SamplesManager(logdata, logfile=logfile)
+        self.pool = ConnectionPool(logdata,
+                                   min_size=pool_min_size,
+                                   max_size=pool_max_size,
+                                   timeout=DB_POOL_TIMEOUT,
+                                   health_check_after=DB_POOL_HEALTH_CHECK_AFTER)
+        # Loaded from the db on first use, shared with the `AsyncDBManager` built on this one
+        self.statuses = StatusRegistry()
+        # Research, kit and sample info by id, invalidated by the writes of both managers
+        self.info_cache = TTLCache(INFO_CACHE_SIZE, INFO_CACHE_TTL)
+        self.users = UsersManager(logdata, logfile=logfile, pool=self.pool)
+        self.kits = KitsManager(logdata, logfile=logfile, pool=self.pool, statuses=self.statuses, info_cache=self.info_cache)
+        self.researches = ResearchesManager(logdata, logfile=logfile, pool=self.pool, statuses=self.statuses, info_cache=self.info_cache)
+        self.photos = make_photo_store(PHOTO_STORE_BACKEND, PHOTO_STORE_PATH)
+        self.samples = SamplesManager(logdata, logfile=logfile, pool=self.pool, photo_store=self.photos, statuses=self.statuses, info_cache=self.info_cache)
         self.weather = Weather(past_days=3)
+        enrichment = dict(max_retries=ENRICHMENT_MAX_RETRIES,
+                          retry_delay=ENRICHMENT_RETRY_DELAY,
+                          sweep_interval=ENRICHMENT_SWEEP_INTERVAL,
+                          sweep_grace=ENRICHMENT_SWEEP_GRACE,
+                          sweep_max_age=ENRICHMENT_SWEEP_MAX_AGE,
+                          sweep_limit=ENRICHMENT_SWEEP_LIMIT)
+        self.weather_enricher = WeatherEnricher(self.samples, self.weather, self.logger,
+                                                grid_degrees=WEATHER_GRID_DEGREES,
+                                                window_days=WEATHER_WINDOW_DAYS,
+                                                n_workers=WEATHER_WORKERS,
+                                                batch_size=WEATHER_BATCH_SIZE,
+                                                batch_wait=WEATHER_BATCH_WAIT,
+                                                **enrichment)
+        self.toponym_enricher = ToponymEnricher(self.samples, make_geocoder(GEOCODER_BACKEND), self.logger,
+                                                geohash_precision=TOPONYM_GEOHASH_PRECISION,
+                                                n_workers=1,
+                                                **enrichment)
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
+
+    def close(self):
+        self.weather_enricher.stop()
+        self.toponym_enricher.stop()
+        self.pool.close()
+
+    def enqueue_weather_request(self, sample_id):
+        """
+        Weather of the sample will be fetched in the background, see `WeatherEnricher`.
+        """
+        self.weather_enricher.submit(sample_id)
+
+    def start_enrichment_sweeps(self):
+        """
+        Periodically queues again the samples whose weather or toponym is still missing:
+        the ones queued by a previous run of the process and the ones the enrichers gave up on.
+        """
+        self.weather_enricher.start_sweeping()
+        self.toponym_enricher.start_sweeping()
+
+    def enqueue_sample_enrichment(self, sample_id):
+        """
+        Queues everything a new sample is completed with in the background: weather and toponym.
+        """
+        self.weather_enricher.submit(sample_id)
+        self.toponym_enricher.submit(sample_id)
 
     def complete_weather_request(self, sample_id, log=False):
         if not self.samples.has(sample_id):
             return self.logger.log(f"Sample #{sample_id} not found") if log else None
-        sample_info = self.samples.get_info(sample_id)
+        sample_info = self.samples.get_info(sample_id, fields={'collected_at', 'gps'})
         collected_at = datetime.datetime.fromisoformat(sample_info['collected_at'])
         latitude, longitude = map(float, sample_info['gps'].strip("()").split(","))
         weather = self.weather.weather_request((latitude, longitude), collected_at)
@@ -106,3 +182,41 @@ class DBManager:
 
         log and self.logger.log(f"Info : Test example generated: user #{user_id}, research #{research_id}, kit #{kit_id}, sample #{sample_id}")
         return body
+
+
+class AsyncDBManager:
+    """
+    Async managers for the FastAPI routers, on their own asyncpg pool.
+    Background work (enrichment, photo files, MQ) stays on the sync `DBManager` it is given.
+    """
+    def __init__(self, logdata, dbm: DBManager, logfile="logs.log", pool_min_size=ASYNC_DB_POOL_MIN_SIZE, pool_max_size=ASYNC_DB_POOL_MAX_SIZE):
+        self.logger = Logger(logfile)
+        self.db = AsyncDBConnection(logdata,
+                                    min_size=pool_min_size,
+                                    max_size=pool_max_size,
+                                    timeout=DB_POOL_TIMEOUT)
+        self.users = AsyncUsersManager(self.db, dbm.users, logfile=logfile)
+        self.statuses = dbm.statuses
+        self.info_cache = dbm.info_cache
+        self.kits = AsyncKitsManager(self.db, logfile=logfile, statuses=self.statuses, info_cache=self.info_cache)
+        self.researches = AsyncResearchesManager(self.db, logfile=logfile, statuses=self.statuses, info_cache=self.info_cache)
+        self.samples = AsyncSamplesManager(self.db, logfile=logfile, statuses=self.statuses, info_cache=self.info_cache)
+        # Writes of the other processes reach `info_cache` through it, see `start_listening`
+        self.changes = ChangeListener(logdata, self.info_cache, self.logger)
+
+    def pool_stats(self) -> dict:
+        return self.db.stats()
+
+    async def load_statuses(self):
+        self.statuses.load(await self.db.fetch(StatusRegistry.LOAD_QUERY))
+
+    def start_listening(self):
+        """
+        Starts evicting `info_cache` entries on the db change notifications; needs a running loop.
+        """
+        self.changes.start()
+
+    async def close(self):
+        await self.changes.stop()
+        await self.users.close()
+        await self.db.close()
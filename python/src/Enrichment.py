@@ -0,0 +1,284 @@
+import datetime
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from Geocoding import Geocoder, geohash_encode, geohash_center
+from Logger import Logger
+from Weather import Weather
+
+
+class BatchWorker(ABC):
+    """
+    Pool of background threads fed through a queue.
+
+    Each thread takes whatever was submitted (up to `batch_size` items,
+    waiting at most `batch_wait` seconds for more) and hands it to
+    `process_batch` at once, so the expensive part runs once per batch
+    instead of once per item. Threads are started on the first `submit`.
+
+    Items `process_batch` reports as failed are submitted again after
+    `retry_delay` seconds (doubled on every attempt), up to `max_retries` times.
+    The queue is in memory only: what's lost with it (restarts, crashes) or
+    given up on is found again by `sweep`, run every `sweep_interval` seconds
+    once `start_sweeping` is called.
+    """
+    _STOP = object()
+
+    def __init__(self, logger: Logger, n_workers=2, batch_size=100, batch_wait=1.0, name="worker",
+                 max_retries=3, retry_delay=30.0, sweep_interval=600.0):
+        self.logger = logger
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.name = name
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.sweep_interval = sweep_interval
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._attempts = {}  # item -> retries so far
+        self._stopped = threading.Event()
+        self._sweeper = None
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.n_workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Lets the workers finish what is already queued, then stops them.
+        """
+        self._stopped.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(self._STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, item):
+        self.start()
+        self._queue.put(item)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _retry(self, items: list):
+        due = defaultdict(list)
+        with self._lock:
+            for item in items:
+                attempt = self._attempts.get(item, 0)
+                if attempt < self.max_retries:
+                    self._attempts[item] = attempt + 1
+                    due[attempt].append(item)
+                else:
+                    self._attempts.pop(item, None)
+        for attempt, retried in due.items():
+            timer = threading.Timer(self.retry_delay * 2 ** attempt, self._resubmit, (retried,))
+            timer.daemon = True
+            timer.start()
+        given_up = len(items) - sum(map(len, due.values()))
+        given_up and self.logger.log(f"Error: {self.name} gave up on {given_up} items after {self.max_retries} retries, left to the sweep")
+
+    def _resubmit(self, items: list):
+        if not self._stopped.is_set():
+            for item in items:
+                self.submit(item)
+
+    def find_unfinished(self) -> list:
+        """
+        Items that should have been processed but weren't, see `sweep`.
+        """
+        return []
+
+    def sweep(self) -> int:
+        """
+        Submits again whatever `find_unfinished` finds, returns how many items that was.
+        """
+        items = self.find_unfinished()
+        for item in items:
+            self.submit(item)
+        items and self.logger.log(f"Info : {self.name} sweep queued {len(items)} unfinished items")
+        return len(items)
+
+    def start_sweeping(self, first_delay=10.0):
+        """
+        Sweeps after `first_delay` seconds (picking up what the previous run of the process left),
+        then every `sweep_interval` seconds.
+        """
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, args=(first_delay,), name=f"{self.name}-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self, delay):
+        while not self._stopped.wait(delay):
+            try:
+                self.sweep()
+            except Exception as e:
+                self.logger.log(f"Error: {self.name} sweep failed: {e!r}")
+            delay = self.sweep_interval
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while batch[-1] is not self._STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            stop = batch[-1] is self._STOP
+            items = [item for item in batch if item is not self._STOP]
+            if items:
+                try:
+                    failed = self.process_batch(items) or []
+                except Exception as e:
+                    failed = items
+                    self.logger.log(f"Error: {self.name} failed on a batch of {len(items)}: {e!r}")
+                if failed:
+                    self._retry(failed)
+                if self._attempts:
+                    with self._lock:
+                        for item in set(items).difference(failed):
+                            self._attempts.pop(item, None)
+            if stop:
+                return
+
+    @abstractmethod
+    def process_batch(self, items: list) -> list | None:
+        """
+        Returns the items that failed and should be retried.
+        """
+        pass
+
+
+class WeatherEnricher(BatchWorker):
+    """
+    Fills in weather of the submitted sample ids.
+
+    Samples of a batch are grouped by a location cell of `grid_degrees` and
+    a window of `window_days` days of collection; every group costs one
+    request to the weather API and the results are written back in bulk.
+    """
+    def __init__(self, samples_manager, weather: Weather, logger: Logger,
+                 grid_degrees=0.1, window_days=7, sweep_grace=300.0, sweep_max_age=30 * 24 * 60 * 60, sweep_limit=1000, **kwargs):
+        super().__init__(logger, name="weather", **kwargs)
+        self.samples = samples_manager
+        self.weather = weather
+        self.grid_degrees = grid_degrees
+        self.window_days = window_days
+        self.sweep_grace = sweep_grace
+        self.sweep_max_age = sweep_max_age
+        self.sweep_limit = sweep_limit
+
+    def find_unfinished(self) -> list[int]:
+        return self.samples.get_unenriched("weather", self.sweep_grace, self.sweep_max_age, self.sweep_limit)
+
+    def _group_key(self, collected_at: datetime.datetime, latitude: float, longitude: float):
+        cell = (round(latitude / self.grid_degrees), round(longitude / self.grid_degrees))
+        window = collected_at.date().toordinal() // self.window_days
+        return cell, window
+
+    def process_batch(self, sample_ids: list[int]) -> list[int]:
+        groups = defaultdict(list)
+        for sample_id, collected_at, latitude, longitude in self.samples.get_locations(set(sample_ids)):
+            groups[self._group_key(collected_at, latitude, longitude)].append((sample_id, collected_at))
+
+        weather_by_sample, failed = {}, []
+        for ((lat_cell, lon_cell), _), group in groups.items():
+            location = (lat_cell * self.grid_degrees, lon_cell * self.grid_degrees)
+            start_date = min(self.weather.window_of(collected_at)[0] for _, collected_at in group)
+            end_date = max(self.weather.window_of(collected_at)[1] for _, collected_at in group)
+            try:
+                hourly_dataframe = self.weather.hourly_frame(location, start_date, end_date)
+            except Exception as e:
+                hourly_dataframe = None
+                self.logger.log(f"Error: Weather request for {location} failed: {e!r}")
+            if hourly_dataframe is None:
+                self.logger.log(f"Couldn't fetch the weather data for samples {[sample_id for sample_id, _ in group]}")
+                failed += [sample_id for sample_id, _ in group]
+                continue
+            for sample_id, collected_at in group:
+                weather_by_sample[sample_id] = self.weather.slice_window(hourly_dataframe, collected_at)
+
+        if weather_by_sample:
+            self.samples.push_weather_many(weather_by_sample)
+            self.logger.log(f"Info : Weather of {len(weather_by_sample)} samples fetched with {len(groups)} requests")
+        return failed
+
+
+class ToponymEnricher(BatchWorker):
+    """
+    Resolves the closest toponym of the submitted sample ids and stores it on the sample.
+
+    Toponyms are cached per geohash cell of `geohash_precision` characters:
+    in memory and in the `toponym_cache` table, so the geocoder is asked
+    once per cell ever, not once per sample.
+    """
+    def __init__(self, samples_manager, geocoder: Geocoder, logger: Logger, geohash_precision=6, max_cached_cells=100_000,
+                 sweep_grace=300.0, sweep_max_age=30 * 24 * 60 * 60, sweep_limit=1000, **kwargs):
+        super().__init__(logger, name="toponym", **kwargs)
+        self.samples = samples_manager
+        self.geocoder = geocoder
+        self.geohash_precision = geohash_precision
+        self.max_cached_cells = max_cached_cells
+        self.sweep_grace = sweep_grace
+        self.sweep_max_age = sweep_max_age
+        self.sweep_limit = sweep_limit
+        self._cache = {}
+
+    def find_unfinished(self) -> list[int]:
+        return self.samples.get_unenriched("toponym", self.sweep_grace, self.sweep_max_age, self.sweep_limit)
+
+    def _remember(self, toponyms: dict[str, str]):
+        self._cache.update(toponyms)
+        while len(self._cache) > self.max_cached_cells:
+            del self._cache[next(iter(self._cache))]
+
+    def process_batch(self, sample_ids: list[int]) -> list[int]:
+        cells = defaultdict(list)
+        for sample_id, _, latitude, longitude in self.samples.get_locations(set(sample_ids)):
+            cells[geohash_encode(latitude, longitude, self.geohash_precision)].append(sample_id)
+
+        missing = [cell for cell in cells if cell not in self._cache]
+        if missing:
+            self._remember(self.samples.get_cached_toponyms(missing))
+
+        resolved = {}
+        for cell in cells:
+            if cell in self._cache:
+                continue
+            toponym = self.geocoder.reverse(*geohash_center(cell))
+            if toponym is not None:
+                resolved[cell] = toponym
+        if resolved:
+            self.samples.cache_toponyms(resolved)
+            self._remember(resolved)
+
+        toponym_by_sample = {
+            sample_id: self._cache.get(cell) or resolved[cell]
+            for cell, ids in cells.items() if cell in self._cache or cell in resolved
+            for sample_id in ids
+        }
+        if toponym_by_sample:
+            self.samples.push_toponym_many(toponym_by_sample)
+            self.logger.log(f"Info : Toponyms of {len(toponym_by_sample)} samples resolved with {len(resolved)} geocoder requests")
+        return [sample_id for cell, ids in cells.items() if cell not in self._cache and cell not in resolved for sample_id in ids]
@@ -3,8 +3,22 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import JWT_PUBLIC_KEY
+import hashlib
+import time
+
+from config import JWT_PUBLIC_KEY, JWT_CACHE_SIZE, JWT_CACHE_MAX_TTL
+from Cache import TTLCache, MISSING
+
+# sha256(token) -> payload of the tokens that passed verification
+verified_tokens = TTLCache(JWT_CACHE_SIZE, JWT_CACHE_MAX_TTL)
 
 def verify_jwt_token(token):
-    payload = jwt.decode(token, JWT_PUBLIC_KEY, algorithms=['RS256'])
+    key = hashlib.sha256(token.encode()).digest()
+    payload = verified_tokens.get(key)
+    if payload is MISSING:
+        payload = jwt.decode(token, JWT_PUBLIC_KEY, algorithms=['RS256'])
+        # Once the entry is gone, an expired token fails decoding again
+        ttl = min(payload.get('exp', 0) - time.time(), JWT_CACHE_MAX_TTL)
+        if ttl > 0:
+            verified_tokens.set(key, payload, ttl=ttl)
     return payload
@@ -1,9 +1,10 @@
 import sys
 sys.path.insert(1, './python/src')
 
-from DBManager import DBManager, LOGDATA
+from DBManager import DBManager, AsyncDBManager, LOGDATA
 
 logfile="fastapi.log"
 DBM = DBManager(LOGDATA, logfile)
 DBM.logger.clear_logs()
-DBM.logger.log("Info : Test started!")
\ No newline at end of file
+DBM.logger.log("Info : Test started!")
+AsyncDBM = AsyncDBManager(LOGDATA, DBM, logfile)
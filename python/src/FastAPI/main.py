@@ -1,4 +1,8 @@
+import asyncio
+import os
+
 from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
 
 from routers.users import router as users_router
 from routers.researches import router as researches_router
@@ -11,6 +15,9 @@ from fastapi import FastAPI
 app = FastAPI(docs_url=None, redoc_url=None, openapi_url = None)
 
 from routers.docs import get_current_username, get_swagger_ui_html, get_openapi
+from metrics import DBMetricsMiddleware, render_metrics, process_snapshot, write_snapshot, read_snapshots
+from crypto import verified_tokens
+from config import DEBUG, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL
 
 @app.get("/docs", include_in_schema=False)
 async def get_documentation(username: str = Depends(get_current_username)):
@@ -21,6 +28,25 @@ async def get_documentation(username: str = Depends(get_current_username)):
 async def openapi(username: str = Depends(get_current_username)):
     return get_openapi(title = "FastAPI", version="0.1.0", routes=app.routes)
 
+
+def worker_metrics() -> dict:
+    pools = {"psycopg2": DBM.pool_stats(), "asyncpg": AsyncDBM.pool_stats()}
+    caches = {f"users_{name}": stats for name, stats in DBM.users.cache_stats().items()}
+    caches["verified_tokens"] = verified_tokens.stats()
+    caches["entity_info"] = DBM.info_cache.stats()
+    return process_snapshot(pools, caches)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(username: str = Depends(get_current_username)):
+    # Whichever worker gets the scrape serves all of them: itself live, the others
+    # (and the consumer, see server.py) from the snapshots they write to `METRICS_DIR`
+    max_age = 3 * METRICS_SNAPSHOT_INTERVAL
+    workers = await asyncio.to_thread(read_snapshots, "worker-", max_age)
+    workers[str(os.getpid())] = worker_metrics()
+    consumers = await asyncio.to_thread(read_snapshots, "consumer-", max_age)
+    return PlainTextResponse(render_metrics(workers, consumers), media_type="text/plain; version=0.0.4")
+
 origins = ["*"]
 
 app.add_middleware(
@@ -29,7 +55,60 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-DB-Queries", "X-DB-Connections", "X-DB-Time-Ms", "X-DB-Statements"],
 )
+app.add_middleware(DBMetricsMiddleware, debug_headers=DEBUG)
+
+from db_manager import DBM, AsyncDBM
+
+@app.on_event("startup")
+async def load_statuses():
+    try:
+        await AsyncDBM.load_statuses()
+    except Exception as e:
+        # The managers load them on first use anyway
+        DBM.logger.log(f"Error: Can't load the status tables: {e!r}")
+
+@app.on_event("startup")
+async def start_change_listener():
+    AsyncDBM.start_listening()
+
+@app.on_event("startup")
+async def start_enrichment_sweeps():
+    DBM.start_enrichment_sweeps()
+
+@app.on_event("startup")
+async def start_user_cache_invalidation():
+    from mq import start_cache_invalidation
+    try:
+        app.state.user_updates_connection = await start_cache_invalidation()
+    except Exception as e:
+        # Without the MQ the cached user roles just live until their TTL
+        DBM.logger.log(f"Error: Can't subscribe to user updates: {e!r}")
+
+@app.on_event("startup")
+async def start_metrics_snapshots():
+    async def write_snapshots():
+        while True:
+            try:
+                await asyncio.to_thread(write_snapshot, f"worker-{os.getpid()}", worker_metrics())
+            except OSError as e:
+                DBM.logger.log(f"Error: Couldn't write the metrics snapshot: {e!r}")
+            await asyncio.sleep(METRICS_SNAPSHOT_INTERVAL)
+    app.state.metrics_snapshots = asyncio.create_task(write_snapshots())
+
+@app.on_event("shutdown")
+async def stop_metrics_snapshots():
+    app.state.metrics_snapshots.cancel()
+    try:
+        os.remove(os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json"))
+    except OSError:
+        pass
+
+@app.on_event("shutdown")
+async def shutdown_db_manager():
+    await AsyncDBM.close()
+    DBM.close()
 
 app.include_router(users_router)
 app.include_router(researches_router)
@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+
+from starlette.datastructures import MutableHeaders
+
+from DBM.QueryStats import RequestStats, current_request, query_stats, statement_id
+from config import METRICS_DIR
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """
+    Per-route totals of the served requests: latency histogram, statuses and the db work they did.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}  # (method, route) -> totals
+
+    def observe(self, method: str, route: str, status: int, seconds: float, db: RequestStats):
+        with self._lock:
+            totals = self.routes.get((method, route))
+            if totals is None:
+                totals = self.routes[(method, route)] = {
+                    "statuses": {}, "buckets": [0] * len(DURATION_BUCKETS), "count": 0, "seconds": 0.0,
+                    "db_queries": 0, "db_connections": 0, "db_seconds": 0.0,
+                }
+            totals["statuses"][status] = totals["statuses"].get(status, 0) + 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    totals["buckets"][i] += 1
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["db_queries"] += db.queries
+            totals["db_connections"] += db.connections
+            totals["db_seconds"] += db.sql_seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: dict(totals, statuses=dict(totals["statuses"]), buckets=list(totals["buckets"]))
+                    for key, totals in self.routes.items()}
+
+
+request_metrics = RequestMetrics()
+
+
+class DBMetricsMiddleware:
+    """
+    Collects the db work of every request into a `RequestStats` and adds it to `request_metrics`.
+    With `debug_headers` it's also sent back in `X-DB-*` response headers.
+    """
+    def __init__(self, app, debug_headers: bool = False):
+        self.app = app
+        self.debug_headers = debug_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_stats(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.debug_headers:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-DB-Queries"] = str(stats.queries)
+                    headers["X-DB-Connections"] = str(stats.connections)
+                    headers["X-DB-Time-Ms"] = f"{stats.sql_seconds * 1000:.2f}"
+                    headers["X-DB-Statements"] = stats.header_value()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            request_metrics.observe(scope["method"], route.path if route is not None else "unmatched",
+                                    status, time.perf_counter() - started, stats)
+
+
+def write_snapshot(name: str, snapshot: dict, directory: str = METRICS_DIR):
+    """
+    Atomically replaces `directory/<name>.json` with `snapshot`, stamped with the time it was taken,
+    so processes without an HTTP server (the MQ consumer) can have their stats served by `/metrics`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(dict(snapshot, taken_at=time.time()), f)
+    os.replace(temporary, path)
+
+
+def read_snapshots(prefix: str, max_age: float, directory: str = METRICS_DIR) -> dict:
+    """
+    `{name: snapshot}` of the snapshots `write_snapshot` left as `<prefix><name>`,
+    but the ones older than `max_age` seconds, whose writer is likely gone.
+    """
+    snapshots = {}
+    try:
+        files = [file for file in os.listdir(directory) if file.startswith(prefix) and file.endswith(".json")]
+    except OSError:
+        return snapshots
+    for file in files:
+        try:
+            with open(os.path.join(directory, file)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if time.time() - snapshot.get("taken_at", 0) <= max_age:
+            snapshots[file[len(prefix):-len(".json")]] = snapshot
+    return snapshots
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def process_snapshot(pools: dict, caches: dict) -> dict:
+    """
+    The metrics of this process as plain json data: requests, statements, connections,
+    and the given `{driver: pool.stats()}` and `{name: cache.stats()}`.
+    """
+    db = query_stats.snapshot()
+    return {
+        "routes": [[method, route, totals] for (method, route), totals in sorted(request_metrics.snapshot().items())],
+        "statements": [[driver, fp, calls, seconds] for (driver, fp), (calls, seconds) in sorted(db["statements"].items())],
+        "connections": db["connections"],
+        "pools": pools,
+        "caches": caches,
+    }
+
+
+def render_metrics(workers: dict, consumers: dict = None) -> str:
+    """
+    Prometheus text exposition of the `{worker: process_snapshot()}` of the API worker processes,
+    their series told apart by a `worker` label, and of the `{queue: consumer.stats()}`.
+    """
+    lines = []
+    workers = sorted(workers.items())
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{sample_name}{_labels(**labels)} {value}" for sample_name, labels, value in samples)
+
+    def per_worker(key):
+        return [(worker, item) for worker, snapshot in workers for item in snapshot[key]]
+
+    routes = per_worker("routes")
+    metric("biokeeper_http_requests_total", "counter", "Served requests.",
+           [("biokeeper_http_requests_total", {"worker": worker, "method": method, "route": route, "status": status}, n)
+            for worker, (method, route, totals) in routes for status, n in sorted(totals["statuses"].items())])
+    histogram = []
+    for worker, (method, route, totals) in routes:
+        labels = {"worker": worker, "method": method, "route": route}
+        for bound, n in zip(DURATION_BUCKETS, totals["buckets"]):
+            histogram.append(("biokeeper_http_request_duration_seconds_bucket", dict(labels, le=bound), n))
+        histogram.append(("biokeeper_http_request_duration_seconds_bucket", dict(labels, le="+Inf"), totals["count"]))
+        histogram.append(("biokeeper_http_request_duration_seconds_sum", labels, totals["seconds"]))
+        histogram.append(("biokeeper_http_request_duration_seconds_count", labels, totals["count"]))
+    metric("biokeeper_http_request_duration_seconds", "histogram", "Request latency.", histogram)
+    for key, name, help_text in (("db_queries", "biokeeper_http_request_db_queries_total", "Db statements run by the requests."),
+                                 ("db_connections", "biokeeper_http_request_db_connections_total", "Db connections borrowed by the requests."),
+                                 ("db_seconds", "biokeeper_http_request_db_seconds_total", "Time the requests spent in db statements.")):
+        metric(name, "counter", help_text,
+               [(name, {"worker": worker, "method": method, "route": route}, totals[key]) for worker, (method, route, totals) in routes])
+
+    statements = per_worker("statements")
+    metric("biokeeper_db_statement_calls_total", "counter", "Executions per statement fingerprint.",
+           [("biokeeper_db_statement_calls_total", {"worker": worker, "driver": driver, "statement_id": statement_id(fp), "statement": fp}, calls)
+            for worker, (driver, fp, calls, _) in statements])
+    metric("biokeeper_db_statement_seconds_total", "counter", "Execution time per statement fingerprint.",
+           [("biokeeper_db_statement_seconds_total", {"worker": worker, "driver": driver, "statement_id": statement_id(fp)}, seconds)
+            for worker, (driver, fp, _, seconds) in statements])
+    metric("biokeeper_db_connections_acquired_total", "counter", "Connections borrowed from the pools.",
+           [("biokeeper_db_connections_acquired_total", {"worker": worker, "driver": driver}, n)
+            for worker, snapshot in workers for driver, n in sorted(snapshot["connections"].items())])
+
+    for key in ("size", "idle", "in_use", "max_size"):
+        metric(f"biokeeper_db_pool_{key}", "gauge", f"Db pool {key.replace('_', ' ')}.",
+               [(f"biokeeper_db_pool_{key}", {"worker": worker, "driver": driver}, stats[key])
+                for worker, snapshot in workers for driver, stats in sorted(snapshot["pools"].items())])
+
+    for key, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("size", "gauge")):
+        name = f"biokeeper_cache_{key}" + ("_total" if kind == "counter" else "")
+        metric(name, kind, f"Cache {key}.",
+               [(name, {"worker": worker, "cache": cache}, stats[key])
+                for worker, snapshot in workers for cache, stats in sorted(snapshot["caches"].items())])
+
+    consumers = sorted((consumers or {}).items())
+    for key in ("received", "inserted", "duplicates", "rejected", "batches", "failed_batches"):
+        name = f"biokeeper_mq_{key}_total"
+        metric(name, "counter", f"MQ consumer {key.replace('_', ' ')}.", [(name, {"queue": queue}, stats[key]) for queue, stats in consumers])
+    for key, help_text in (("in_flight", "Delivered messages not acked yet."),
+                           ("queue_depth", "Messages waiting in the queue."),
+                           ("lag", "Unacked plus queued messages."),
+                           ("throughput", "Handled messages per second since the consumer started.")):
+        name = f"biokeeper_mq_{key}"
+        metric(name, "gauge", help_text,
+               [(name, {"queue": queue}, stats[key]) for queue, stats in consumers if stats.get(key) is not None])
+
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,7 @@
 from pydantic import Field
 from responses.base import BasicConflictResponse, BasicNotFoundResponse, BasicForbiddenResponse
 
-from config import MAX_NUMBER_OF_QRS
+from config import MAX_NUMBER_OF_QRS, MAX_NUMBER_OF_QRS_IN_BATCH, MAX_KITS_PER_BATCH
 
 class KitNotFoundResponse(BasicNotFoundResponse):
     msg: str = Field(..., example="Kit not found")
@@ -41,4 +41,15 @@ class NumberOfQRsLessThanZeroResponse(BasicConflictResponse):
 
 class NumberOfQRsTooBigResponse(BasicConflictResponse):
     msg: str = Field(..., example="Number of QRs is too big")
-    data: dict | None = Field(..., example={'max_number_of_qrs': MAX_NUMBER_OF_QRS})
\ No newline at end of file
+    data: dict | None = Field(..., example={'max_number_of_qrs': MAX_NUMBER_OF_QRS})
+
+class NumberOfQRsInBatchTooBigResponse(BasicConflictResponse):
+    msg: str = Field(..., example="Number of QRs is too big")
+    data: dict | None = Field(..., example={'max_number_of_qrs': MAX_NUMBER_OF_QRS_IN_BATCH})
+
+class NumberOfKitsLessThanZeroResponse(BasicConflictResponse):
+    msg: str = Field(..., example="Number of kits must be greater than zero")
+
+class NumberOfKitsTooBigResponse(BasicConflictResponse):
+    msg: str = Field(..., example="Number of kits is too big")
+    data: dict | None = Field(..., example={'max_kits_per_batch': MAX_KITS_PER_BATCH})
\ No newline at end of file
@@ -47,4 +47,8 @@ class UserDoesNotOwnKitResponse(BasicForbiddenResponse):
 
 class KitIsNotActivatedResponse(BasicForbiddenResponse):
     msg: str = Field(..., example="Kit hasn't been activated")
-    data: dict | None = Field(..., example={'kit_id': 5})
\ No newline at end of file
+    data: dict | None = Field(..., example={'kit_id': 5})
+
+class SamplePhotoNotFoundResponse(BasicNotFoundResponse):
+    msg: str = Field(..., example="Sample has no photo")
+    data: dict | None = Field(..., example={'sample_id': 5})
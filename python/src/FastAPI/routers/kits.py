@@ -1,16 +1,17 @@
 from typing import Annotated
-from fastapi import Depends, Body, status
+from fastapi import Depends, Body, Query, status
 from fastapi.routing import APIRouter
-from db_manager import DBM
+from db_manager import AsyncDBM
 from exceptions import NoKitException, HTTPNotFoundException,HTTPForbiddenException,HTTPConflictException, NoUserException
 from schemas.common import TokenPayload
-from schemas.kits import CreateKitRequest, KitInfo, KitRequest, MyKit, SendKitRequest
-from utils import get_admin, get_current_user, get_volunteer, get_volunteer_or_admin
+from schemas.kits import CreateKitRequest, CreateKitsBatchRequest, CreatedKit, KitInfo, KitRequest, MyKit, SendKitRequest
+from utils import get_admin, get_current_user, get_volunteer, get_volunteer_or_admin, next_cursor_headers
 from fastapi.responses import JSONResponse, Response
 from schemas.common import TokenPayload
 from utils import get_current_user
 
-from config import MAX_NUMBER_OF_QRS
+from config import MAX_NUMBER_OF_QRS, MAX_NUMBER_OF_QRS_IN_BATCH, MAX_KITS_PER_BATCH, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from datetime import datetime
 
 from responses import kits_responses
 from responses.base import generate_responses
@@ -20,9 +21,16 @@ from dependencies.identifiers_validators import kit_identifier_validator_depende
 router = APIRouter()
 
 @router.get('/kits', response_model=list[KitInfo], tags=['kits'])
-def get_kits(token_payload: Annotated[TokenPayload, Depends(get_admin)]):
-    all_kits = list(DBM.kits.get_all().values())
-    return JSONResponse(status_code=status.HTTP_200_OK, content=all_kits)
+async def get_kits(token_payload: Annotated[TokenPayload, Depends(get_admin)],
+                   after: int | None = None,
+                   limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+                   kit_status: Annotated[str | None, Query(alias='status')] = None,
+                   owner_id: int | None = None,
+                   created_from: datetime | None = None,
+                   created_to: datetime | None = None):
+    all_kits = list((await AsyncDBM.kits.get_all(after=after, limit=limit, status=kit_status, owner_id=owner_id,
+                                                 created_from=created_from, created_to=created_to)).values())
+    return JSONResponse(status_code=status.HTTP_200_OK, content=all_kits, headers=next_cursor_headers(all_kits, limit))
 
 @router.get('/kits/{kit_identifier}',
             response_model=KitInfo,
@@ -31,10 +39,10 @@ def get_kits(token_payload: Annotated[TokenPayload, Depends(get_admin)]):
                 kits_responses.KitNotFoundResponse,
                 kits_responses.UserIsNotOwnerOfKit
             ))
-def get_kit(kit_identifier: Annotated[str, Depends(kit_identifier_validator_dependency)], 
-            token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)]):
+async def get_kit(kit_identifier: Annotated[str, Depends(kit_identifier_validator_dependency)], 
+                  token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)]):
     try:
-        dbm_kit = DBM.kits.get_info(kit_identifier)
+        dbm_kit = await AsyncDBM.kits.get_info(kit_identifier)
     except NoKitException:
         raise HTTPNotFoundException(msg=f'Kit not found',data={'kit_identifier': kit_identifier})
     if token_payload.id != dbm_kit['owner_id']:
@@ -51,19 +59,19 @@ def get_kit(kit_identifier: Annotated[str, Depends(kit_identifier_validator_depe
                 kits_responses.KitAlreadyHasOwnerResponse,
                 kits_responses.KitAlreadySentResponse,
             ))
-def update_owner(
+async def update_owner(
     token_payload: Annotated[TokenPayload, Depends(get_admin)],
     kit_identifier: Annotated[str, Depends(kit_identifier_validator_dependency)],
     send_kit_request: SendKitRequest
     ):
     new_owner_identifier = send_kit_request.new_owner_identifier
     try:
-        kit_info = DBM.kits.get_info(kit_identifier)
+        kit_info = await AsyncDBM.kits.get_info(kit_identifier)
     except NoKitException:
         raise HTTPNotFoundException(msg=f'Kit not found',data={'kit_identifier': kit_identifier})     
 
     try:
-        new_owner_info = DBM.users.get_info(new_owner_identifier)
+        new_owner_info = await AsyncDBM.users.get_info(new_owner_identifier)
     except NoUserException:
         raise HTTPNotFoundException(msg=f'New owner user not found',data={'new_owner_identifier': new_owner_identifier})
     
@@ -81,7 +89,7 @@ def update_owner(
     if kit_info['status'] == 'sent':
         raise HTTPConflictException(msg=f'Kit already sent',data={'kit_identifier': kit_identifier})
     
-    DBM.kits.send_kit(kit_info['id'], new_owner_id, log=True)
+    await AsyncDBM.kits.send_kit(kit_info['id'], new_owner_id, log=True)
     return Response(status_code=status.HTTP_200_OK, content=f"Kit {kit_identifier} owner changed to {new_owner_id}")
     
 
@@ -93,12 +101,12 @@ def update_owner(
                 kits_responses.UserIsNotOwnerOfKit,
                 kits_responses.KitAlreadyActivatedResponse
             ))
-def activate_kit(
+async def activate_kit(
     kit_identifier: Annotated[str, Depends(kit_identifier_validator_dependency)],
     token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)]
     ):
     try:
-        kit_info = DBM.kits.get_info(kit_identifier)
+        kit_info = await AsyncDBM.kits.get_info(kit_identifier)
     except NoKitException:
         raise HTTPNotFoundException(msg=f'Kit not found',data={'kit_identifier': kit_identifier})
     
@@ -108,7 +116,7 @@ def activate_kit(
     if kit_info['status'] == 'activated':
         raise HTTPConflictException(msg=f'Kit already activated',data={'kit_identifier': kit_identifier})
     
-    DBM.kits.activate(kit_info['id'], log=True)
+    await AsyncDBM.kits.activate(kit_info['id'], log=True)
 
     return Response(status_code=status.HTTP_200_OK, content=f"Kit {kit_identifier} is activated")
     
@@ -119,11 +127,32 @@ def activate_kit(
                  kits_responses.NumberOfQRsTooBigResponse
                 ) 
              )
-def create_kit(create_kit_request: CreateKitRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
+async def create_kit(create_kit_request: CreateKitRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
     if create_kit_request.n_qrs <= 0:
         raise HTTPConflictException(msg=f'Number of QRs must be greater than zero')
     if create_kit_request.n_qrs > MAX_NUMBER_OF_QRS:
         raise HTTPConflictException(msg=f'Number of QRs is too big', data={'max_number_of_qrs': MAX_NUMBER_OF_QRS})
-    kit_id = DBM.kits.new(create_kit_request.n_qrs, token_payload.id, log=True)
-    kit_info = DBM.kits.get_info(kit_id)
+    kit_id = await AsyncDBM.kits.new(create_kit_request.n_qrs, token_payload.id, log=True)
+    kit_info = await AsyncDBM.kits.get_info(kit_id)
     return JSONResponse(status_code=status.HTTP_201_CREATED, content=kit_info)
+
+@router.post('/kits/batch', response_model=list[CreatedKit],
+             tags=['admin_panel'],
+             responses = generate_responses(
+                 kits_responses.NumberOfKitsLessThanZeroResponse,
+                 kits_responses.NumberOfKitsTooBigResponse,
+                 kits_responses.NumberOfQRsLessThanZeroResponse,
+                 kits_responses.NumberOfQRsInBatchTooBigResponse
+                )
+             )
+async def create_kits_batch(create_request: CreateKitsBatchRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
+    if create_request.n_kits <= 0:
+        raise HTTPConflictException(msg=f'Number of kits must be greater than zero')
+    if create_request.n_kits > MAX_KITS_PER_BATCH:
+        raise HTTPConflictException(msg=f'Number of kits is too big', data={'max_kits_per_batch': MAX_KITS_PER_BATCH})
+    if create_request.n_qrs <= 0:
+        raise HTTPConflictException(msg=f'Number of QRs must be greater than zero')
+    if create_request.n_qrs > MAX_NUMBER_OF_QRS_IN_BATCH:
+        raise HTTPConflictException(msg=f'Number of QRs is too big', data={'max_number_of_qrs': MAX_NUMBER_OF_QRS_IN_BATCH})
+    created = await AsyncDBM.kits.new_many(create_request.n_kits, create_request.n_qrs, token_payload.id, log=True)
+    return JSONResponse(status_code=status.HTTP_201_CREATED, content=created)
@@ -1,14 +1,18 @@
-from typing import Annotated
-from fastapi import Depends, status
-from fastapi.responses import JSONResponse, Response
+import csv
+import io
+import json
+from typing import Annotated, Literal
+from fastapi import Depends, Query, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.routing import APIRouter
-from db_manager import DBM
-from datetime import date
+from db_manager import AsyncDBM
+from datetime import date, datetime
 
 from exceptions import HTTPConflictException, HTTPForbiddenException, NoResearchException, HTTPNotFoundException, NoUserException
 from schemas.researches import AcceptedParticipantResponse, ApproveResearchRequest, CreateResearchRequest, DeclineResearchRequest, DeleteParticipantRequest, GetResearchRequest, PendingRequestResponse, ResearchBase, ResearchNewStatusResponse, ResearchRequest, ResearchResponse, SendResearchParticipantRequest, MyResearch
 from schemas.common import TokenPayload
-from utils import get_admin, get_current_user, get_volunteer_or_admin
+from utils import get_admin, get_current_user, get_volunteer_or_admin, next_cursor_headers
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 from responses import researches_responses
 from responses.base import generate_responses
@@ -18,18 +22,25 @@ from dependencies.identifiers_validators import research_identifier_validator_de
 router = APIRouter()
 
 @router.get('/researches', response_model=list[ResearchResponse], tags=['researches'])
-def get_researches(token_payload: Annotated[TokenPayload, Depends(get_current_user)]):
-    all_researches = list(DBM.researches.get_all().values())
-    return JSONResponse(status_code=status.HTTP_200_OK, content=all_researches)
+async def get_researches(token_payload: Annotated[TokenPayload, Depends(get_current_user)],
+                         after: int | None = None,
+                         limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+                         research_status: Annotated[str | None, Query(alias='status')] = None,
+                         created_by: int | None = None,
+                         created_from: datetime | None = None,
+                         created_to: datetime | None = None):
+    all_researches = list((await AsyncDBM.researches.get_all(after=after, limit=limit, status=research_status, created_by=created_by,
+                                                             created_from=created_from, created_to=created_to)).values())
+    return JSONResponse(status_code=status.HTTP_200_OK, content=all_researches, headers=next_cursor_headers(all_researches, limit))
 
 @router.get('/researches/{research_identifier}',
             response_model=ResearchResponse,
             tags=['researches'],
             responses=generate_responses(researches_responses.ResearchNotFoundResponse)
             )
-def get_research(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], token_payload: Annotated[TokenPayload, Depends(get_current_user)]):
+async def get_research(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], token_payload: Annotated[TokenPayload, Depends(get_current_user)]):
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     return JSONResponse(status_code=status.HTTP_200_OK, content=dbm_research)
@@ -44,9 +55,9 @@ def get_research(research_identifier: Annotated[str, Depends(research_identifier
                 researches_responses.UserIsNotCreatorOfTheResearchResponse
                 )
             )
-def get_pending_requests(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], token_payload: Annotated[TokenPayload, Depends(get_admin)]):
+async def get_pending_requests(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], token_payload: Annotated[TokenPayload, Depends(get_admin)]):
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -56,7 +67,7 @@ def get_pending_requests(research_identifier: Annotated[str, Depends(research_id
     if token_payload.id != dbm_research['created_by']:
         raise HTTPForbiddenException(msg=f'User is not creator of research',data={'research_identifier': research_identifier,'user_id': token_payload.id})
 
-    pending_requests = DBM.researches.get_pending_requests(research_identifier)
+    pending_requests = await AsyncDBM.researches.get_pending_requests(dbm_research['id'])
     return pending_requests
 
 
@@ -69,9 +80,9 @@ def get_pending_requests(research_identifier: Annotated[str, Depends(research_id
                 researches_responses.UserIsNotCreatorOfTheResearchResponse
                 )
             )
-def get_accepted_participants(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], token_payload: Annotated[TokenPayload, Depends(get_admin)]):
+async def get_accepted_participants(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], token_payload: Annotated[TokenPayload, Depends(get_admin)]):
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -81,10 +92,64 @@ def get_accepted_participants(research_identifier: Annotated[str, Depends(resear
     if token_payload.id != dbm_research['created_by']:
         raise HTTPForbiddenException(msg=f'User is not creator of research',data={'research_identifier': research_identifier,'user_id': token_payload.id})
     
-    accepted_participants = DBM.researches.get_accepted_participants(research_identifier)
+    accepted_participants = await AsyncDBM.researches.get_accepted_participants(dbm_research['id'])
     return accepted_participants
 
 
+async def _ndjson_chunks(rows, rows_per_chunk=500):
+    chunk = []
+    async for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False))
+        if len(chunk) == rows_per_chunk:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+async def _csv_chunks(rows, columns, rows_per_chunk=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    n = 0
+    async for row in rows:
+        writer.writerow(row[column] for column in columns)
+        n += 1
+        if n == rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            n = 0
+    yield buffer.getvalue()
+
+
+@router.get('/researches/{research_identifier}/samples/export',
+            tags=['admin_panel'],
+            response_class=StreamingResponse,
+            responses=generate_responses(
+                researches_responses.ResearchNotFoundResponse,
+                researches_responses.UserIsNotCreatorOfTheResearchResponse
+                )
+            )
+async def export_research_samples(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)],
+                                  token_payload: Annotated[TokenPayload, Depends(get_admin)],
+                                  export_format: Annotated[Literal['ndjson', 'csv'], Query(alias='format')] = 'ndjson'):
+    try:
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
+    except NoResearchException:
+        raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
+
+    if token_payload.id != dbm_research['created_by']:
+        raise HTTPForbiddenException(msg=f'User is not creator of research',data={'research_identifier': research_identifier,'user_id': token_payload.id})
+
+    rows = AsyncDBM.samples.export_research_samples(dbm_research['id'])
+    filename = f"research_{dbm_research['id']}_samples.{export_format}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if export_format == 'csv':
+        return StreamingResponse(_csv_chunks(rows, AsyncDBM.samples.EXPORT_COLUMNS), media_type='text/csv', headers=headers)
+    return StreamingResponse(_ndjson_chunks(rows), media_type='application/x-ndjson', headers=headers)
+
+
 @router.post('/researches/{research_identifier}/send_request',
                 tags=['researches'],
                 responses=generate_responses(
@@ -95,11 +160,11 @@ def get_accepted_participants(research_identifier: Annotated[str, Depends(resear
                     researches_responses.UserAlreadySentRequestResponse
                     )
                 )
-def send_request(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], 
+async def send_request(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], 
                 token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)]
                 ):
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -109,15 +174,15 @@ def send_request(research_identifier: Annotated[str, Depends(research_identifier
     if dbm_research['status'] in ['ended', 'canceled']:
         raise HTTPConflictException(msg=f'Research already ended',data={'research_identifier': research_identifier})
     
-    participants = DBM.researches.get_participants_ids(dbm_research['id'])
+    participants = await AsyncDBM.researches.get_participants_ids(dbm_research['id'])
     if token_payload.id in participants:
         raise HTTPConflictException(msg=f'User already participate in research',data={'research_identifier': research_identifier,'user_id': token_payload.id})
     
-    candidates = DBM.researches.get_candidates_ids(dbm_research['id'])
+    candidates = await AsyncDBM.researches.get_candidates_ids(dbm_research['id'])
     if token_payload.id in candidates:
         raise HTTPConflictException(msg=f'User already sent request to research ',data={'research_identifier': research_identifier,'user_id': token_payload.id})
 
-    DBM.researches.send_request(dbm_research['id'], token_payload.id, log=False)
+    await AsyncDBM.researches.send_request(dbm_research['id'], token_payload.id, log=False)
     return JSONResponse(status_code=status.HTTP_200_OK, content=f"User {token_payload.id} sent request to research {research_identifier}")
 
 
@@ -133,10 +198,10 @@ def send_request(research_identifier: Annotated[str, Depends(research_identifier
                     researches_responses.UserNotSentRequestResponse
                     )
                 )
-def approve_request(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], approve_research_request: ApproveResearchRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
+async def approve_request(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], approve_research_request: ApproveResearchRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
     candidate_identifier = approve_research_request.candidate_identifier
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -150,21 +215,21 @@ def approve_request(research_identifier: Annotated[str, Depends(research_identif
         raise HTTPConflictException(msg=f'Research already ended',data={'research_identifier': research_identifier})
     
     try:
-        candidate_info = DBM.users.get_info(candidate_identifier)
+        candidate_info = await AsyncDBM.users.get_info(candidate_identifier)
     except NoUserException:
         raise HTTPNotFoundException(msg=f'User not found',data={'candidate_identifier': candidate_identifier})
     
     candidate_id = candidate_info['id']
     research_id = dbm_research['id']
-    participants = DBM.researches.get_participants_ids(research_id)
+    participants = await AsyncDBM.researches.get_participants_ids(research_id)
     if candidate_id in participants:
         raise HTTPConflictException(msg=f'User already participate in research',data={'research_identifier': research_identifier,'user_id': candidate_id})
     
-    candidates = DBM.researches.get_candidates_ids(research_id)
+    candidates = await AsyncDBM.researches.get_candidates_ids(research_id)
     if candidate_id not in candidates:
         raise HTTPConflictException(msg=f'User not sent request to research ',data={'research_identifier': research_identifier,'user_id': candidate_id})
 
-    DBM.researches.approve_request(research_id, candidate_id, log=False)
+    await AsyncDBM.researches.approve_request(research_id, candidate_id, log=False)
     return JSONResponse(status_code=status.HTTP_200_OK, content=f"User {candidate_id} approved request to research {research_identifier}")
 
 @router.post('/researches/{research_identifier}/decline_request', tags=['admin_panel'],
@@ -177,10 +242,10 @@ def approve_request(research_identifier: Annotated[str, Depends(research_identif
                     researches_responses.UserAlreadyParticipateInResearchResponse,
                     researches_responses.UserNotSentRequestResponse
                 ))
-def decline_request(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], decline_research_request: DeclineResearchRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
+async def decline_request(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], decline_research_request: DeclineResearchRequest, token_payload: Annotated[TokenPayload, Depends(get_admin)]):
     candidate_identifier = decline_research_request.candidate_identifier
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -194,21 +259,21 @@ def decline_request(research_identifier: Annotated[str, Depends(research_identif
         raise HTTPConflictException(msg=f'Research already ended',data={'research_identifier': research_identifier})
     
     try:
-        candidate_info = DBM.users.get_info(candidate_identifier)
+        candidate_info = await AsyncDBM.users.get_info(candidate_identifier)
     except NoUserException:
         raise HTTPNotFoundException(msg=f'User not found',data={'candidate_identifier': candidate_identifier})
     
     candidate_id = candidate_info['id']
     research_id = dbm_research['id']
-    participants = DBM.researches.get_participants_ids(research_id)
+    participants = await AsyncDBM.researches.get_participants_ids(research_id)
     if candidate_id in participants:
         raise HTTPConflictException(msg=f'User already participate in research',data={'research_identifier': research_identifier,'user_id': candidate_id})
     
-    candidates = DBM.researches.get_candidates_ids(research_id)
+    candidates = await AsyncDBM.researches.get_candidates_ids(research_id)
     if candidate_id not in candidates:
         raise HTTPConflictException(msg=f'User not sent request to research',data={'research_identifier': research_identifier,'user_id': candidate_id})
 
-    DBM.researches.decline_request(research_id, candidate_id, log=False)
+    await AsyncDBM.researches.decline_request(research_id, candidate_id, log=False)
     return Response(status_code=status.HTTP_200_OK, 
                     content=f"User {candidate_id} declined request to research {research_identifier}")
 
@@ -224,13 +289,13 @@ def decline_request(research_identifier: Annotated[str, Depends(research_identif
                     researches_responses.UserNotParticipateInResearchResponse
                     )
                 )
-def delete_accepted_participant(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], 
-                                token_payload: Annotated[TokenPayload, Depends(get_admin)],
-                                delete_participant_request: DeleteParticipantRequest
-                                ):
+async def delete_accepted_participant(research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)], 
+                                      token_payload: Annotated[TokenPayload, Depends(get_admin)],
+                                      delete_participant_request: DeleteParticipantRequest
+                                      ):
     participant_identifier = delete_participant_request.participant_identifier
     try:
-        dbm_research = DBM.researches.get_info(research_identifier)
+        dbm_research = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -244,18 +309,18 @@ def delete_accepted_participant(research_identifier: Annotated[str, Depends(rese
         raise HTTPConflictException(msg=f'Research already ended',data={'research_identifier': research_identifier})
     
     try:
-        participant_info = DBM.users.get_info(participant_identifier)
+        participant_info = await AsyncDBM.users.get_info(participant_identifier)
     except NoUserException:
         raise HTTPNotFoundException(msg=f'User not found',data={'participant_identifier': participant_identifier})
     
     participant_id = participant_info['id']
     research_id = dbm_research['id']
 
-    participants = DBM.researches.get_participants_ids(research_id)
+    participants = await AsyncDBM.researches.get_participants_ids(research_id)
     if participant_id not in participants:
         raise HTTPConflictException(msg=f'User not participate in research',data={'research_identifier': research_identifier,'user_id': participant_id})
 
-    DBM.researches.delete_accepted_participant(research_id, participant_id, log=False)
+    await AsyncDBM.researches.delete_accepted_participant(research_id, participant_id, log=False)
     return Response(status_code=status.HTTP_200_OK, 
                     content=f"User {participant_id} removed from research {research_identifier}")
 
@@ -271,12 +336,12 @@ def delete_accepted_participant(research_identifier: Annotated[str, Depends(rese
                 researches_responses.ResearchIsCanceledResponse
                 )
             )
-def set_research_start(
+async def set_research_start(
         research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)],
         token_payload: Annotated[TokenPayload, Depends(get_admin)]
         ):
     try:
-        research_info = DBM.researches.get_info(research_identifier)
+        research_info = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -293,7 +358,7 @@ def set_research_start(
         raise HTTPConflictException(msg=f'Research is canceled',data={'research_identifier': research_identifier})
 
     
-    DBM.researches.change_status(research_identifier, new_status="ongoing", log=True)
+    await AsyncDBM.researches.change_status(research_identifier, new_status="ongoing", log=True)
 
     return JSONResponse(status_code=status.HTTP_200_OK, 
                         content={"research_identifier": research_identifier, 
@@ -312,12 +377,12 @@ def set_research_start(
                 researches_responses.ResearchIsCanceledResponse
                 )
             )
-def set_research_paused(
+async def set_research_paused(
             research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)],
             token_payload: Annotated[TokenPayload, Depends(get_admin)]
         ):
     try:
-        research_info = DBM.researches.get_info(research_identifier)
+        research_info = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -336,7 +401,7 @@ def set_research_paused(
     if research_info['status'] == 'canceled':
         raise HTTPConflictException(msg=f'Research is canceled',data={'research_identifier': research_identifier})
 
-    DBM.researches.change_status(research_identifier, new_status="paused", log=True)
+    await AsyncDBM.researches.change_status(research_identifier, new_status="paused", log=True)
 
     return JSONResponse(status_code=status.HTTP_200_OK, 
                         content={"research_identifier": research_identifier, 
@@ -354,12 +419,12 @@ def set_research_paused(
                 researches_responses.ResearchIsCanceledResponse
                 )
             )
-def set_research_ended(
+async def set_research_ended(
         research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)],
         token_payload: Annotated[TokenPayload, Depends(get_admin)]
     ):
     try:
-        research_info = DBM.researches.get_info(research_identifier)
+        research_info = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -375,7 +440,7 @@ def set_research_ended(
     if research_info['status'] == 'canceled':
         raise HTTPConflictException(msg=f'Research is canceled',data={'research_identifier': research_identifier})
     
-    DBM.researches.change_status(research_identifier, new_status="ended", log=True)
+    await AsyncDBM.researches.change_status(research_identifier, new_status="ended", log=True)
     
     return JSONResponse(status_code=status.HTTP_200_OK, 
                         content={"research_identifier": research_identifier, 
@@ -391,12 +456,12 @@ def set_research_ended(
                 researches_responses.ResearchAlreadyEndedResponse
                 )
             )
-def set_research_canceled(
+async def set_research_canceled(
     research_identifier: Annotated[str, Depends(research_identifier_validator_dependency)],
     token_payload: Annotated[TokenPayload, Depends(get_admin)]
 ):
     try:
-        research_info = DBM.researches.get_info(research_identifier)
+        research_info = await AsyncDBM.researches.get_info(research_identifier)
     except NoResearchException:
         raise HTTPNotFoundException(msg=f'Research not found',data={'research_identifier': research_identifier})
     
@@ -409,7 +474,7 @@ def set_research_canceled(
     if research_info['status'] == 'ended':
         raise HTTPConflictException(msg=f'Research already ended',data={'research_identifier': research_identifier})
     
-    DBM.researches.change_status(research_identifier, new_status="canceled", log=True)
+    await AsyncDBM.researches.change_status(research_identifier, new_status="canceled", log=True)
     
     return JSONResponse(status_code=status.HTTP_200_OK, 
                         content={"research_identifier": research_identifier, 
@@ -422,7 +487,7 @@ def set_research_canceled(
                  researches_responses.ResearchAlreadyExistsResponse
                  )
             )
-def create_research(
+async def create_research(
     token_payload: Annotated[TokenPayload, Depends(get_admin)],
     create_research_request : CreateResearchRequest
     ):
@@ -431,13 +496,13 @@ def create_research(
     research_name = create_research_request.research_name
 
     try:
-        DBM.researches.has(research_name)
+        await AsyncDBM.researches.has_name(research_name)
     except NoResearchException:
         pass
     else:
         raise HTTPConflictException(msg=f'Research already exists',data={'research_name': research_name})
 
-    new_research_id = DBM.researches.new(research_name=research_name, 
+    new_research_id = await AsyncDBM.researches.new(research_name=research_name, 
                               user_id=user_id, 
                               day_start=create_research_request.day_start, 
                               research_comment=create_research_request.research_comment, 
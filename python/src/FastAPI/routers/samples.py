@@ -1,26 +1,78 @@
 from typing import Annotated
-from fastapi import Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import Body, Depends, Header, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.routing import APIRouter
-from db_manager import DBM
+from db_manager import DBM, AsyncDBM
 from datetime import datetime
-from exceptions import HTTPConflictException, HTTPNotFoundException, NoSampleException, HTTPForbiddenException, NoResearchException, NoQrCodeException
+from exceptions import CustomHTTPException, HTTPConflictException, HTTPNotFoundException, NoSampleException, HTTPForbiddenException
 from schemas.common import TokenPayload
-from schemas.samples import CreateSampleRequest, GpsModel, MySample, SampleBase, SampleInfo
-from utils import get_current_user, get_volunteer_or_admin, is_admin, is_observer
+from schemas.samples import BatchSampleResult, CreateSampleRequest, GpsModel, MySample, SampleBase, SampleInfo
+from utils import get_current_user, get_volunteer_or_admin, is_admin, is_observer, next_cursor_headers, parse_fields, parse_range_header
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_PHOTO_SIZE, MAX_SAMPLES_PER_BATCH
 
 from responses import samples_responses
 from responses.base import generate_responses
 
 router = APIRouter()
 
+FIELDS_DESCRIPTION = f"Comma separated subset of sample fields to return: {', '.join(AsyncDBM.samples.INFO_FIELDS)}"
 
-@router.get('/samples', response_model = list[SampleInfo], tags=['samples'])
-def get_samples(token_payload: Annotated[TokenPayload, Depends(get_current_user)]):
-    all_samples = list(DBM.samples.get_all().values())
-    for sample in all_samples:
+
+def _gps_to_model(sample: dict) -> dict:
+    if sample.get('gps'):
         latitude, longitude = sample['gps'][1:-1].split(',')
         sample['gps'] = GpsModel(latitude=latitude, longitude=longitude)
+    return sample
+
+
+def ingest_verdict_exception(ingested: dict, create_request: CreateSampleRequest, user_id: int) -> CustomHTTPException | None:
+    verdict = ingested['verdict']
+    if verdict == 'no_research':
+        return HTTPNotFoundException(msg=f'Research with this id not found',data={'research_id': create_request.research_id})
+    if verdict == 'not_participant':
+        return HTTPForbiddenException(msg=f"User does not participate in research",data={'research_id': create_request.research_id,'user_id': user_id})
+    if verdict == 'research_not_ongoing':
+        return HTTPConflictException(msg='Research is not in ongoing status',data={'research_id': create_request.research_id})
+    if verdict == 'no_qr':
+        return HTTPNotFoundException(msg=f'Qr not found',data={'qr_hex': create_request.qr_hex})
+    if verdict == 'qr_used':
+        return HTTPConflictException(msg=f'Qr is already used',data={'qr_hex': create_request.qr_hex})
+    if verdict == 'qr_without_kit':
+        return HTTPConflictException(msg=f'Qr is not assigned to any kit',data={'qr_hex': create_request.qr_hex})
+    if verdict == 'no_kit':
+        return HTTPNotFoundException(msg=f'Kit not found (very strange)',data={'kit_id': ingested['kit_id']})
+    if verdict == 'kit_without_owner':
+        return HTTPForbiddenException(msg=f'Kit is not assigned to any user',data={'kit_id': ingested['kit_id']})
+    if verdict == 'not_kit_owner':
+        return HTTPForbiddenException(msg=f"User does not own kit",data={'kit_id': ingested['kit_id'],'user_id': user_id})
+    if verdict == 'kit_not_activated':
+        return HTTPConflictException(msg=f"Kit hasn't been activated",data={'kit_id': ingested['kit_id']})
+    return None
+
+
+@router.get('/samples', response_model = list[SampleInfo], tags=['samples'])
+async def get_samples(token_payload: Annotated[TokenPayload, Depends(get_current_user)],
+                      response: Response,
+                      after: int | None = None,
+                      limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+                      sample_status: Annotated[str | None, Query(alias='status')] = None,
+                      research_id: int | None = None,
+                      owner_id: int | None = None,
+                      created_from: datetime | None = None,
+                      created_to: datetime | None = None,
+                      fields: Annotated[str | None, Query(description=FIELDS_DESCRIPTION)] = None):
+    requested_fields = parse_fields(fields, AsyncDBM.samples.INFO_FIELDS)
+    all_samples = list((await AsyncDBM.samples.get_all(after=after, limit=limit, status=sample_status, research_id=research_id,
+                                                       owner_id=owner_id, created_from=created_from, created_to=created_to,
+                                                       fields=requested_fields)).values())
+    headers = next_cursor_headers(all_samples, limit)
+    all_samples = [_gps_to_model(sample) for sample in all_samples]
+    if requested_fields is not None:
+        # A projection does not fit `SampleInfo`, it is sent as is
+        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(all_samples), headers=headers)
+    response.headers.update(headers)
     return all_samples
 
 @router.get('/samples/{sample_id}',
@@ -31,16 +83,22 @@ def get_samples(token_payload: Annotated[TokenPayload, Depends(get_current_user)
                 samples_responses.SampleNotOwnerResponse
                 )
             )
-def get_sample(sample_id:  int, token_payload: Annotated[TokenPayload, Depends(get_current_user)]):
+async def get_sample(sample_id:  int,
+                     token_payload: Annotated[TokenPayload, Depends(get_current_user)],
+                     fields: Annotated[str | None, Query(description=FIELDS_DESCRIPTION)] = None):
+    requested_fields = parse_fields(fields, AsyncDBM.samples.INFO_FIELDS)
     try:
-        dbm_sample = DBM.samples.get_info(sample_id)
+        # `owner_id` is needed for the permission check whatever the client asked for
+        dbm_sample = await AsyncDBM.samples.get_info(sample_id, fields=None if requested_fields is None else {'owner_id', *requested_fields})
     except NoSampleException:
         raise HTTPNotFoundException(msg=f'Sample not found',data={'sample_id': sample_id})
     if not is_admin(token_payload) and dbm_sample['owner_id'] != token_payload.id or is_observer(token_payload):
         raise HTTPForbiddenException(msg=f'Sample owner differs from autorized user')
-    
-    latitude, longitude = dbm_sample['gps'][1:-1].split(',')
-    dbm_sample['gps'] = GpsModel(latitude=latitude, longitude=longitude)
+
+    dbm_sample = _gps_to_model(dbm_sample)
+    if requested_fields is not None:
+        dbm_sample = {field: value for field, value in dbm_sample.items() if field in requested_fields}
+        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(dbm_sample))
     return dbm_sample
 
 @router.post('/samples',
@@ -59,59 +117,130 @@ def get_sample(sample_id:  int, token_payload: Annotated[TokenPayload, Depends(g
                 samples_responses.KitIsNotActivatedResponse
                 )
             )
-def create_sample(
+async def create_sample(
     create_request : CreateSampleRequest,
     token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)]
 ):
-    try:
-        dbm_research = DBM.researches.get_info(create_request.research_id)
-    except NoResearchException:
-        raise HTTPNotFoundException(msg=f'Research with this id not found',data={'research_id': create_request.research_id})
+    # All the checks and the insert are one statement, see `AsyncSamplesManager.ingest`.
+    # `weather` of the request is only a flag, the weather itself is fetched in the background.
+    ingested = await AsyncDBM.samples.ingest(qr_hex=create_request.qr_hex,
+                                             research_id=create_request.research_id,
+                                             owner_id=token_payload.id,
+                                             collected_at=create_request.collected_at,
+                                             gps=create_request.gps,
+                                             user_comment=create_request.user_comment,
+                                             log=False)
+    exception = ingest_verdict_exception(ingested, create_request, token_payload.id)
+    if exception:
+        raise exception
+    dbm_new_sample_id = ingested['sample_id']
+    DBM.enqueue_sample_enrichment(dbm_new_sample_id)
     
-    if dbm_research['approval_required']:
-        user_researches = DBM.users.get_user_participated_researches(token_payload.id)
-        if not dbm_research['id'] in user_researches:
-            raise HTTPForbiddenException(msg=f"User does not participate in research",data={'research_id': dbm_research['id'],'user_id': token_payload.id})
-        
-    if not dbm_research['status'] != 'ongoing':
-        raise HTTPConflictException(msg='Research is not in ongoing status',data={'research_id': dbm_research['id']})
+    return JSONResponse(status_code=status.HTTP_200_OK, content = {'id': dbm_new_sample_id})
+
+
+@router.post('/samples/batch',
+             response_model=list[BatchSampleResult],
+             tags=['samples'])
+async def create_samples_batch(
+    create_requests: Annotated[list[CreateSampleRequest], Body(min_length=1, max_length=MAX_SAMPLES_PER_BATCH)],
+    token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)]
+):
+    """
+    Submits many samples at once, e.g. collected offline. Every item is checked like in `POST /samples`;
+    the valid ones are collected, the invalid ones are reported with the status code and detail
+    `POST /samples` would have responded with.
+    """
+    ingested = await AsyncDBM.samples.ingest_many(token_payload.id, create_requests, log=False)
+    results = []
+    for index, (create_request, item) in enumerate(zip(create_requests, ingested)):
+        exception = ingest_verdict_exception(item, create_request, token_payload.id)
+        if exception:
+            results.append({'index': index, 'id': None, 'status_code': exception.status_code, 'detail': exception.detail})
+            continue
+        DBM.enqueue_sample_enrichment(item['sample_id'])
+        results.append({'index': index, 'id': item['sample_id'], 'status_code': status.HTTP_200_OK, 'detail': None})
+    return JSONResponse(status_code=status.HTTP_200_OK, content=results)
+
+
+@router.put('/samples/{sample_id}/photo',
+            tags=['samples'],
+            responses=generate_responses(
+                samples_responses.SampleNotFoundResponse,
+                samples_responses.SampleNotOwnerResponse
+                )
+            )
+async def upload_sample_photo(
+    sample_id: int,
+    request: Request,
+    token_payload: Annotated[TokenPayload, Depends(get_volunteer_or_admin)],
+    content_type: Annotated[str | None, Header()] = None
+):
+    try:
+        dbm_sample = await AsyncDBM.samples.get_info(sample_id, fields={'owner_id'})
+    except NoSampleException:
+        raise HTTPNotFoundException(msg=f'Sample not found',data={'sample_id': sample_id})
+    if dbm_sample['owner_id'] != token_payload.id:
+        raise HTTPForbiddenException(msg=f'Sample owner differs from autorized user', data={'sample_id': sample_id, 'user_id': token_payload.id})
+
+    # The body is hashed and spooled to the store chunk by chunk, never held in memory as a whole.
+    # The file I/O runs in the threadpool, so slow disks don't stall the event loop
+    writer = await run_in_threadpool(DBM.photos.writer)
+    with writer:
+        async for chunk in request.stream():
+            await run_in_threadpool(writer.write, chunk)
+            if writer.size > MAX_PHOTO_SIZE:
+                raise CustomHTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                          msg='Photo is too large',
+                                          data={'max_photo_size': MAX_PHOTO_SIZE})
+        photo_ref, photo_size = await run_in_threadpool(writer.commit)
+
+    await AsyncDBM.samples.set_photo(sample_id, photo_ref, photo_size, content_type)
+    return JSONResponse(status_code=status.HTTP_200_OK, content={'id': sample_id, 'photo_ref': photo_ref, 'photo_size': photo_size})
 
+
+@router.get('/samples/{sample_id}/photo',
+            tags=['samples'],
+            response_class=StreamingResponse,
+            responses=generate_responses(
+                samples_responses.SampleNotFoundResponse,
+                samples_responses.SampleNotOwnerResponse,
+                samples_responses.SamplePhotoNotFoundResponse
+                )
+            )
+async def get_sample_photo(
+    sample_id: int,
+    token_payload: Annotated[TokenPayload, Depends(get_current_user)],
+    range_header: Annotated[str | None, Header(alias='Range')] = None
+):
     try:
-        dbm_qr_info = DBM.samples.get_qr_info(create_request.qr_hex)
-    except NoQrCodeException:
-        raise HTTPNotFoundException(msg=f'Qr not found',data={'qr_hex': create_request.qr_hex})
+        dbm_sample = await AsyncDBM.samples.get_info(sample_id, fields={'owner_id'})
+    except NoSampleException:
+        raise HTTPNotFoundException(msg=f'Sample not found',data={'sample_id': sample_id})
+    if not is_admin(token_payload) and dbm_sample['owner_id'] != token_payload.id or is_observer(token_payload):
+        raise HTTPForbiddenException(msg=f'Sample owner differs from autorized user')
 
-    if dbm_qr_info['is_used']:
-        raise HTTPConflictException(msg=f'Qr is already used',data={'qr_hex': create_request.qr_hex})
-    
-    if not dbm_qr_info['kit_id']:
-        raise HTTPConflictException(msg=f'Qr is not assigned to any kit',data={'qr_hex': create_request.qr_hex})
-    
+    photo_meta = await AsyncDBM.samples.get_photo_meta(sample_id)
+    if not photo_meta:
+        raise HTTPNotFoundException(msg=f'Sample has no photo', data={'sample_id': sample_id})
+
+    photo_ref, photo_size = photo_meta['photo_ref'], photo_meta['photo_size']
+    headers = {'Accept-Ranges': 'bytes', 'ETag': f'"{photo_ref}"'}
+    media_type = photo_meta['photo_content_type'] or 'application/octet-stream'
     try:
-        dbm_kit = DBM.kits.get_info(dbm_qr_info['kit_id'])
-    except NoQrCodeException:
-        raise HTTPNotFoundException(msg=f'Kit not found (very strange)',data={'kit_id': dbm_qr_info['kit_id']})
-    
-    if not dbm_kit['owner']:
-        raise HTTPForbiddenException(msg=f'Kit is not assigned to any user',data={'kit_id': dbm_qr_info['kit_id']})
-    
-    if not dbm_kit['owner']['id'] == token_payload.id:
-        raise HTTPForbiddenException(msg=f"User does not own kit",data={'kit_id': dbm_qr_info['kit_id'],'user_id': token_payload.id})
-    
-    if not dbm_kit['status'] == 'activated':
-        raise HTTPConflictException(msg=f"Kit hasn't been activated",data={'kit_id': dbm_kit["id"]})
-
-
-    dbm_new_sample_id = DBM.samples.new(qr_id=int(dbm_qr_info['id']), 
-                        research_id=int(dbm_research['id']), 
-                        owner_id = int(token_payload.id),
-                        collected_at=create_request.collected_at,
-                        gps=create_request.gps,
-                        weather=create_request.weather, 
-                        user_comment=create_request.user_comment,
-                        photo_hex_string = create_request.photo_hex_string,
-                        log = False)
-    
-    return JSONResponse(status_code=status.HTTP_200_OK, content = {'id': dbm_new_sample_id})
-        
-    
\ No newline at end of file
+        byte_range = parse_range_header(range_header, photo_size)
+    except ValueError:
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                        headers={'Content-Range': f'bytes */{photo_size}'})
+
+    if byte_range is None:
+        headers['Content-Length'] = str(photo_size)
+        return StreamingResponse(DBM.photos.read(photo_ref), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{photo_size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(DBM.photos.read(photo_ref, start, end),
+                             status_code=status.HTTP_206_PARTIAL_CONTENT,
+                             media_type=media_type,
+                             headers=headers)
@@ -40,6 +40,15 @@ class SendKitRequest(BaseModel):
 class CreateKitRequest(BaseModel):
     n_qrs : int
 
+class CreateKitsBatchRequest(BaseModel):
+    n_kits : int
+    n_qrs : int
+
+class CreatedKit(BaseModel):
+    id: int
+    unique_hex: str
+    qrs: list[QR]
+
 class KitsCreatedByAdminResponse(BaseModel):
     id: int
     n_qrs: int
@@ -34,6 +34,7 @@ class SampleInfo(SampleBase):
     gps: GpsModel | None
     weather: bool | None
     comment: str | None
+    toponym: str | None = None
     photo: bool | None
 
 
@@ -49,5 +50,11 @@ class CreateSampleRequest(BaseModel):
     user_comment: str | None = None
     photo_hex_string: str | None = None
 
+class BatchSampleResult(BaseModel):
+    index: int
+    id: int | None
+    status_code: int
+    detail: dict | None = None
+
 class MySample(BaseModel):
     sample_id: int
\ No newline at end of file
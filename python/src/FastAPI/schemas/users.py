@@ -8,8 +8,9 @@ class UserBase(BaseModel):
     name: str
 
 class UserResponse(UserBase):
-    status: int
-    created_at: datetime
+    # Role name and creation time come from auth_backend, `None` when it doesn't know the user
+    status: str | None
+    created_at: datetime | None
     updated_at: datetime
     n_samples_collected: int
 
@@ -0,0 +1,109 @@
+"""
+Production entry point, run from the repo root:
+
+    python python/src/FastAPI/server.py
+
+Serves the API from `WEB_WORKERS` uvicorn processes (uvloop + httptools) and runs
+the `core.new_user` consumer in a process of its own, restarted if it dies.
+On SIGTERM/SIGINT the workers stop accepting connections and get `WEB_GRACEFUL_TIMEOUT`
+seconds to finish the requests in flight; messages the consumer hasn't acked are redelivered.
+`main.py` is still the single-process development server with autoreload.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEB_HOST, WEB_PORT, WEB_WORKERS, WEB_GRACEFUL_TIMEOUT
+from config import DB_CONNECTIONS_BUDGET, DB_POOL_MAX_SIZE, ASYNC_DB_POOL_MAX_SIZE, NEW_USER_WORKERS
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def run_new_user_consumer():
+    from mq import start_consuming
+    asyncio.run(start_consuming())
+
+
+class SupervisedProcess:
+    """
+    Keeps `target` running in a child process, restarting it with a growing delay
+    (reset once it stays up for `stable_after` seconds) until `stop` is called.
+    """
+    def __init__(self, target, name, restart_delay=1.0, max_restart_delay=60.0, stable_after=60.0):
+        self.target = target
+        self.name = name
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+        self.process = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name=f"{name}-supervisor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _watch(self):
+        delay = self.restart_delay
+        while not self._stopping.is_set():
+            self.process = multiprocessing.Process(target=self.target, name=self.name)
+            self.process.start()
+            started_at = time.monotonic()
+            self.process.join()
+            if self._stopping.is_set():
+                break
+            if time.monotonic() - started_at > self.stable_after:
+                delay = self.restart_delay
+            logger.error(f"{self.name} exited with code {self.process.exitcode}, restarting in {delay:.0f}s")
+            self._stopping.wait(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        process = self.process
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self._thread.join(timeout)
+
+
+def check_db_connections():
+    """
+    Exits if the workers' pools, their listeners and the consumer may together open
+    more connections than `DB_CONNECTIONS_BUDGET` (`WEB_WORKERS` or pool sizes set too high).
+    """
+    needed = WEB_WORKERS * (DB_POOL_MAX_SIZE + ASYNC_DB_POOL_MAX_SIZE + 1) + NEW_USER_WORKERS
+    if needed > DB_CONNECTIONS_BUDGET:
+        sys.exit(f"{WEB_WORKERS} workers with pools of {DB_POOL_MAX_SIZE} + {ASYNC_DB_POOL_MAX_SIZE} connections "
+                 f"and the consumer may open {needed} db connections, over DB_CONNECTIONS_BUDGET={DB_CONNECTIONS_BUDGET}")
+
+
+def main():
+    check_db_connections()
+    consumer = SupervisedProcess(run_new_user_consumer, "new-user-consumer")
+    consumer.start()
+    try:
+        # Each worker imports `main:app` anew and builds its own db pools, see `DB_CONNECTIONS_BUDGET`
+        uvicorn.run("main:app",
+                    host=WEB_HOST,
+                    port=WEB_PORT,
+                    workers=WEB_WORKERS,
+                    loop="uvloop",
+                    http="httptools",
+                    proxy_headers=True,
+                    timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT)
+    finally:
+        consumer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -36,8 +36,8 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Tok
         username: str = payload.get("username")
         if username is None:
             raise credentials_exception
-        from db_manager import DBM
-        DBM.users.has(username)
+        from db_manager import AsyncDBM
+        await AsyncDBM.users.has_cached(username)
     except jwt.ExpiredSignatureError:
         raise expired_exception
     except jwt.InvalidTokenError as error:
@@ -80,6 +80,54 @@ async def get_observer(token: Annotated[TokenPayload, Depends(get_current_user)]
         raise HTTPNotEnoughPermissionsException(detail='Not enough permissions. Only observers can perform this action.')
     return token
 
+def next_cursor_headers(page: list[dict], limit: int) -> dict[str, str]:
+    """
+    A full page may be followed by another one: the client passes
+    `X-Next-Cursor` back as `after` to continue listing.
+    """
+    if len(page) < limit:
+        return {}
+    return {"X-Next-Cursor": str(page[-1]['id'])}
+
+def parse_fields(fields: str | None, allowed) -> set[str] | None:
+    """
+    Parses a `?fields=a,b,c` projection. `None` means all the fields.
+    """
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}")
+    return requested
+
+def parse_range_header(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single `bytes=` range of a `Range` header into inclusive `(start, end)`.
+    Returns `None` for a missing, multi-part or invalid header, which is ignored (RFC 9110 14.2)
+    and answered with the whole body; raises `ValueError` for a valid range that can't be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, dash, last = range_header[len("bytes="):].strip().partition("-")
+    if not dash or not (first or last) or not all(part.isascii() and part.isdigit() for part in (first, last) if part):
+        return None
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise ValueError(range_header)
+        start = max(size - suffix_length, 0)
+        end = size - 1
+    if start >= size:
+        raise ValueError(range_header)
+    return start, min(end, size - 1)
+
 def validate_return_from_db(data,
                       search_param_name,
                       search_param_value,
@@ -93,12 +141,3 @@ def validate_return_from_db(data,
         raise exception(f"Can't find {key} using {search_param_name} with {search_param_value}.")
     return value
 
-
-from geopy.geocoders import Nominatim
-def get_closest_toponym(lat, lon):
-    geolocator = Nominatim(user_agent="Biokeeper")
-    try:
-        location = geolocator.reverse(f"{lat}, {lon}")
-        return location.raw['display_name']
-    except Exception as e:
-        return f"{lat},{lon}"
\ No newline at end of file
@@ -0,0 +1,97 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 6) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, n_bits, even = 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits << 1 | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            geohash.append(_GEOHASH_BASE32[bits])
+            bits, n_bits = 0, 0
+    return "".join(geohash)
+
+
+def geohash_center(geohash: str) -> tuple[float, float]:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class Geocoder(ABC):
+    @abstractmethod
+    def reverse(self, latitude: float, longitude: float) -> str | None:
+        """
+        Name of the place at the coordinates, None if it can't be resolved now.
+        """
+        pass
+
+
+class StubGeocoder(Geocoder):
+    """
+    Offline backend: the "toponym" is just the coordinates.
+    """
+    def reverse(self, latitude: float, longitude: float) -> str | None:
+        return f"{latitude:.5f},{longitude:.5f}"
+
+
+class NominatimGeocoder(Geocoder):
+    """
+    OpenStreetMap Nominatim. One client is reused and requests are spaced
+    by `min_interval` seconds, as the public instance allows 1 request/s.
+    """
+    def __init__(self, user_agent="Biokeeper", min_interval=1.0, timeout=10):
+        from geopy.geocoders import Nominatim
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def reverse(self, latitude: float, longitude: float) -> str | None:
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                location = self.geolocator.reverse(f"{latitude}, {longitude}")
+            except Exception:
+                return None
+            finally:
+                self._last_request = time.monotonic()
+        if location is None:
+            return None
+        display_name = location.raw['display_name']
+        # Dropping the region, the district, the postcode and the country
+        return ', '.join(part.strip() for part in display_name.split(",")[:-4]) or display_name
+
+
+def make_geocoder(backend: str) -> Geocoder:
+    if backend == "nominatim":
+        return NominatimGeocoder()
+    if backend == "stub":
+        return StubGeocoder()
+    raise ValueError(f"Unknown geocoder backend '{backend}'")
@@ -1,22 +1,119 @@
+import atexit
 import datetime
+import json
+import queue
+import sys
+import threading
+
+from config import LOG_LEVEL
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
 
 class AlwaysFalseString(str):
     def __new__(cls, value):
         return super(AlwaysFalseString, cls).__new__(cls, value)
-    
+
     def __bool__(self):
         return False
 
 
-class Logger:
+class _LogWriter:
+    """
+    Background thread appending the records queued for one log file.
+    Whatever piled up since the last write goes out with a single `write`.
+    """
+    _CLEAR = object()
+
     def __init__(self, log_file):
         self.log_file = log_file
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{log_file}", daemon=True)
+        self._thread.start()
+
+    def put(self, line: str):
+        self._queue.put(line)
+
+    def clear(self):
+        self._queue.put(self._CLEAR)
+
+    def flush(self):
+        """
+        Blocks until everything queued so far is written.
+        """
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(items)
+            except OSError as e:
+                print(f"Can't write to {self.log_file}: {e!r}", file=sys.stderr)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _write(self, items):
+        mode, lines = "a", []
+        for item in items:
+            if item is self._CLEAR:
+                mode, lines = "w", []
+            else:
+                lines.append(item)
+        with open(self.log_file, mode) as f:
+            f.write("".join(line + "\n" for line in lines))
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def _writer_for(log_file) -> _LogWriter:
+    with _writers_lock:
+        if log_file not in _writers:
+            _writers[log_file] = _LogWriter(log_file)
+        return _writers[log_file]
+
+@atexit.register
+def flush_logs():
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+class Logger:
+    """
+    Writes JSON lines `{"time", "level", "msg", ...}` through a background writer shared
+    by all the loggers of the file, so `log` never waits for the disk.
+
+    The level is taken from the "Info :"/"Error:" prefix of the message unless given;
+    records below `level` are dropped. Structured fields (`entity`, `id`, `action`,
+    `duration`, ...) are passed as keyword arguments.
+    """
+    def __init__(self, log_file, level=LOG_LEVEL):
+        self.log_file = log_file
+        self.level = LEVELS[level.lower()]
+        self._writer = _writer_for(log_file)
 
-    def log(self, msg, return_value=None):
-        with open(self.log_file, "a") as f:
-            print(datetime.datetime.now(), msg, file=f)
+    @staticmethod
+    def _level_of(msg) -> str:
+        prefix = str(msg).split(":", 1)[0].strip().lower()
+        return prefix if prefix in LEVELS else "info"
+
+    def log(self, msg, return_value=None, level=None, **fields):
+        level = level or self._level_of(msg)
+        if LEVELS[level] >= self.level:
+            record = {"time": datetime.datetime.now().astimezone().isoformat(), "level": level, "msg": str(msg)}
+            record.update((key, value) for key, value in fields.items() if value is not None)
+            self._writer.put(json.dumps(record, default=str, ensure_ascii=False))
         return AlwaysFalseString(msg)
 
+    def flush(self) -> None:
+        self._writer.flush()
+
     def clear_logs(self) -> None:
-        with open(self.log_file, "w") as f:
-            return
+        self._writer.clear()
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+
+class PhotoWriter(ABC):
+    """
+    Incremental upload of one photo. Chunks are hashed while they are written,
+    `commit()` returns `(photo_ref, size)`.
+    """
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.hash.update(chunk)
+        self.size += len(chunk)
+        self._write(chunk)
+
+    @abstractmethod
+    def _write(self, chunk: bytes):
+        pass
+
+    @abstractmethod
+    def commit(self) -> tuple[str, int]:
+        pass
+
+    @abstractmethod
+    def abort(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+
+
+class PhotoStore(ABC):
+    """
+    Content-addressed storage of sample photos: a photo is referenced by the
+    sha256 hex digest of its bytes, so identical uploads are stored once.
+    """
+    @abstractmethod
+    def writer(self) -> PhotoWriter:
+        pass
+
+    @abstractmethod
+    def has(self, photo_ref: str) -> bool:
+        pass
+
+    @abstractmethod
+    def size(self, photo_ref: str) -> int:
+        pass
+
+    @abstractmethod
+    def read(self, photo_ref: str, start: int = 0, end: int | None = None, chunk_size: int = 64 * 1024):
+        """
+        Yields the bytes `start..end` (inclusive) of the photo in chunks.
+        """
+        pass
+
+    def put(self, chunks) -> tuple[str, int]:
+        with self.writer() as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+            return writer.commit()
+
+
+class _LocalPhotoWriter(PhotoWriter):
+    def __init__(self, store: "LocalPhotoStore"):
+        super().__init__()
+        self.store = store
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self.file = os.fdopen(fd, "wb")
+
+    def _write(self, chunk: bytes):
+        self.file.write(chunk)
+
+    def commit(self) -> tuple[str, int]:
+        self.file.close()
+        photo_ref = self.hash.hexdigest()
+        path = self.store._path(photo_ref)
+        if os.path.exists(path):
+            # Deduplication: the very same photo is already stored
+            os.remove(self.tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.tmp_path, path)
+        return photo_ref, self.size
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class LocalPhotoStore(PhotoStore):
+    """
+    Keeps photos in a directory tree `root/ab/cd/abcd...` on the local filesystem.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def _path(self, photo_ref: str) -> str:
+        if len(photo_ref) != 64 or any(c not in "0123456789abcdef" for c in photo_ref):
+            raise ValueError(f"Invalid photo reference '{photo_ref}'")
+        return os.path.join(self.root, photo_ref[:2], photo_ref[2:4], photo_ref)
+
+    def writer(self) -> PhotoWriter:
+        return _LocalPhotoWriter(self)
+
+    def has(self, photo_ref: str) -> bool:
+        return os.path.exists(self._path(photo_ref))
+
+    def size(self, photo_ref: str) -> int:
+        return os.path.getsize(self._path(photo_ref))
+
+    def read(self, photo_ref: str, start: int = 0, end: int | None = None, chunk_size: int = 64 * 1024):
+        with open(self._path(photo_ref), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+
+def make_photo_store(backend: str, path: str) -> PhotoStore:
+    if backend == "local":
+        return LocalPhotoStore(path)
+    raise ValueError(f"Unknown photo store backend '{backend}'")
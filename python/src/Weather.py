@@ -25,7 +25,11 @@ class Weather:
             "uv_index"
         ]
 
-    def weather_request(self, location: tuple[float, float], timestamp: datetime.datetime):
+    def hourly_frame(self, location: tuple[float, float], start_date: datetime.date, end_date: datetime.date):
+        """
+        Hourly weather at `location` for the whole days `start_date..end_date` as a DataFrame
+        with a `local_date` column (the day in the timezone of the location), or None.
+        """
         params = {
             "latitude": location[0],
             "longitude": location[1],
@@ -33,8 +37,8 @@ class Weather:
             "wind_speed_unit": "ms",
             "timeformat": "unixtime",
             "timezone": "auto",
-            "start_date": (timestamp-pd.Timedelta(days=self.past_days)).strftime("%Y-%m-%d"),
-            "end_date": timestamp.strftime("%Y-%m-%d")
+            "start_date": start_date.strftime("%Y-%m-%d"),
+            "end_date": end_date.strftime("%Y-%m-%d")
         }
         try:
             responses = self.openmeteo.weather_api(self.api_url, params=params)
@@ -57,6 +61,28 @@ class Weather:
                 "uv_index": hourly.Variables(7).ValuesAsNumpy()
             }
             hourly_dataframe = pd.DataFrame(data=hourly_data)
-            return hourly_dataframe.to_json()
+            local_dates = hourly_dataframe["date"] + pd.Timedelta(seconds=response.UtcOffsetSeconds())
+            hourly_dataframe["local_date"] = local_dates.dt.date
+            return hourly_dataframe
         except ConnectionError as e:  # for offline testing
             return None
+
+    def window_of(self, timestamp: datetime.datetime) -> tuple[datetime.date, datetime.date]:
+        """
+        Days of weather kept for a sample collected at `timestamp`.
+        """
+        return (timestamp-pd.Timedelta(days=self.past_days)).date(), timestamp.date()
+
+    def slice_window(self, hourly_dataframe, timestamp: datetime.datetime):
+        """
+        Weather JSON of a single sample cut out of a frame that covers its window.
+        """
+        start_date, end_date = self.window_of(timestamp)
+        in_window = (hourly_dataframe["local_date"] >= start_date) & (hourly_dataframe["local_date"] <= end_date)
+        return hourly_dataframe.loc[in_window].drop(columns="local_date").reset_index(drop=True).to_json()
+
+    def weather_request(self, location: tuple[float, float], timestamp: datetime.datetime):
+        hourly_dataframe = self.hourly_frame(location, *self.window_of(timestamp))
+        if hourly_dataframe is None:
+            return None
+        return hourly_dataframe.drop(columns="local_date").to_json()
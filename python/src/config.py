@@ -7,5 +7,111 @@ RABBITMQ_CORE_PASS = os.getenv('RABBITMQ_CORE_PASS')
 
 PASSWORD_FOR_FASTAPI_DOCS = os.environ['PASSWORD_FOR_FASTAPI_DOCS']
 
+# Records below this level ('debug', 'info', 'warning', 'error') aren't written
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'info')
 
-MAX_NUMBER_OF_QRS = 100
\ No newline at end of file
+# Debug mode: every response carries the db work of its request in `X-DB-*` headers
+DEBUG = os.getenv('DEBUG', '').lower() in ('1', 'true', 'yes')
+
+AUTH_BACKEND_URL = os.getenv('AUTH_BACKEND_URL', 'http://auth_backend:8000')
+AUTH_BACKEND_TIMEOUT = float(os.getenv('AUTH_BACKEND_TIMEOUT', 10))
+
+# Per-process cache of user roles and creation dates fetched from auth_backend
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10_000))
+USER_ROLE_CACHE_TTL = float(os.getenv('USER_ROLE_CACHE_TTL', 60))
+USER_CREATED_AT_CACHE_TTL = float(os.getenv('USER_CREATED_AT_CACHE_TTL', 24 * 60 * 60))
+# Users are never deleted here, so a known user name stays known for long
+USER_EXISTS_CACHE_TTL = float(os.getenv('USER_EXISTS_CACHE_TTL', 24 * 60 * 60))
+# A user auth_backend doesn't know (or can't answer about) has `None` role/created_at for this long
+USER_LOOKUP_FAILURE_TTL = float(os.getenv('USER_LOOKUP_FAILURE_TTL', 10))
+
+# Per-process cache of verified access tokens; an entry never outlives the token's `exp`
+JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 10_000))
+JWT_CACHE_MAX_TTL = float(os.getenv('JWT_CACHE_MAX_TTL', 15 * 60))
+
+# Per-process cache of research, kit and sample info. Writes of any process invalidate it
+# through db notifications (see `ChangeListener`), the TTL is only a safety net
+INFO_CACHE_SIZE = int(os.getenv('INFO_CACHE_SIZE', 10_000))
+INFO_CACHE_TTL = float(os.getenv('INFO_CACHE_TTL', 10 * 60))
+
+
+MAX_NUMBER_OF_QRS = 100
+
+# Kits of one POST /kits/batch, and the QRs of each of them there
+MAX_KITS_PER_BATCH = int(os.getenv('MAX_KITS_PER_BATCH', 500))
+MAX_NUMBER_OF_QRS_IN_BATCH = int(os.getenv('MAX_NUMBER_OF_QRS_IN_BATCH', 1000))
+
+# Items of one POST /samples/batch
+MAX_SAMPLES_PER_BATCH = int(os.getenv('MAX_SAMPLES_PER_BATCH', 500))
+
+# Keyset pagination of the collection endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Sample photos live in a content-addressed store, the sample row only references them
+PHOTO_STORE_BACKEND = os.getenv('PHOTO_STORE_BACKEND', 'local')
+PHOTO_STORE_PATH = os.getenv('PHOTO_STORE_PATH', 'photos')
+MAX_PHOTO_SIZE = int(os.getenv('MAX_PHOTO_SIZE', 20 * 1024 * 1024))
+
+# Background weather enrichment of new samples
+WEATHER_WORKERS = int(os.getenv('WEATHER_WORKERS', 2))
+WEATHER_BATCH_SIZE = int(os.getenv('WEATHER_BATCH_SIZE', 100))
+WEATHER_BATCH_WAIT = float(os.getenv('WEATHER_BATCH_WAIT', 2))
+WEATHER_GRID_DEGREES = float(os.getenv('WEATHER_GRID_DEGREES', 0.1))
+WEATHER_WINDOW_DAYS = int(os.getenv('WEATHER_WINDOW_DAYS', 7))
+# Failed weather/toponym lookups are retried in process, then left to the periodic sweep
+# of samples that are still missing them (created more than GRACE and less than MAX_AGE seconds ago)
+ENRICHMENT_MAX_RETRIES = int(os.getenv('ENRICHMENT_MAX_RETRIES', 3))
+ENRICHMENT_RETRY_DELAY = float(os.getenv('ENRICHMENT_RETRY_DELAY', 30))
+ENRICHMENT_SWEEP_INTERVAL = float(os.getenv('ENRICHMENT_SWEEP_INTERVAL', 10 * 60))
+ENRICHMENT_SWEEP_GRACE = float(os.getenv('ENRICHMENT_SWEEP_GRACE', 5 * 60))
+ENRICHMENT_SWEEP_MAX_AGE = float(os.getenv('ENRICHMENT_SWEEP_MAX_AGE', 30 * 24 * 60 * 60))
+ENRICHMENT_SWEEP_LIMIT = int(os.getenv('ENRICHMENT_SWEEP_LIMIT', 1000))
+
+# Background reverse geocoding of new samples: 'nominatim' or 'stub' (offline)
+GEOCODER_BACKEND = os.getenv('GEOCODER_BACKEND', 'nominatim')
+TOPONYM_GEOHASH_PRECISION = int(os.getenv('TOPONYM_GEOHASH_PRECISION', 6))
+
+# core.new_user consumer: unacked deliveries, insert workers and their batches
+NEW_USER_PREFETCH = int(os.getenv('NEW_USER_PREFETCH', 500))
+NEW_USER_WORKERS = int(os.getenv('NEW_USER_WORKERS', 2))
+NEW_USER_BATCH_SIZE = int(os.getenv('NEW_USER_BATCH_SIZE', 200))
+NEW_USER_BATCH_WAIT = float(os.getenv('NEW_USER_BATCH_WAIT', 0.2))
+MQ_STATS_INTERVAL = float(os.getenv('MQ_STATS_INTERVAL', 60))
+
+# API server processes, see FastAPI/server.py
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', 1337))
+# Seconds in-flight requests get to finish on shutdown
+WEB_GRACEFUL_TIMEOUT = float(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+
+# Db connections the workers and the consumer may hold together, keep it below the db's `max_connections`.
+# The consumer takes one per insert worker. Each worker sizes its pools from its share of the rest,
+# less the one its `ChangeListener` keeps LISTENing. The sync pool holds at least a connection per thread
+# that uses it at once (weather and toponym workers, their sweeps), the async one `ASYNC_DB_POOL_MIN_SIZE`
+DB_CONNECTIONS_BUDGET = int(os.getenv('DB_CONNECTIONS_BUDGET', 80))
+_CONSUMER_DB_CONNECTIONS = NEW_USER_WORKERS
+_SYNC_DB_CONNECTIONS_FLOOR = WEATHER_WORKERS + 1 + 2  # toponym worker, the weather and toponym sweeps
+_ASYNC_DB_CONNECTIONS_FLOOR = int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', 2))
+_WORKER_DB_CONNECTIONS_FLOOR = _SYNC_DB_CONNECTIONS_FLOOR + _ASYNC_DB_CONNECTIONS_FLOOR + 1
+
+# One per core by default, as many as the budget gives their floor to
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', max(1, min(os.cpu_count() or 1,
+    (DB_CONNECTIONS_BUDGET - _CONSUMER_DB_CONNECTIONS) // _WORKER_DB_CONNECTIONS_FLOOR))))
+_WORKER_DB_CONNECTIONS = (DB_CONNECTIONS_BUDGET - _CONSUMER_DB_CONNECTIONS) // WEB_WORKERS - 1
+_WORKER_SYNC_DB_CONNECTIONS = max(_SYNC_DB_CONNECTIONS_FLOOR, _WORKER_DB_CONNECTIONS // 4)
+
+# Per-process pool of db connections, shared by all the managers of a DBManager
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', _WORKER_SYNC_DB_CONNECTIONS))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30))
+
+# asyncpg pool of the routers, see `AsyncDBManager`
+ASYNC_DB_POOL_MIN_SIZE = _ASYNC_DB_CONNECTIONS_FLOOR
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE',
+    max(_ASYNC_DB_CONNECTIONS_FLOOR, _WORKER_DB_CONNECTIONS - _WORKER_SYNC_DB_CONNECTIONS)))
+
+# Processes of one server share their metrics through snapshots in this directory, see FastAPI/metrics.py
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', 5))
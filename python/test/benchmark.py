@@ -0,0 +1,387 @@
+"""
+Load test of the API against a local Postgres, run from the repo root:
+
+    python python/test/benchmark.py --reset --samples 100000 --requests 20000 --concurrency 32
+
+`--reset` (re)creates the `--db-name` database from `postgres/init_scripts` and seeds it with
+synthetic users, researches, kits, QRs and samples scaled from `--samples` (10k .. 10M).
+Then a weighted mix of endpoint calls (`--mix`) is replayed in process through the ASGI app,
+with JWTs signed by a throwaway RSA key, and auth_backend, weather and geocoder stubbed out.
+Reports p50/p99 latency, throughput and db queries per endpoint; `--json` saves them.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import jwt
+import psycopg2
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+INIT_SCRIPTS = 'postgres/init_scripts'
+QRS_PER_KIT = 10
+
+DEFAULT_MIX = {
+    "GET /samples/{id}": 30,
+    "GET /kits/{id}": 15,
+    "POST /samples": 15,
+    "GET /researches/{id}": 10,
+    "GET /samples?research_id": 10,
+    "GET /me/samples": 10,
+    "GET /researches": 5,
+    "GET /users/{id}": 5,
+}
+
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PUBLIC_KEY = PRIVATE_KEY.public_key().public_bytes(serialization.Encoding.PEM,
+                                                   serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db-host', default='localhost')
+    parser.add_argument('--db-port', type=int, default=5432)
+    parser.add_argument('--db-user', default='postgres')
+    parser.add_argument('--db-pass', default='root')
+    parser.add_argument('--db-name', default='biokeeper_bench')
+    parser.add_argument('--reset', action='store_true', help='drop, recreate and seed the benchmark database')
+    parser.add_argument('--samples', type=int, default=10_000, help='seeded samples, the rest of the data is scaled from it')
+    parser.add_argument('--requests', type=int, default=5_000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mix', default=None, help='weights like "GET /kits/{id}=5,POST /samples=1" (default: DEFAULT_MIX)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='file to write the results to')
+    return parser.parse_args()
+
+
+class Scale:
+    def __init__(self, n_samples):
+        self.samples = n_samples
+        self.users = max(100, n_samples // 100)
+        self.researches = max(5, n_samples // 10_000)
+        # Half as many free QRs as used ones are left for POST /samples
+        self.kits = -(-n_samples * 3 // 2 // QRS_PER_KIT)
+        self.qrs = self.kits * QRS_PER_KIT
+
+    # The seeding below is deterministic, so the load generator can derive ownership
+    def kit_owner(self, kit_id):
+        return 1 + kit_id % self.users
+
+    def qr_kit(self, qr_id):
+        return 1 + (qr_id - 1) // QRS_PER_KIT
+
+    def qr_hex(self, qr_id):
+        return f"{qr_id:020x}"
+
+    def user_research(self, user_id):
+        return 1 + user_id % self.researches
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in ('samples', 'users', 'researches', 'kits', 'qrs')}
+
+
+def connect(args, db_name):
+    return psycopg2.connect(host=args.db_host, port=args.db_port, user=args.db_user, password=args.db_pass, dbname=db_name)
+
+
+def reset_db(args, scale: Scale):
+    conn = connect(args, 'postgres')
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{args.db_name}"')
+        cursor.execute(f'CREATE DATABASE "{args.db_name}"')
+    conn.close()
+
+    conn = connect(args, args.db_name)
+    with conn, conn.cursor() as cursor:
+        for script in sorted(os.listdir(INIT_SCRIPTS)):
+            if script.endswith('.sql'):
+                with open(os.path.join(INIT_SCRIPTS, script)) as f:
+                    cursor.execute(f.read())
+
+    started_at = time.perf_counter()
+    params = {'users': scale.users, 'researches': scale.researches, 'kits': scale.kits,
+              'qrs': scale.qrs, 'samples': scale.samples, 'qrs_per_kit': QRS_PER_KIT}
+    with conn, conn.cursor() as cursor:
+        # Bulk load without triggers and FK checks, the counters are rebuilt afterwards
+        cursor.execute("SET session_replication_role = replica")
+        cursor.execute("""
+            INSERT INTO "user" (id, name)
+            SELECT g, 'bench_user_' || g FROM generate_series(1, %(users)s) g
+        """, params)
+        cursor.execute("""
+            INSERT INTO "research" (id, name, status, created_by, day_start, approval_required)
+            SELECT g, 'bench_research_' || g, (SELECT id FROM research_statuses WHERE (details).key = 'ongoing'),
+                   1, DATE '2024-01-01', false
+            FROM generate_series(1, %(researches)s) g
+        """, params)
+        cursor.execute("""
+            INSERT INTO "user_research" (user_id, research_id)
+            SELECT g, 1 + g %% %(researches)s FROM generate_series(1, %(users)s) g
+        """, params)
+        cursor.execute("""
+            INSERT INTO "kit" (id, unique_hex, status, n_qrs, creator_id, owner_id)
+            SELECT g, lpad(to_hex(g), 16, '0'), (SELECT id FROM kit_statuses WHERE (details).key = 'activated'),
+                   %(qrs_per_kit)s, 1, 1 + g %% %(users)s
+            FROM generate_series(1, %(kits)s) g
+        """, params)
+        cursor.execute("""
+            INSERT INTO "qr" (id, unique_hex, kit_id, is_used)
+            SELECT g, lpad(to_hex(g), 20, '0'), 1 + (g - 1) / %(qrs_per_kit)s, g <= %(samples)s
+            FROM generate_series(1, %(qrs)s) g
+        """, params)
+        cursor.execute("""
+            INSERT INTO "sample" (id, research_id, qr_id, owner_id, collected_at, gps, comment)
+            SELECT g, 1 + o.owner_id %% %(researches)s, g, o.owner_id,
+                   TIMESTAMPTZ '2024-06-01' - g * INTERVAL '1 minute',
+                   point(50 + random() * 10, 30 + random() * 10), 'bench sample ' || g
+            FROM generate_series(1, %(samples)s) g,
+                 LATERAL (SELECT 1 + (1 + (g - 1) / %(qrs_per_kit)s) %% %(users)s AS owner_id) o
+        """, params)
+        cursor.execute("SET session_replication_role = DEFAULT")
+        for table in ('research', 'kit', 'qr', 'sample'):
+            cursor.execute(f"""SELECT setval(pg_get_serial_sequence('"{table}"', 'id'), (SELECT max(id) FROM "{table}"))""")
+        cursor.execute("""
+            UPDATE "user" u SET n_samples_collected = c.n
+            FROM (SELECT owner_id, count(*) AS n FROM "sample" GROUP BY owner_id) c
+            WHERE u.id = c.owner_id
+        """)
+        cursor.execute("""
+            UPDATE "research" r SET n_samples = c.n
+            FROM (SELECT research_id, count(*) AS n FROM "sample" GROUP BY research_id) c
+            WHERE r.id = c.research_id
+        """)
+        for table in ('research', 'kit', 'sample'):
+            cursor.execute(f"""
+                INSERT INTO status_counter_shards (statuses_table, status_id, shard, n)
+                SELECT '{table}_statuses', status, 0, count(*) FROM "{table}" GROUP BY status
+            """)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("VACUUM ANALYZE")
+    conn.close()
+    print(f"Seeded {scale.as_dict()} in {time.perf_counter() - started_at:.1f} s")
+
+
+def configure_environment(args):
+    """
+    Must run before the app is imported: `config` reads the environment at import time.
+    """
+    os.environ['JWT_PUBLIC_KEY'] = PUBLIC_KEY
+    os.environ.setdefault('PASSWORD_FOR_FASTAPI_DOCS', 'benchmark')
+    os.environ['GEOCODER_BACKEND'] = 'stub'
+    os.environ['AUTH_BACKEND_URL'] = 'http://auth-backend.stub'
+    os.environ.setdefault('WEB_WORKERS', '1')
+    os.environ.setdefault('LOG_LEVEL', 'error')
+    # Db work of every request comes back in the `X-DB-*` headers
+    os.environ['DEBUG'] = '1'
+    sys.path.append('python/src')
+    sys.path.append('python/src/FastAPI')
+
+    import DBManager
+    DBManager.LOGDATA.update({"db_name": args.db_name, "db_user": args.db_user, "db_pass": args.db_pass,
+                              "db_port": args.db_port, "db_host": args.db_host})
+
+
+def auth_backend_stub(path: str, params: dict):
+    """
+    Answers of auth_backend for the synthetic users: user #1 is the admin, the rest are volunteers.
+    """
+    def role(user_id):
+        return {'name': 'admin' if user_id == 1 else 'volunteer'}
+    created_at = '2024-01-01T00:00:00+00:00'
+    parts = path.strip('/').split('/')
+    if parts == ['users', 'bulk']:
+        ids = params.get('ids', [])
+        ids = [ids] if isinstance(ids, (int, str)) else ids
+        return [{'id': int(user_id), 'role': role(int(user_id)), 'created_at': created_at} for user_id in ids]
+    if parts[-1] == 'role':
+        return role(int(parts[1]))
+    return {'created_at': created_at}
+
+
+def weather_stub(location, start_date, end_date):
+    import pandas as pd
+    hours = pd.date_range(start_date, end_date + datetime.timedelta(days=1), freq="h", inclusive="left", tz="UTC")
+    return pd.DataFrame({"date": hours, "temperature_2m": 15.0, "local_date": hours.date})
+
+
+def install_stubs(DBM, AsyncDBM):
+    import httpx
+
+    def handler(request: httpx.Request):
+        params = {key: request.url.params.get_list(key) if key == 'ids' else value
+                  for key, value in request.url.params.items()}
+        return httpx.Response(200, json=auth_backend_stub(request.url.path, params))
+
+    DBM.users._auth_get = lambda path, **params: auth_backend_stub(path, params)
+    AsyncDBM.users._http = httpx.AsyncClient(base_url=AsyncDBM.users.auth_backend_url, transport=httpx.MockTransport(handler))
+    DBM.weather.hourly_frame = weather_stub
+
+
+class Workload:
+    def __init__(self, scale: Scale, mix: dict[str, float], rng: random.Random):
+        self.scale = scale
+        self.rng = rng
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.next_free_qr = scale.samples + 1
+        self._tokens = {}
+
+    def token(self, user_id):
+        if user_id not in self._tokens:
+            payload = {
+                'id': user_id,
+                'username': f'bench_user_{user_id}',
+                'role': {'id': 1 if user_id == 1 else 2, 'name': 'admin' if user_id == 1 else 'volunteer', 'info': ''},
+                'exp': int(time.time()) + 24 * 60 * 60,
+            }
+            self._tokens[user_id] = jwt.encode(payload, PRIVATE_KEY, algorithm='RS256')
+        return {'Authorization': f'Bearer {self._tokens[user_id]}'}
+
+    def random_user(self):
+        return self.rng.randint(2, self.scale.users)
+
+    def request(self, name):
+        """
+        `(method, url, kwargs)` of one call of the endpoint `name`, made on behalf of a user allowed to make it.
+        """
+        scale, rng = self.scale, self.rng
+        if name == "GET /samples/{id}":
+            sample_id = rng.randint(1, scale.samples)
+            return "GET", f"/samples/{sample_id}", {'headers': self.token(scale.kit_owner(scale.qr_kit(sample_id)))}
+        if name == "GET /kits/{id}":
+            kit_id = rng.randint(1, scale.kits)
+            return "GET", f"/kits/{kit_id}", {'headers': self.token(scale.kit_owner(kit_id))}
+        if name == "POST /samples":
+            if self.next_free_qr > scale.qrs:
+                raise RuntimeError("Out of free QRs, seed more samples or send fewer requests")
+            qr_id, self.next_free_qr = self.next_free_qr, self.next_free_qr + 1
+            owner_id = scale.kit_owner(scale.qr_kit(qr_id))
+            body = {
+                'research_id': scale.user_research(owner_id),
+                'qr_hex': scale.qr_hex(qr_id),
+                'collected_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'gps': {'latitude': rng.uniform(50, 60), 'longitude': rng.uniform(30, 40)},
+                'user_comment': 'benchmark',
+            }
+            return "POST", "/samples", {'headers': self.token(owner_id), 'json': body}
+        if name == "GET /researches/{id}":
+            return "GET", f"/researches/{rng.randint(1, scale.researches)}", {'headers': self.token(self.random_user())}
+        if name == "GET /samples?research_id":
+            params = {'research_id': rng.randint(1, scale.researches), 'limit': 100}
+            return "GET", "/samples", {'headers': self.token(1), 'params': params}
+        if name == "GET /me/samples":
+            return "GET", "/me/samples", {'headers': self.token(self.random_user())}
+        if name == "GET /researches":
+            return "GET", "/researches", {'headers': self.token(1), 'params': {'limit': 100}}
+        if name == "GET /users/{id}":
+            return "GET", f"/users/{rng.randint(1, scale.users)}", {'headers': self.token(1)}
+        raise ValueError(f"Unknown endpoint {name!r}, known: {', '.join(DEFAULT_MIX)}")
+
+    def pick(self):
+        return self.rng.choices(self.names, self.weights)[0]
+
+
+async def replay(client, workload: Workload, n_requests: int, concurrency: int, results: dict | None):
+    remaining = n_requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            name = workload.pick()
+            method, url, kwargs = workload.request(name)
+            started_at = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                ok, queries = response.status_code < 400, int(response.headers.get('X-DB-Queries', 0))
+            except Exception:
+                ok, queries = False, 0
+            elapsed = time.perf_counter() - started_at
+            if results is not None:
+                stats = results.setdefault(name, {'latencies': [], 'errors': 0, 'queries': 0})
+                stats['latencies'].append(elapsed)
+                stats['errors'] += not ok
+                stats['queries'] += queries
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def report(results: dict, wall_time: float) -> dict:
+    summary = {}
+    for name, stats in sorted(results.items()):
+        latencies = sorted(stats['latencies'])
+        summary[name] = {
+            'requests': len(latencies),
+            'errors': stats['errors'],
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'rps': round(len(latencies) / wall_time, 1),
+            'queries_per_request': round(stats['queries'] / len(latencies), 2),
+        }
+    total = sum(stats['requests'] for stats in summary.values())
+    header = f"{'endpoint':<26}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'req/s':>9}{'queries':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in summary.items():
+        print(f"{name:<26}{row['requests']:>9}{row['errors']:>8}{row['p50_ms']:>9}{row['p99_ms']:>9}"
+              f"{row['mean_ms']:>9}{row['rps']:>9}{row['queries_per_request']:>9}")
+    print(f"Total: {total} requests in {wall_time:.1f} s, {total / wall_time:.1f} req/s")
+    return summary
+
+
+async def run(args, scale: Scale, mix: dict):
+    import httpx
+    from main import app
+    from db_manager import DBM, AsyncDBM
+
+    install_stubs(DBM, AsyncDBM)
+    await AsyncDBM.load_statuses()
+
+    workload = Workload(scale, mix, random.Random(args.seed))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        await replay(client, workload, args.warmup, args.concurrency, None)
+        results = {}
+        started_at = time.perf_counter()
+        await replay(client, workload, args.requests, args.concurrency, results)
+        wall_time = time.perf_counter() - started_at
+
+    summary = report(results, wall_time)
+    await AsyncDBM.close()
+    DBM.close()
+    return summary, wall_time
+
+
+def main():
+    args = parse_args()
+    scale = Scale(args.samples)
+    mix = DEFAULT_MIX if args.mix is None else {
+        name.strip(): float(weight) for name, weight in (item.rsplit('=', 1) for item in args.mix.split(','))
+    }
+    if args.reset:
+        reset_db(args, scale)
+
+    configure_environment(args)
+    summary, wall_time = asyncio.run(run(args, scale, mix))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'scale': scale.as_dict(), 'concurrency': args.concurrency, 'wall_time': wall_time,
+                       'endpoints': summary}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
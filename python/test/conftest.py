@@ -0,0 +1,10 @@
+import os
+import sys
+
+# `config` requires these at import time; the unit tests touch neither JWTs nor the docs
+os.environ.setdefault('JWT_PUBLIC_KEY', 'unused')
+os.environ.setdefault('PASSWORD_FOR_FASTAPI_DOCS', 'unused')
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.append(SRC)
+sys.path.append(os.path.join(SRC, 'FastAPI'))
@@ -0,0 +1,115 @@
+"""
+Per-call overhead of resolving `has(identifier)` to its int or str implementation, run from the repo root:
+
+    python python/test/dispatch_benchmark.py --calls 1000000
+
+Compares the `multimethod` overloads the managers used to have with `identifier_dispatch`
+and with calling the typed method (`has_id`/`has_name`) directly, sync and async.
+The methods do no db work, so the numbers are the dispatch alone.
+The `multimethod` rows need `pip install multimethod`, it's no longer a dependency.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault('JWT_PUBLIC_KEY', 'unused')
+os.environ.setdefault('PASSWORD_FOR_FASTAPI_DOCS', 'unused')
+sys.path.append('python/src')
+sys.path.append('python/src/FastAPI')
+
+from DBM.ADBM import identifier_dispatch
+
+try:
+    from multimethod import multimethod
+except ImportError:
+    multimethod = None
+
+
+class Dispatched:
+    def has_id(self, research_id: int, log=False):
+        return research_id
+
+    def has_name(self, research_name: str, log=False):
+        return 1
+
+    has = identifier_dispatch(has_id, has_name)
+
+
+class AsyncDispatched:
+    async def has_id(self, research_id: int, log=False):
+        return research_id
+
+    async def has_name(self, research_name: str, log=False):
+        return 1
+
+    has = identifier_dispatch(has_id, has_name)
+
+
+if multimethod is not None:
+    class Overloaded:
+        @multimethod
+        def has(self, research_id: int, log=False):
+            return research_id
+
+        @multimethod
+        def has(self, research_name: str, log=False):
+            return 1
+
+    class AsyncOverloaded:
+        @multimethod
+        async def has(self, research_id: int, log=False):
+            return research_id
+
+        @multimethod
+        async def has(self, research_name: str, log=False):
+            return 1
+
+
+def time_sync(method, identifier, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        method(identifier)
+    return time.perf_counter() - started
+
+
+async def time_async(method, identifier, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await method(identifier)
+    return time.perf_counter() - started
+
+
+def cases():
+    sync, async_ = Dispatched(), AsyncDispatched()
+    yield "identifier_dispatch", "sync", sync.has, sync.has
+    yield "direct has_id/has_name", "sync", sync.has_id, sync.has_name
+    yield "identifier_dispatch", "async", async_.has, async_.has
+    yield "direct has_id/has_name", "async", async_.has_id, async_.has_name
+    if multimethod is not None:
+        sync, async_ = Overloaded(), AsyncOverloaded()
+        yield "multimethod", "sync", sync.has, sync.has
+        yield "multimethod", "async", async_.has, async_.has
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200_000, help='calls per identifier kind')
+    parser.add_argument('--repeat', type=int, default=5, help='the best of this many runs is reported')
+    args = parser.parse_args()
+
+    print(f"{'dispatch':<24} {'mode':<6} {'int ns/call':>12} {'str ns/call':>12}")
+    for name, mode, by_id, by_name in cases():
+        row = []
+        for method, identifier in ((by_id, 42), (by_name, "research")):
+            if mode == "sync":
+                best = min(time_sync(method, identifier, args.calls) for _ in range(args.repeat))
+            else:
+                best = min(asyncio.run(time_async(method, identifier, args.calls)) for _ in range(args.repeat))
+            row.append(best / args.calls * 1e9)
+        print(f"{name:<24} {mode:<6} {row[0]:>12.0f} {row[1]:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
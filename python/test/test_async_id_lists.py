@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from DBM.AsyncKitsManager import AsyncKitsManager
+from DBM.AsyncResearchesManager import AsyncResearchesManager
+from DBM.AsyncSamplesManager import AsyncSamplesManager
+from DBM.AsyncUsersManager import AsyncUsersManager
+
+
+class TwoRowsDB:
+    """
+    Answers every query with two single-column rows, the way asyncpg returns them.
+    """
+    async def fetch(self, query, *args):
+        return [(7,), (9,)]
+
+
+def manager(cls):
+    manager = cls.__new__(cls)
+    manager.db = TwoRowsDB()
+    return manager
+
+
+@pytest.mark.parametrize("cls, method, expected", [
+    (AsyncResearchesManager, "get_participants_ids", [7, 9]),
+    (AsyncResearchesManager, "get_candidates_ids", [7, 9]),
+    (AsyncResearchesManager, "get_researches_by_user_identifier", [{'research_id': 7}, {'research_id': 9}]),
+    (AsyncKitsManager, "get_kits_by_user_identifier", [{'kit_id': 7}, {'kit_id': 9}]),
+    (AsyncSamplesManager, "get_samples_by_user_identifier", [{'sample_id': 7}, {'sample_id': 9}]),
+])
+def test_one_item_per_row(cls, method, expected):
+    assert asyncio.run(getattr(manager(cls), method)(1)) == expected
+
+
+def test_user_participated_researches():
+    users = manager(AsyncUsersManager)
+
+    async def has(identifier, log=False):
+        return 1
+    users.has = has
+    assert asyncio.run(users.get_user_participated_researches(1)) == [7, 9]
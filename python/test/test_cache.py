@@ -0,0 +1,78 @@
+from Cache import TTLCache, MISSING
+
+
+def test_get_set():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get("a") is MISSING
+    assert cache.get("a", None) is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("Cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    now[0] += 10
+    assert cache.get("a") == 1
+    assert cache.get("b") is MISSING
+    now[0] += 60
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.invalidate("a")
+    assert cache.get("a") is MISSING
+
+
+def test_version_drops_fills_racing_an_invalidation():
+    cache = TTLCache(maxsize=10, ttl=60)
+    version = cache.version("a")
+    cache.invalidate("a")  # a write lands while "a" is being read from the db
+    cache.set("a", "stale", version=version)
+    assert cache.get("a") is MISSING
+    cache.set("a", "fresh", version=cache.version("a"))
+    assert cache.get("a") == "fresh"
+
+
+def test_version_is_per_key():
+    cache = TTLCache(maxsize=10, ttl=60)
+    version = cache.version("a")
+    cache.invalidate("b")
+    cache.set("a", 1, version=version)
+    assert cache.get("a") == 1
+
+
+def test_clear_drops_all_racing_fills():
+    cache = TTLCache(maxsize=10, ttl=60)
+    version = cache.version("a")
+    cache.clear()
+    cache.set("a", 1, version=version)
+    assert cache.get("a") is MISSING
+
+
+def test_forgotten_versions_still_drop_racing_fills():
+    cache = TTLCache(maxsize=2, ttl=60)
+    version = cache.version("a")
+    cache.invalidate("a")
+    cache.invalidate("b")
+    cache.invalidate("c")  # "a" is no longer among the kept versions
+    cache.set("a", "stale", version=version)
+    assert cache.get("a") is MISSING
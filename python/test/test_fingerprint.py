@@ -0,0 +1,37 @@
+from DBM.QueryStats import fingerprint, statement_id
+
+
+def test_literals_and_placeholders():
+    assert fingerprint("SELECT * FROM kit WHERE id = %s AND name = 'x''y' LIMIT 10") == \
+        "SELECT * FROM kit WHERE id = ? AND name = ? LIMIT ?"
+    assert fingerprint("SELECT $1, $12, %(name)s") == "SELECT ?, ?, ?"
+
+
+def test_whitespace_and_comments():
+    assert fingerprint("SELECT  id\n  FROM kit -- all of them\n /* really */") == "SELECT id FROM kit"
+
+
+def test_identifiers_keep_their_digits():
+    assert fingerprint("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+
+def test_lists_and_rows_collapse():
+    assert fingerprint("SELECT 1 WHERE id IN (1, 2, 3)") == fingerprint("SELECT 1 WHERE id IN (%s)")
+    # `execute_values` pages of any number of rows share one fingerprint
+    assert fingerprint("INSERT INTO qr (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)") == \
+        fingerprint("INSERT INTO qr (a, b) VALUES (1, 'x'), (2, 'y')") == "INSERT INTO qr (a, b) VALUES (...), ..."
+
+
+def test_bytes():
+    assert fingerprint(b"SELECT 1") == "SELECT ?"
+
+
+def test_long_statements():
+    query = "INSERT INTO qr (a) VALUES " + ", ".join(["(%s)"] * 2000)
+    assert fingerprint(query) == "INSERT INTO qr (a) VALUES (...), ..."
+
+
+def test_statement_id():
+    assert statement_id("SELECT ?") == statement_id("SELECT ?")
+    assert statement_id("SELECT ?") != statement_id("SELECT ? FROM kit")
+    assert len(statement_id("SELECT ?")) == 8
@@ -0,0 +1,28 @@
+import pytest
+
+from Geocoding import geohash_encode, geohash_center
+
+
+@pytest.mark.parametrize("latitude, longitude, precision, expected", [
+    (57.64911, 10.40744, 11, "u4pruydqqvj"),
+    (42.6, -5.6, 5, "ezs42"),
+    (0.0, 0.0, 4, "s000"),
+    (-90.0, -180.0, 3, "000"),
+])
+def test_known_hashes(latitude, longitude, precision, expected):
+    assert geohash_encode(latitude, longitude, precision) == expected
+
+
+def test_default_precision():
+    assert geohash_encode(55.75, 37.62) == geohash_encode(55.75, 37.62, 6)
+    assert len(geohash_encode(55.75, 37.62)) == 6
+
+
+def test_prefixes():
+    assert geohash_encode(55.75, 37.62, 9).startswith(geohash_encode(55.75, 37.62, 5))
+
+
+def test_center_round_trip():
+    latitude, longitude = geohash_center(geohash_encode(55.75, 37.62, 8))
+    assert latitude == pytest.approx(55.75, abs=1e-3)
+    assert longitude == pytest.approx(37.62, abs=1e-3)
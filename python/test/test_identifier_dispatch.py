@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from DBM.ADBM import identifier_dispatch
+
+
+class Manager:
+    def has_id(self, id: int, log=False):
+        return ("id", id, log)
+
+    def has_name(self, name: str, log=False):
+        return ("name", name, log)
+
+    has = identifier_dispatch(has_id, has_name)
+
+
+class AsyncManager:
+    async def has_id(self, id: int, log=False):
+        return ("id", id)
+
+    async def has_name(self, name: str, log=False):
+        return ("name", name)
+
+    has = identifier_dispatch(has_id, has_name)
+
+
+class Name(str):
+    pass
+
+
+def test_dispatch_by_type():
+    manager = Manager()
+    assert manager.has(5) == ("id", 5, False)
+    assert manager.has("kit", log=True) == ("name", "kit", True)
+
+
+def test_subclasses():
+    manager = Manager()
+    assert manager.has(True) == ("id", True, False)
+    assert manager.has(Name("kit")) == ("name", "kit", False)
+
+
+@pytest.mark.parametrize("identifier", [None, 1.5, b"kit"])
+def test_other_types(identifier):
+    with pytest.raises(TypeError):
+        Manager().has(identifier)
+
+
+def test_async_methods():
+    manager = AsyncManager()
+    assert asyncio.run(manager.has(5)) == ("id", 5)
+    assert asyncio.run(manager.has("kit")) == ("name", "kit")
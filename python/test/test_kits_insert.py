@@ -0,0 +1,44 @@
+import pytest
+
+from DBM.KitsManager import KitsManager
+
+
+@pytest.fixture
+def kits():
+    # `_rows_to_retry` needs no db, only the hex generator
+    return KitsManager.__new__(KitsManager)
+
+
+def test_rows_to_retry_all_inserted(kits):
+    rows = [("aa", 1), ("bb", 1)]
+    returned = [(10, "aa", 1), (11, "bb", 1)]
+    assert kits._rows_to_retry(rows, returned, 4) == []
+
+
+def test_rows_to_retry_gives_collisions_fresh_hexes(kits):
+    rows = [("aa", 1), ("bb", 2)]
+    retry = kits._rows_to_retry(rows, [(10, "aa", 1)], 4)
+    assert len(retry) == 1
+    fresh_hex, kit_id = retry[0]
+    assert kit_id == 2
+    assert len(fresh_hex) == 8 and fresh_hex != "bb"
+
+
+def test_rows_to_retry_counts_duplicate_rows(kits):
+    # Two identical rows, only one of them made it in
+    rows = [("aa", 1), ("aa", 1)]
+    retry = kits._rows_to_retry(rows, [(10, "aa", 1)], 4)
+    assert [kit_id for _, kit_id in retry] == [1]
+
+
+def test_group_created():
+    kits = [(2, "k2", 2, 7), (1, "k1", 2, 7)]
+    qrs = [(12, "q12", 2), (10, "q10", 1), (11, "q11", 1), (13, "q13", 2)]
+    assert KitsManager._group_created(kits, qrs) == [
+        {'id': 1, 'unique_hex': "k1", 'qrs': [{'id': 10, 'unique_hex': "q10"}, {'id': 11, 'unique_hex': "q11"}]},
+        {'id': 2, 'unique_hex': "k2", 'qrs': [{'id': 12, 'unique_hex': "q12"}, {'id': 13, 'unique_hex': "q13"}]},
+    ]
+
+
+def test_group_created_kits_without_qrs():
+    assert KitsManager._group_created([(1, "k1", 0, 7)], []) == [{'id': 1, 'unique_hex': "k1", 'qrs': []}]
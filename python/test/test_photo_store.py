@@ -0,0 +1,55 @@
+import hashlib
+import os
+
+import pytest
+
+from PhotoStore import LocalPhotoStore, make_photo_store
+
+PHOTO = bytes(range(256)) * 10
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalPhotoStore(str(tmp_path))
+
+
+def test_put_is_content_addressed(store):
+    photo_ref, size = store.put([PHOTO[:1000], PHOTO[1000:]])
+    assert photo_ref == hashlib.sha256(PHOTO).hexdigest()
+    assert size == len(PHOTO)
+    assert store.has(photo_ref)
+    assert store.size(photo_ref) == len(PHOTO)
+
+
+def test_same_photo_is_stored_once(store):
+    first, _ = store.put([PHOTO])
+    second, _ = store.put([PHOTO[:7], PHOTO[7:]])
+    assert first == second
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_read_ranges(store):
+    photo_ref, _ = store.put([PHOTO])
+    assert b"".join(store.read(photo_ref)) == PHOTO
+    assert b"".join(store.read(photo_ref, 10, 19, chunk_size=3)) == PHOTO[10:20]
+    assert b"".join(store.read(photo_ref, 2500)) == PHOTO[2500:]
+
+
+def test_failed_upload_leaves_nothing(store):
+    with pytest.raises(RuntimeError):
+        with store.writer() as writer:
+            writer.write(PHOTO)
+            raise RuntimeError("client went away")
+    assert os.listdir(store.tmp_dir) == []
+    assert not store.has(hashlib.sha256(PHOTO).hexdigest())
+
+
+@pytest.mark.parametrize("photo_ref", ["", "../" * 21 + "a", "A" * 64, "0" * 63])
+def test_invalid_references(store, photo_ref):
+    with pytest.raises(ValueError):
+        store.has(photo_ref)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_photo_store("s3", "photos")
@@ -0,0 +1,34 @@
+import pytest
+
+from utils import parse_range_header
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=90-200", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=99-99", (99, 99)),
+])
+def test_satisfiable(header, expected):
+    assert parse_range_header(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "bytes=", "bytes=-", "bytes=5", "items=0-9", "bytes=0-9,20-29",
+    "bytes=a-9", "bytes=+1-9", "bytes=9-5", "bytes=٣-9",
+])
+def test_ignored(header):
+    assert parse_range_header(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=-0", "bytes=100-", "bytes=150-200"])
+def test_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range_header(header, 100)
+
+
+def test_empty_body():
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=0-", 0)
@@ -0,0 +1,27 @@
+from Cache import TTLCache, MISSING
+from DBM.UsersManager import UsersManager
+
+
+def users():
+    # The caches need no db nor auth_backend
+    users = UsersManager.__new__(UsersManager)
+    users.roles, users.created_at = TTLCache(), TTLCache()
+    users.existing, users.existing_names = TTLCache(), TTLCache()
+    return users
+
+
+def test_invalidate_cached_forgets_the_name():
+    manager = users()
+    manager.remember(5, "alice")
+    manager.remember(6, "bob")
+    manager.roles.set(5, "admin")
+    manager.invalidate_cached(5)
+    assert manager.existing.get("alice") is MISSING
+    assert manager.roles.get(5) is MISSING
+    assert manager.existing.get("bob") == 6
+
+
+def test_invalidate_cached_of_unknown_user():
+    manager = users()
+    manager.invalidate_cached(5)
+    assert len(manager.existing) == 0